@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+"""
+Script: Extracts the read pairs overlapping candidate regions from an indexed BAM/CRAM into paired FASTQ files.
+Regions are fetched with the index across a pool of threads (one file handle per thread), mates outside the regions
+are fetched at their mapped position and matched by name. A pair is extracted when any of its records overlaps a
+region, secondary and supplementary records included (as samtools view -L selected the read names), but only primary
+records are written, so each pair appears once, as samtools fastq would write them.
+"""
+import argparse
+import gzip
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import pysam
+
+COMPLEMENT = str.maketrans("ACGTNacgtn", "TGCANtgcan")
+MATE_WINDOW_GAP = 16384  # a BGZF block holds ~64kb of records, nearby mates are read in one pass
+
+
+def argparser():
+    parser = argparse.ArgumentParser(description="")
+    parser.add_argument("-i", "--input", help="Indexed BAM/CRAM file", required=True)
+    parser.add_argument("--index", help="Index of the input (default: next to the input)")
+    parser.add_argument("-b", "--bed", help="Candidate regions (BED)", required=True)
+    parser.add_argument("-r", "--reference", help="Reference FASTA (CRAM input)")
+    parser.add_argument("-p", "--prefix", help="Output prefix (prefix_1.fastq.gz, prefix_2.fastq.gz)", required=True)
+    parser.add_argument("-t", "--threads", help="Threads fetching regions", type=int, default=1)
+    parser.add_argument("--read_ids", help="Also write the names of the extracted reads to this file")
+    return parser.parse_args()
+
+
+def read_regions(bed_file):
+    regions = []
+    with open(bed_file) as bed:
+        for line in bed:
+            if not line.strip() or line.startswith(("#", "track", "browser")):
+                continue
+            fields = line.split("\t")
+            regions += [(fields[0], int(fields[1]), int(fields[2]))]
+    return regions
+
+
+def fastq_record(read):
+    """
+    Sequence and qualities of a read in sequencing orientation
+    """
+    sequence, qualities = read.query_sequence, read.query_qualities
+    qualities = pysam.qualities_to_qualitystring(qualities) if qualities is not None else "I" * len(sequence)
+    if read.is_reverse:
+        sequence, qualities = sequence.translate(COMPLEMENT)[::-1], qualities[::-1]
+    return sequence, qualities
+
+
+def open_alignment(args):
+    return pysam.AlignmentFile(args.input, index_filename=args.index, reference_filename=args.reference)
+
+
+def primary_positions(read):
+    """
+    Positions (chrom, 0-based start) of the other primary records of the pair of a record: its mate and, for secondary
+    and supplementary records, the alignments of the SA tag (the primary record is one of them)
+    """
+    positions = set()
+    if read.is_paired and read.next_reference_name is not None:
+        positions.add((read.next_reference_name, read.next_reference_start))
+    if (read.is_secondary or read.is_supplementary) and read.has_tag("SA"):
+        for alignment in read.get_tag("SA").rstrip(";").split(";"):
+            chrom, position = alignment.split(",")[:2]
+            positions.add((chrom, int(position) - 1))
+    return positions
+
+
+def fetch_regions(args, regions):
+    """
+    Read pairs with a record overlapping the regions: the primary records found {name: {1 or 2: (sequence,
+    qualities)}} and the positions {name: {(chrom, position)}} of the primary records of each pair
+    """
+    reads = defaultdict(dict)
+    positions = defaultdict(set)
+    with open_alignment(args) as alignment:
+        for chrom, start, end in regions:
+            for read in alignment.fetch(chrom, start, end):
+                records = reads[read.query_name]
+                if not (read.is_secondary or read.is_supplementary) and read.query_sequence is not None:
+                    records[2 if read.is_read2 else 1] = fastq_record(read)
+                positions[read.query_name] |= primary_positions(read)
+    return reads, positions
+
+
+def mate_windows(missing, gap=MATE_WINDOW_GAP):
+    """
+    Groups the mate positions of each chromosome into windows (positions closer than gap share a window) so that
+    nearby mates are read with one fetch: [(chrom, start, end, names)]
+    """
+    windows = []
+    for chrom, position in sorted(missing, key=lambda position: (position[0], position[1])):
+        if windows and windows[-1][0] == chrom and position - windows[-1][2] < gap:
+            windows[-1][2] = position + 1
+            windows[-1][3].update(missing[(chrom, position)])
+        else:
+            windows += [[chrom, position, position + 1, set(missing[(chrom, position)])]]
+    return windows
+
+
+def fetch_mates(args, windows):
+    """
+    Primary records starting in the windows whose name is one of the mates wanted there, and the positions of their
+    mates (the primary record of a pair selected by a secondary record is only known from its mate)
+    """
+    reads = defaultdict(dict)
+    positions = defaultdict(set)
+    with open_alignment(args) as alignment:
+        for chrom, start, end, names in windows:
+            for read in alignment.fetch(chrom, start, end):
+                if read.query_name not in names or read.is_secondary or read.is_supplementary:
+                    continue
+                if start <= read.reference_start < end and read.query_sequence is not None:
+                    reads[read.query_name][2 if read.is_read2 else 1] = fastq_record(read)
+                    positions[read.query_name] |= primary_positions(read)
+    return reads, positions
+
+
+def split(items, parts):
+    return [items[part::parts] for part in range(parts) if items[part::parts]]
+
+
+def collect_reads(args, regions):
+    """
+    Records of the pairs selected by the regions. Primary records not found in the regions are fetched at the
+    positions known for them, again with the positions given by the records found, until no position is left.
+    """
+    reads = defaultdict(dict)
+    positions = defaultdict(set)
+    searched = defaultdict(set)
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        results = pool.map(lambda shard: fetch_regions(args, shard), split(regions, args.threads))
+        while True:
+            for shard_reads, shard_positions in results:
+                for name, records in shard_reads.items():
+                    reads[name].update(records)
+                for name, name_positions in shard_positions.items():
+                    positions[name] |= name_positions
+            # records found by another shard are no longer missing
+            missing = defaultdict(set)
+            for name, name_positions in positions.items():
+                if len(reads[name]) < 2:
+                    for position in name_positions - searched[name]:
+                        missing[position].add(name)
+                    searched[name] |= name_positions
+            if not missing:
+                return reads
+            shards = split(mate_windows(missing), args.threads)
+            results = pool.map(lambda shard: fetch_mates(args, shard), shards)
+
+
+def write_fastq(reads, prefix, read_ids=None):
+    """
+    Writes complete pairs to prefix_1/prefix_2.fastq.gz in the same order, returns the number of pairs and of reads
+    without mate
+    """
+    pairs = unpaired = 0
+    with gzip.open(f"{prefix}_1.fastq.gz", "wt", compresslevel=1) as fastq1, gzip.open(
+        f"{prefix}_2.fastq.gz", "wt", compresslevel=1
+    ) as fastq2:
+        for name in sorted(reads):
+            records = reads[name]
+            if len(records) < 2:
+                unpaired += 1
+                continue
+            for mate, fastq in [(1, fastq1), (2, fastq2)]:
+                sequence, qualities = records[mate]
+                fastq.write(f"@{name}/{mate}\n{sequence}\n+\n{qualities}\n")
+            pairs += 1
+    if read_ids:
+        with open(read_ids, "w") as ids:
+            ids.writelines(f"{name}\n" for name in sorted(reads))
+    return pairs, unpaired
+
+
+def main():
+    args = argparser()
+    regions = read_regions(args.bed)
+    reads = collect_reads(args, regions)
+    pairs, unpaired = write_fastq(reads, args.prefix, args.read_ids)
+    if unpaired:
+        print(f"[WGN] {unpaired} reads without mate in the alignment were not written")
+    print(f"- {pairs} read pairs extracted from {len(regions)} regions")
+
+
+if __name__ == "__main__":
+    main()
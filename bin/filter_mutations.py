@@ -4,49 +4,95 @@ Author: @RaqManzano
 Script: Filter variants from a MAF file producing another MAF file with the new filters added.
 """
 import argparse
+import contextlib
+import hashlib
+import multiprocessing
+import os
+import tempfile
+import numpy as np
 import pandas as pd
-import subprocess
-import pysam
+import maf_io
+import stage_metrics
+import startup_profile
+import whitelist_index
+
+VC_PRIORITY = ["mutect2", "sage", "strelka"]
+# annotations that do not depend on the thresholds, cached with --cache_dir (bump the version when they change)
+CACHE_VERSION = 2
+CACHED_COLUMNS = ["blacklist", "blk_reason", "CONTEXT", "homopolymer"]
+FASTA_HANDLES = {}
+METRICS = stage_metrics.Metrics()
+# read-only state of --manifest runs, set before the workers are forked so they inherit it
+BATCH = {}
 
 
 def argparser():
     parser = argparse.ArgumentParser(description="")
     parser.add_argument(
-        "-i", "--input", help="MAF(s) file input (if more than 1 consensus will be annotated)", nargs="+", required=True
+        "-i", "--input", help="MAF(s) file input (if more than 1 consensus will be annotated)", nargs="+"
+    )
+    parser.add_argument("-o", "--output", help="MAF file output (bgzipped if it ends with .gz)", default="RaVeX.maf")
+    parser.add_argument(
+        "-g",
+        "--gnomad_thr",
+        help="Gnomad threshold for variants (must be annotated in MAF)",
+        default=0.0001,
+        type=float,
     )
-    parser.add_argument("-o", "--output", help="MAF file output", default="RaVeX.maf")
     parser.add_argument(
-        "-g", "--gnomad_thr", help="Gnomad threshold for variants (must be annotated in MAF)", default=0.0001
+        "--whitelist",
+        help="BED file(s) with variants to keep (CHROM POS REF ALT) or index(es) built with whitelist_index.py",
+        nargs="+",
     )
-    parser.add_argument("--whitelist", help="BED file with variants to keep (CHROM POS REF ALT)")
     parser.add_argument("--blacklist", help="BED file with regions to remove (CHROM START END)")
     parser.add_argument("--filters", help="Other filters to be considered as PASS", default=["PASS"], nargs="+")
-    parser.add_argument("--ref", help="FASTA reference file to extract context")
-    return parser.parse_args()
-
-
-def read_whitelist_bed(bed_file):
-    """
-    Columns should be chrom, start, end, ref and alt to read BED file with variants for whitelisting
-    """
-    if not bed_file:
-        variants = []
-    else:
-        bed = pd.read_csv(bed_file, sep="\t", comment="#", header=None)
-        if len(bed.columns) == 5:
-            colnames = ["#CHROM", "POS", "END", "REF", "ALT"]
-        else:
-            colnames = ["#CHROM", "POS", "REF", "ALT"]
-        bed.columns = colnames
-        try:
-            bed["DNAchange"] = bed["#CHROM"].map(str) + ":g." + bed["POS"].map(str) + bed["REF"] + ">" + bed["ALT"]
-        except TypeError:
-            print(
-                "[ERROR] BED file for whitelist should contain CHROM, START, END, REF and ALT columns with no headers."
-            )
-            print(f"Please check your file: {bed_file}")
-        variants = bed["DNAchange"].tolist()
-    return variants
+    parser.add_argument("--ref", help="FASTA reference file to extract context (no homopolymer tagging without it)")
+    parser.add_argument(
+        "--hp_length", help="Number of consecutive identical bases considered a homopolymer", default=6, type=int
+    )
+    parser.add_argument(
+        "--chunksize", help="Stream the MAF(s) in chunks of this number of rows to reduce memory usage", type=int
+    )
+    parser.add_argument(
+        "--sidecar", help="Read/write a Parquet copy next to each input MAF to skip parsing", action="store_true"
+    )
+    parser.add_argument("--tabix", help="Sort and tabix index the output (requires .gz output)", action="store_true")
+    parser.add_argument(
+        "--vc_priority",
+        help="Callers in order of priority to keep one entry per variant (variants from other callers are removed)",
+        nargs="+",
+        default=VC_PRIORITY,
+    )
+    parser.add_argument(
+        "--manifest",
+        help="TSV with input and output columns (input MAFs separated by comma) to filter many MAFs in one run "
+        "(reference, blacklist and whitelist are loaded once)",
+    )
+    parser.add_argument(
+        "--workers", help="Number of MAFs filtered at the same time with --manifest", type=int, default=1
+    )
+    parser.add_argument(
+        "--profile-startup", help="Report import and initialisation times and exit", action="store_true"
+    )
+    parser.add_argument(
+        "--cache_dir",
+        help="Directory of the annotation cache: blacklist, CONTEXT and homopolymer annotations are stored by MAF, "
+        "reference and blacklist and reused when only the thresholds change (not used with --chunksize)",
+    )
+    parser.add_argument(
+        "--cache_out",
+        help="Directory where annotations missing from the cache are stored (by default --cache_dir), e.g. when the "
+        "cache directory is read-only",
+    )
+    parser.add_argument(
+        "--metrics-json",
+        help="Write the wall time, CPU time, peak RSS increase and rows of each stage to this file (MultiQC custom "
+        "content, name it *_mqc.json)",
+    )
+    args = parser.parse_args()
+    if not args.input and not args.manifest and not args.profile_startup:
+        parser.error("one of -i/--input or --manifest is required")
+    return args
 
 
 def read_blacklist_bed(bed_file):
@@ -58,21 +104,13 @@ def read_blacklist_bed(bed_file):
     assert (
         len(bed.columns) >= 3
     ), "[ERROR] BED file for blacklist should at least contain CHROM, START, END columns with no headers."
-    bed.rename(columns={"0": "#CHROM", "1": "POS", "2": "END"}, inplace=True)
     return bed
 
 
-def read_maf(maf_file):
-    if type(maf_file) == type([]):
-        maf_list = []
-        for m in maf_file:
-            maf_list += [pd.read_csv(m, sep="\t", comment="#")]
-        maf = pd.concat(maf_list)
-    else:
-        maf = pd.read_csv(maf_file, sep="\t", comment="#")
+def add_dnachange(maf):
     if "DNAchange" not in maf.columns:
         maf["DNAchange"] = (
-            maf["Chromosome"].map(str)
+            maf["Chromosome"].astype(str)
             + ":g."
             + maf["Start_Position"].map(str)
             + maf["Reference_Allele"]
@@ -82,6 +120,40 @@ def read_maf(maf_file):
     return maf
 
 
+def read_maf(maf_file, sidecar=False):
+    if type(maf_file) == type([]):
+        maf_list = []
+        for m in maf_file:
+            maf_list += [maf_io.read_maf(m, sidecar=sidecar)]
+        maf = pd.concat(maf_list)
+    else:
+        maf = maf_io.read_maf(maf_file, sidecar=sidecar)
+    return add_dnachange(maf)
+
+
+def read_maf_chunks(maf_file, chunksize, columns, sidecar=False):
+    """
+    Same as read_maf but yields the MAF(s) in chunks of chunksize rows instead of loading them in memory. Chunks
+    have all the columns of the MAF(s) (see read_columns) as if they had been concatenated.
+    """
+    if type(maf_file) != type([]):
+        maf_file = [maf_file]
+    for maf in maf_io.read_maf_chunks(maf_file, sidecar=sidecar, chunksize=chunksize):
+        if list(maf.columns) != columns:
+            maf = maf.reindex(columns=columns)
+        yield add_dnachange(maf)
+
+
+def read_columns(maf_files):
+    """
+    Columns of the MAF(s) in order of appearance, as in the concatenation done by read_maf
+    """
+    columns = []
+    for maf_file in maf_files:
+        columns += [column for column in maf_io.read_columns(maf_file) if column not in columns]
+    return columns
+
+
 def noncoding(maf, noncoding):
     """
     Classifies as noncoding TRUE if first consequence is in noncoding list
@@ -142,162 +214,548 @@ def filter_homopolymer(ref_context, alt, hp_length=6):
     return homopolymer
 
 
-def add_context(chrom, pos, ref, genome, flank=10):
-    if pos < 10:
-        flank = pos - 1
-    try:
-        context = genome.fetch(chrom, pos - 1 - flank, pos + flank).upper()
-    except ValueError:
-        print(f"[WGN] This variant has NaN in their coordinates (did liftover failed?)")
-        return None
-    except KeyError:
-        print(
-            f"[WGN] These coordinates {chrom}:{pos} are not present in the genome (are you using a different version?)"
-        )
-        return None
-    if ref != "-":  # if it is a deletion we cannot check
-        try:
-            assert ref[0] == context[flank]  # check that the REF matches the context we just extracted
-        except AssertionError:
-            print(
-                f"[WGN] This ref base ({chrom}:{int(pos)} {ref[0]} != {context[flank]}) does not correspond to its context {context[flank]}."
-            )
-    return context
+def find_homopolymers(contexts, alts, hp_length=6):
+    """
+    Same as filter_homopolymer for all the variants at once. Contexts of the same length are stacked in a uint8 matrix,
+    the ALT (inserted bases for insertions) is substituted and runs of hp_length identical bases are searched in all
+    the SNVs and insertions together. Missing contexts and contexts too short for the window (edge of the contig)
+    are checked one by one with filter_homopolymer.
+    """
+    contexts = np.asarray(contexts, dtype=object)
+    alts = np.asarray(alts, dtype=object)
+    homopolymer = np.full(len(contexts), None, dtype=object)
+    deletion = alts == "-"
+    homopolymer[deletion] = False  # if deletion no homopolymer
+    pending = ~deletion
+    lengths = np.array([len(context) if isinstance(context, str) else -1 for context in contexts], dtype=np.int64)
+    for length in np.unique(lengths[pending]).tolist():
+        center = int((length - 1) / 2)
+        if length < 0 or center - hp_length + 1 < 0 or center + hp_length >= length:
+            continue
+        rows = np.flatnonzero(pending & (lengths == length))
+        pending[rows] = False
+        context = np.array(contexts[rows].tolist(), dtype=f"S{length}").view(np.uint8).reshape(-1, length)
+        subs = [alt[1:] if len(alt) > 1 else alt for alt in alts[rows]]  # if insertion the check will be done
+        sub = np.array(subs, dtype=f"S{hp_length}").view(np.uint8).reshape(-1, hp_length)
+        sub_length = np.minimum([len(alt) for alt in subs], hp_length)[:, np.newaxis]
+        # window around the variant once the REF base is replaced: flank before + ALT + flank after
+        offset = np.arange(hp_length)
+        after = np.clip(center + 1 + offset - sub_length, 0, length - 1)
+        tail = np.where(offset < sub_length, sub, np.take_along_axis(context, after, axis=1))
+        window = np.hstack([context[:, center - hp_length + 1 : center], tail])
+        same = window[:, 1:] == window[:, :-1]
+        found = np.zeros(len(rows), dtype=bool)
+        for start in range(hp_length):
+            found |= same[:, start : start + hp_length - 1].all(axis=1)
+        homopolymer[rows] = found.tolist()
+    for row in np.flatnonzero(pending).tolist():
+        homopolymer[row] = filter_homopolymer(contexts[row], alts[row], hp_length=hp_length)
+    return homopolymer
 
 
-def remove_homopolymers(maf, ref):
+def add_context(maf, genome, flank=10):
     """
-    Check for variants in homopolymer regions (a sequence of 6 consecutive identical bases)
+    Extracts the reference context (flank:REF:flank) of every variant. Variants are grouped by chromosome so each contig
+    is read only once (one contig in memory at a time) and the flanks are sliced from it with NumPy indexing.
+    Context is shorter for variants close to the contig start/end and None when it cannot be extracted.
+    """
+    contexts = np.full(maf.shape[0], None, dtype=object)
+    warnings = {}  # printed in the same order as the variants
+    chroms = maf["Chromosome"].map(str).to_numpy()
+    refs = maf["Reference_Allele"].to_numpy()
+    raw_positions = maf["Start_Position"].to_numpy()
+    positions = raw_positions.astype(np.float64)
+    # coordinates that cannot be fetched: NaN, or start of the window before the contig start
+    invalid = np.isnan(positions)
+    pos = np.where(invalid, 0, positions).astype(np.int64)
+    flanks = np.where(pos < 10, pos - 1, flank)
+    starts = pos - 1 - flanks
+    invalid |= (starts < 0) | (starts > pos + flanks)
+    for row in np.flatnonzero(invalid).tolist():
+        warnings[row] = "[WGN] This variant has NaN in their coordinates (did liftover failed?)"
+    for chrom in pd.unique(chroms[~invalid]):
+        rows = np.flatnonzero((chroms == chrom) & ~invalid)
+        if chrom not in genome.references:
+            for row in rows.tolist():
+                warnings[row] = (
+                    f"[WGN] These coordinates {chrom}:{raw_positions[row]} are not present in the genome "
+                    f"(are you using a different version?)"
+                )
+            continue
+        sequence = np.frombuffer(genome.fetch(chrom).upper().encode(), dtype=np.uint8)
+        # variants with the whole window inside the contig are sliced at once
+        full = (flanks[rows] == flank) & (pos[rows] + flank <= len(sequence))
+        window = starts[rows[full], np.newaxis] + np.arange(2 * flank + 1)
+        contexts[rows[full]] = sequence[window].view(f"S{2 * flank + 1}").ravel().astype(str).astype(object)
+        for row in rows[~full].tolist():
+            contexts[row] = sequence[starts[row] : pos[row] + flanks[row]].tobytes().decode()
+        # check that the REF matches the context we just extracted (if it is a deletion we cannot check)
+        for row in rows.tolist():
+            ref, context = refs[row], contexts[row]
+            if ref == "-":
+                continue
+            if len(context) <= flanks[row]:
+                warnings[row] = (
+                    f"[WGN] These coordinates {chrom}:{raw_positions[row]} are not present in the genome "
+                    f"(are you using a different version?)"
+                )
+                contexts[row] = None
+            elif ref[0] != context[flanks[row]]:
+                warnings[row] = (
+                    f"[WGN] This ref base ({chrom}:{pos[row]} {ref[0]} != {context[flanks[row]]}) "
+                    f"does not correspond to its context {context[flanks[row]]}."
+                )
+    for row in sorted(warnings):
+        print(warnings[row])
+    return contexts
+
+
+def open_fasta(ref):
+    """
+    Reference FASTA opened once per process (handles are not shared with forked workers)
+    """
+    key = (ref, os.getpid())
+    if key not in FASTA_HANDLES:
+        import pysam
+
+        FASTA_HANDLES[key] = pysam.FastaFile(ref)
+    return FASTA_HANDLES[key]
+
+
+def remove_homopolymers(maf, ref, hp_length=6):
+    """
+    Check for variants in homopolymer regions (a sequence of hp_length consecutive identical bases)
     """
     # read genome to get context
-    genome = pysam.FastaFile(ref)
+    genome = open_fasta(ref)
     # Add context
-    maf["CONTEXT"] = maf.apply(
-        lambda row: add_context(str(row["Chromosome"]), row["Start_Position"], row["Reference_Allele"], genome), axis=1
-    )
+    maf["CONTEXT"] = add_context(maf, genome)
     # add homopolymer True/False
-    maf["homopolymer"] = maf.apply(lambda row: filter_homopolymer(row["CONTEXT"], row["Tumor_Seq_Allele2"]), axis=1)
+    homopolymer = find_homopolymers(maf["CONTEXT"], maf["Tumor_Seq_Allele2"], hp_length=hp_length)
+    maf["homopolymer"] = pd.Series(homopolymer.tolist(), index=maf.index)
     return maf
 
 
+def index_blacklist(bed):
+    """
+    Builds a per chromosome index of the blacklist regions (inclusive coordinates). Overlapping regions are split in
+    disjoint segments, each one keeping the reasons (optional 4th column) of all the regions covering it, in order of
+    first appearance in the BED.
+    Returns {chrom: (segment starts, segment is blacklisted, segment reason)} with segment starts sorted.
+    """
+    index = {}
+    has_reason = bed.shape[1] > 3
+    for chrom, regions in bed.groupby(bed[0].map(str), sort=False):
+        starts = regions[1].to_numpy(dtype=np.int64)
+        ends = regions[2].to_numpy(dtype=np.int64) + 1  # first position after the region
+        bounds = np.unique(np.concatenate([starts, ends]))
+        # number of regions covering each segment
+        depth = np.zeros(len(bounds) + 1, dtype=np.int64)
+        np.add.at(depth, np.searchsorted(bounds, starts), 1)
+        np.add.at(depth, np.searchsorted(bounds, ends), -1)
+        covered = np.cumsum(depth)[:-1] > 0
+        reasons = np.full(len(bounds), "", dtype=object)
+        if has_reason:
+            # regions with the same reason are merged first, so each segment gets each of its reasons once
+            reason_codes, reason_names = pd.factorize(regions[3].fillna("").map(str).to_numpy())
+            merged = pd.DataFrame({"reason": reason_codes, "start": starts, "end": ends})
+            merged = merged[reason_names[merged["reason"]] != ""].sort_values(["reason", "start"])
+            reach = merged.groupby("reason")["end"].cummax()
+            previous_reach = reach.groupby(merged["reason"]).shift().to_numpy()
+            new_run = ~(merged["start"].to_numpy() <= previous_reach)  # NaN (first of its reason) starts a run
+            run = np.cumsum(new_run)
+            first = np.searchsorted(bounds, merged["start"].to_numpy()[new_run])
+            last = np.searchsorted(bounds, pd.Series(reach.to_numpy()).groupby(run).max().to_numpy())
+            code = merged["reason"].to_numpy()[new_run]
+            # one entry per segment and reason covering it
+            lengths = last - first
+            offset = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+            segment = np.repeat(first, lengths) + offset
+            code = np.repeat(code, lengths)
+            order = np.lexsort([code, segment])
+            segment, code = segment[order], code[order]
+            first = np.flatnonzero(np.diff(segment, prepend=-1))
+            if len(segment) and len(reason_names) < 63:
+                # reasons of each segment as a bit mask so each combination of reasons is only joined once
+                masks = np.bitwise_or.reduceat(np.left_shift(1, code), first)
+                combinations, combination = np.unique(masks, return_inverse=True)
+                names = list(reason_names)
+                labels = [",".join(name for bit, name in enumerate(names) if mask >> bit & 1) for mask in combinations]
+                reasons[segment[first]] = np.array(labels, dtype=object)[combination]
+            elif len(segment):
+                reasons[segment[first]] = [",".join(shared) for shared in np.split(reason_names[code], first[1:])]
+        index[chrom] = (bounds, covered, reasons)
+    return index
+
+
 def remove_muts_in_range(df, blacklist):
     """
     If overlap with a blacklist region will return a dataframe with the information
     """
     df["blacklist"] = False
     df["blk_reason"] = ""
-    reason = ""
-    for idx, row in blacklist.iterrows():
-        chrom = row[0]
-        start = row[1]
-        end = row[2]
-        if len(row) >= 3:  # optional
-            reason = row[3]
-        df_bkl = df[df["Chromosome"] == chrom][df["Start_Position"].between(start, end, inclusive=True)].index
-        df.loc[df_bkl, "blacklist"] = True
-        df.loc[df_bkl, "blk_reason"] = reason
+    inblacklist = np.zeros(df.shape[0], dtype=bool)
+    reasons = np.full(df.shape[0], "", dtype=object)
+    chroms = df["Chromosome"].map(str).to_numpy()
+    positions = df["Start_Position"].to_numpy(dtype=np.float64)
+    for chrom in pd.unique(chroms):
+        if chrom not in blacklist:
+            continue
+        bounds, covered, segment_reasons = blacklist[chrom]
+        rows = np.flatnonzero((chroms == chrom) & ~np.isnan(positions))
+        segment = np.searchsorted(bounds, positions[rows], side="right") - 1
+        hit = segment >= 0
+        hit[hit] = covered[segment[hit]]
+        inblacklist[rows[hit]] = True
+        reasons[rows[hit]] = segment_reasons[segment[hit]]
+    df["blacklist"] = inblacklist
+    df["blk_reason"] = reasons
     return df
 
 
-def filtering(maf, gnomad_thr, whitelist, blacklist, filters):
+def filtering(maf, gnomad_thr, whitelist, blacklist, filters, cached=None):
     """
     Adds filters for gnomad, blacklisting, variant calling filters. Adds muts to whitelist if match.
     """
     if "PASS" not in filters:
         filters += ["PASS"]  # a PASS is always allowed
     if whitelist:
-        maf["whitelist"] = maf["DNAchange"].isin(whitelist)  # whitelist
-    if not blacklist.empty:
+        maf["whitelist"] = whitelist_index.is_whitelisted(maf, whitelist)  # whitelist
+    if blacklist and cached is not None:
+        maf = use_cached(maf, cached, ["blacklist", "blk_reason"])
+    elif blacklist:
         maf = remove_muts_in_range(df=maf, blacklist=blacklist)  # blacklist
     maf["ingnomAD"] = maf["MAX_AF"] >= gnomad_thr  # gnomad
 
     return maf
 
 
+def file_digest(path):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as handle:
+        for block in iter(lambda: handle.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def reference_digest(ref, cache_dir=None, cache_out=None):
+    """
+    Digest of the reference sequence. Hashing gigabytes of sequence takes a while, so it is done once per reference
+    file (by path, size and modification time) and the digest is stored in the cache as <key>.reference.digest
+    """
+    stat = os.stat(ref)
+    key = hashlib.blake2b(f"{os.path.realpath(ref)}\t{stat.st_size}\t{stat.st_mtime_ns}".encode(), digest_size=16)
+    digest_name = f"{key.hexdigest()}.reference.digest"
+    for directory in [cache_dir, cache_out]:
+        if directory and os.path.exists(os.path.join(directory, digest_name)):
+            with open(os.path.join(directory, digest_name)) as digest:
+                return digest.read().strip()
+    digest = file_digest(ref)
+    if cache_out:
+        os.makedirs(cache_out, exist_ok=True)
+        with open(os.path.join(cache_out, digest_name) + ".tmp", "w") as out:
+            out.write(f"{digest}\n")
+        os.replace(os.path.join(cache_out, digest_name) + ".tmp", os.path.join(cache_out, digest_name))
+    return digest
+
+
+def cache_resources(ref, blacklist_file, hp_length, cache_dir=None, cache_out=None):
+    """
+    What the cached annotations depend on besides the MAF: the blacklist content, the reference (contig names and
+    lengths and the digest of the sequence, see reference_digest) and the homopolymer length
+    """
+    resources = [f"version={CACHE_VERSION}", f"hp_length={hp_length}"]
+    resources += [f"blacklist={file_digest(blacklist_file) if blacklist_file else None}"]
+    if ref:
+        genome = open_fasta(ref)
+        resources += [f"ref={reference_digest(ref, cache_dir, cache_out)}"]
+        resources += [f"{name}:{length}" for name, length in zip(genome.references, genome.lengths)]
+    return resources
+
+
+def cache_file(maf_files, resources):
+    """
+    Content addressed file name of the annotations of some MAF(s) given the resources
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update("\n".join(resources + [file_digest(maf_file) for maf_file in maf_files]).encode())
+    return f"{digest.hexdigest()}.annotations.parquet"
+
+
+def read_cache(annotations_file, maf):
+    """
+    Cached annotations or None if they are not in the cache (or cannot be read or are not of the same variants)
+    """
+    if not os.path.exists(annotations_file):
+        return None
+    try:
+        cached = pd.read_parquet(annotations_file)
+    except ImportError:
+        print("[WGN] pyarrow is not installed, the annotation cache will be ignored")
+        return None
+    same_variants = len(cached) == len(maf) and "DNAchange" in cached.columns
+    if same_variants:
+        cached_dnachange = pd.Series(cached["DNAchange"].to_numpy(dtype=object))
+        same_variants = cached_dnachange.equals(pd.Series(maf["DNAchange"].to_numpy(dtype=object)))
+    if not same_variants:
+        print(f"[WGN] Annotation cache {annotations_file} does not match the MAF, annotating again")
+        return None
+    print(f"Using cached annotations: {annotations_file}")
+    return cached
+
+
+def write_cache(maf, annotations_file):
+    """
+    Stores the annotations of CACHED_COLUMNS with the DNAchange of each row (checked by read_cache). Optional as the
+    sidecar: nothing is written without pyarrow.
+    """
+    columns = ["DNAchange"] + [column for column in CACHED_COLUMNS if column in maf.columns]
+    os.makedirs(os.path.dirname(annotations_file) or ".", exist_ok=True)
+    try:
+        maf[columns].reset_index(drop=True).to_parquet(annotations_file + ".tmp", index=False)
+    except ImportError:
+        print("[WGN] pyarrow is not installed, annotations will not be cached")
+        return
+    os.replace(annotations_file + ".tmp", annotations_file)
+
+
+def use_cached(maf, cached, columns):
+    for column in columns:
+        maf[column] = cached[column].to_numpy()
+    return maf
+
+
+def as_bool(values):
+    """
+    Truth value of each element as the per-row `if value:` would evaluate it (e.g. None is False, NaN and "NA" are True)
+    """
+    return np.asarray(values, dtype=object).astype(bool)
+
+
+def assemble_filters(masks):
+    """
+    Joins the names of the filters that apply to each row (in insertion order) with ';', PASS if none applies.
+    Every row is encoded as a bit code so each combination of filters is only joined once.
+    """
+    names = list(masks.keys())
+    codes = np.zeros(len(masks[names[0]]), dtype=np.int64)
+    for bit, name in enumerate(names):
+        codes |= np.asarray(masks[name], dtype=np.int64) << bit
+    labels = [";".join([name for bit, name in enumerate(names) if code >> bit & 1]) for code in range(1 << len(names))]
+    labels = np.array([label or "PASS" for label in labels], dtype=object)
+    return labels[codes]
+
+
 def add_ravex_filters(
-    maf, filters, noncoding=False, homopolymer=False, ig_pseudo=False, min_alt_reads=2, blacklist=False, whitelist=False
+    maf,
+    filters,
+    noncoding=False,
+    homopolymer=False,
+    ig_pseudo=False,
+    min_alt_reads=2,
+    blacklist=False,
+    whitelist=False,
+    ignore_consensus=None,
 ):
+    """
+    Adds RaVeX_FILTER. The consensus is ignored if there is no isconsensus column, unless ignore_consensus says
+    otherwise (given once for all the chunks of a MAF).
+    """
     maf["RaVeX_FILTER"] = "PASS"
     maf["Existing_variation"] = maf["Existing_variation"].fillna("")
     maf["SOMATIC"] = maf["SOMATIC"].fillna("")
     if "FILTER" not in maf.columns:
         maf["FILTER"] = "PASS"  # Consider pass when no FILTER column
     maf["FILTER"] = maf["FILTER"].replace(".", "PASS")  # no filter ('.') will be treated as PASS
-    ignore_consensus = False
+    if ignore_consensus is None:
+        ignore_consensus = "isconsensus" not in maf.columns
     if "isconsensus" not in maf.columns:
         maf["isconsensus"] = True  # By default true when not known
-        ignore_consensus = True
-    for idx, row in maf.iterrows():
-        ravex_filter = []
-        if row["t_alt_count"] <= min_alt_reads:
-            ravex_filter += ["min_alt_reads"]
-        if not blacklist.empty:
-            if row["blacklist"]:
-                ravex_filter += ["blacklist"]
-        if not noncoding:
-            if row["noncoding"]:
-                ravex_filter += ["noncoding"]
-        if not homopolymer:
-            if row["homopolymer"]:
-                ravex_filter += ["homopolymer"]
-        if not ig_pseudo:
-            if row["ig_pseudo"]:
-                ravex_filter += ["ig_pseudo"]
-        if not row["isconsensus"]:  # of there is consensus we take the FILTER from the consensus
-            if not row["FILTER"] in filters:
-                ravex_filter += ["vc_filter"]
-            if not ignore_consensus:
-                ravex_filter += ["not_consensus"]
-        elif not ignore_consensus:
-            if not row["FILTER_consensus"] in filters:
-                ravex_filter += ["vc_filter"]
-        else:
-            if not row["FILTER"] in filters:
-                ravex_filter += ["vc_filter"]
-        if whitelist:
-            if not ravex_filter or row["whitelist"]:
-                ravex_filter = ["PASS"]
-        else:
-            if not ravex_filter:
-                ravex_filter = ["PASS"]
-        ravex_filter = ";".join(ravex_filter)
-        maf.at[idx, "RaVeX_FILTER"] = ravex_filter
+    no_filter = np.zeros(maf.shape[0], dtype=bool)
+    # each filter is a boolean mask over the whole table, order matters as it is the order in RaVeX_FILTER
+    masks = {"min_alt_reads": (maf["t_alt_count"] <= min_alt_reads).to_numpy()}
+    masks["blacklist"] = as_bool(maf["blacklist"]) if blacklist else no_filter
+    masks["noncoding"] = as_bool(maf["noncoding"]) if not noncoding else no_filter
+    masks["homopolymer"] = as_bool(maf["homopolymer"]) if not homopolymer else no_filter
+    masks["ig_pseudo"] = as_bool(maf["ig_pseudo"]) if not ig_pseudo else no_filter
+    vc_filter = ~maf["FILTER"].isin(filters).to_numpy()
+    if ignore_consensus:
+        masks["vc_filter"] = vc_filter
+        masks["not_consensus"] = no_filter
+    else:
+        # if there is consensus we take the FILTER from the consensus
+        isconsensus = as_bool(maf["isconsensus"])
+        masks["vc_filter"] = np.where(isconsensus, ~maf["FILTER_consensus"].isin(filters).to_numpy(), vc_filter)
+        masks["not_consensus"] = ~isconsensus
+    ravex_filter = assemble_filters(masks)
+    if whitelist:
+        ravex_filter[as_bool(maf["whitelist"])] = "PASS"
+    maf["RaVeX_FILTER"] = ravex_filter
     return maf
 
 
-def deduplicate_maf(variants, vc_priority):
-    deduped = []
-    for caller in vc_priority:
-        deduped.append(variants[variants["Caller"] == caller])
-    return pd.concat(deduped).drop_duplicates(subset="DNAchange", keep="first")
+def multiallelic_callers(maf_df):
+    """
+    Caller of each variant with <caller>_multiallelic for the multiallelic ones, and the multiallelic callers in order
+    of appearance
+    """
+    is_multiallelic = maf_df["FILTER"].str.contains("multiallelic", case=False, na=False).to_numpy()
+    callers = np.where(is_multiallelic, maf_df["Caller"] + "_multiallelic", maf_df["Caller"])
+    return callers, list(pd.unique(callers[is_multiallelic]))
+
+
+def first_calls(dnachanges, callers, vc_priority):
+    """
+    Rows kept for each DNAchange: rows are stably sorted by the rank of their caller in vc_priority (rows from callers
+    not in vc_priority are removed) and the first row of each DNAchange is kept. Returns their indices in that order.
+    """
+    rank = pd.Index(vc_priority).get_indexer(callers)
+    ranked = np.flatnonzero(rank >= 0)
+    order = ranked[np.argsort(rank[ranked], kind="stable")]
+    return order[~pd.Series(np.asarray(dnachanges)[order]).duplicated().to_numpy()]
 
 
-def write_maf(maf_df, mafin_file, mafout_file, vc_priority=["mutect2", "sage", "strelka"]):
-    """Write output"""
-    header_lines = subprocess.getoutput(f"zgrep -Eh '#|Hugo_Symbol' {mafin_file} 2>/dev/null")
-    if "Caller" in maf_df.columns:
-        print("Removing duplicated variants from maf (only one entry from a caller will be kept)")
-        # Separate the multiallelic variants
-        multiallelic_variants = maf_df[maf_df["FILTER"].str.contains("multiallelic", case=False, na=False)]
-        other_variants = maf_df[~maf_df["FILTER"].str.contains("multiallelic", case=False, na=False)]
+def deduplicate_maf(maf_df, callers, vc_priority):
+    """
+    Keeps one row per DNAchange, see first_calls
+    """
+    order = first_calls(maf_df["DNAchange"].to_numpy(), callers, vc_priority)
+    deduped = maf_df.take(order)
+    deduped["Caller"] = callers[order]
+    return deduped
 
-        # Combine variants with Caller for multiallelic changed
-        multiallelic_variants["Caller"] = multiallelic_variants["Caller"] + "_multiallelic"
-        maf_to_dedup = pd.concat([other_variants, multiallelic_variants])
 
-        # Deduplicate variants
-        maf_to_write = deduplicate_maf(maf_to_dedup, vc_priority + list(multiallelic_variants["Caller"].unique()))
+def write_maf(maf_df, preamble, mafout_file, vc_priority=VC_PRIORITY, tabix=False):
+    """Write output, returns the number of rows written"""
+    if "Caller" in maf_df.columns:
+        print("Removing duplicated variants from maf (only one entry from a caller will be kept)")
+        # multiallelic variants rank after the variants of all the callers
+        callers, multiallelic = multiallelic_callers(maf_df)
+        maf_to_write = deduplicate_maf(maf_df, callers, vc_priority + multiallelic)
     else:
         maf_to_write = maf_df
+    if tabix:
+        maf_to_write = maf_to_write.sort_values(["Chromosome", "Start_Position"], kind="stable")
 
     # Write the header and deduplicated MAF to the output file
-    with open(mafout_file, "w") as mafout:
-        mafout.write(header_lines)
-    maf_to_write.to_csv(mafout_file, mode="a", index=False, header=True, sep="\t")
+    with maf_io.open_maf_output(mafout_file, preamble) as mafout:
+        maf_to_write.to_csv(mafout, mode="wb", index=False, header=True, sep="\t")
+    if tabix:
+        maf_io.index_maf(mafout_file, maf_to_write.columns, preamble)
     print(f"Done! See '{mafout_file}'.")
+    return len(maf_to_write)
 
 
-def main():
+def spill_chunk(maf_df, callers, spill_dir, spilled):
+    """
+    Appends the rows of a chunk to a temporary file per caller and the caller, row number (in the file of the caller)
+    and DNAchange of each row to a key file per chromosome. spilled has the files and number of rows of each.
+    """
+    maf_df = maf_df.assign(Caller=callers)
+    keys = []
+    for caller, variants in maf_df.groupby("Caller", sort=False):
+        if caller not in spilled["callers"]:
+            spilled["callers"][caller] = os.path.join(spill_dir, f"caller{len(spilled['callers'])}.tsv")
+            spilled["rows"][caller] = 0
+            variants.to_csv(spilled["callers"][caller], index=False, header=True, sep="\t")
+        else:
+            variants.to_csv(spilled["callers"][caller], mode="a", index=False, header=False, sep="\t")
+        row = np.arange(spilled["rows"][caller], spilled["rows"][caller] + len(variants))
+        keys += [pd.DataFrame({"Caller": caller, "row": row, "DNAchange": variants["DNAchange"].to_numpy()})]
+        keys[-1]["chromosome"] = variants["Chromosome"].astype(str).to_numpy()
+        spilled["rows"][caller] += len(variants)
+    if not keys:
+        return
+    keys = pd.concat(keys)
+    # all the variants with no DNAchange are duplicates of each other, whatever their chromosome
+    keys.loc[keys["DNAchange"].isna(), "chromosome"] = ""
+    for chromosome, chromosome_keys in keys.groupby("chromosome", sort=False):
+        if chromosome not in spilled["keys"]:
+            spilled["keys"][chromosome] = os.path.join(spill_dir, f"keys{len(spilled['keys'])}.tsv")
+            header = True
+        else:
+            header = False
+        chromosome_keys[["Caller", "row", "DNAchange"]].to_csv(
+            spilled["keys"][chromosome], mode="a", index=False, header=header, sep="\t"
+        )
+
+
+def keep_first_calls(spilled, spill_dir, vc_priority):
+    """
+    Flags (one file per caller) of the spilled rows kept by first_calls, deduplicating one chromosome at a time so only
+    the keys of one chromosome are in memory
+    """
+    kept = {}
+    for caller, rows in spilled["rows"].items():
+        kept[caller] = np.lib.format.open_memmap(
+            os.path.join(spill_dir, f"{os.path.basename(spilled['callers'][caller])}.kept.npy"),
+            mode="w+",
+            dtype=bool,
+            shape=(rows,),
+        )
+    for keys_file in spilled["keys"].values():
+        keys = pd.read_csv(
+            keys_file, sep="\t", dtype={"Caller": str, "row": np.int64, "DNAchange": str}, keep_default_na=False
+        )
+        keys = keys.take(first_calls(keys["DNAchange"].to_numpy(), keys["Caller"].to_numpy(), vc_priority))
+        for caller, rows in keys.groupby("Caller", sort=False)["row"]:
+            kept[caller][rows.to_numpy()] = True
+    return kept
+
+
+def write_maf_chunks(maf_chunks, preamble, mafout_file, vc_priority=VC_PRIORITY, chunksize=100000, tabix=False):
+    """
+    Same as write_maf for a MAF that comes in chunks. Chunks are appended to the output as they come, unless
+    there is a Caller column: then they are spilled to temporary files (see spill_chunk), deduplicated one chromosome
+    at a time (see keep_first_calls) and the kept rows are written streaming the callers in priority order.
+    """
+    if tabix:
+        print("[WGN] Output is not sorted when streaming in chunks, it will not be indexed")
+    outdir = os.path.dirname(os.path.abspath(mafout_file))
+    with maf_io.open_maf_output(mafout_file, preamble) as mafout, tempfile.TemporaryDirectory(dir=outdir) as spill_dir:
+        columns = None
+        header = True
+        rows = 0
+        spilled = {"callers": {}, "rows": {}, "keys": {}}  # in order of appearance
+        multiallelic = []
+        for maf_df in maf_chunks:
+            if columns is None:
+                columns = maf_df.columns
+            maf_df = maf_df.reindex(columns=columns)
+            if "Caller" not in columns:
+                maf_df.to_csv(mafout, mode="wb", index=False, header=header, sep="\t")
+                header = False
+                rows += len(maf_df)
+                continue
+            callers, chunk_multiallelic = multiallelic_callers(maf_df)
+            multiallelic += [caller for caller in chunk_multiallelic if caller not in multiallelic]
+            spill_chunk(maf_df, callers, spill_dir, spilled)
+        if columns is not None and "Caller" in columns:
+            print("Removing duplicated variants from maf (only one entry from a caller will be kept)")
+            kept = keep_first_calls(spilled, spill_dir, vc_priority + multiallelic)
+            pd.DataFrame(columns=columns).to_csv(mafout, mode="wb", index=False, header=True, sep="\t")
+            for caller in vc_priority + multiallelic:
+                if caller not in spilled["callers"]:
+                    continue
+                start = 0
+                # read back as text so values are written exactly as they were spilled
+                for variants in pd.read_csv(
+                    spilled["callers"][caller], sep="\t", dtype=str, keep_default_na=False, chunksize=chunksize
+                ):
+                    keep = kept[caller][start : start + len(variants)]
+                    start += len(variants)
+                    variants[keep].to_csv(mafout, mode="wb", index=False, header=False, sep="\t")
+                    rows += int(keep.sum())
+            del kept
+    print(f"Done! See '{mafout_file}'.")
+    return rows
+
+
+def annotate_maf(maf, gnomad_thr, whitelist, blacklist, filters, ref, hp_length=6, cached=None, ignore_consensus=None):
+    """
+    Adds all the per variant annotations and the RaVeX_FILTER. Blacklist, CONTEXT and homopolymer are taken from
+    cached (see read_cache) if given. ignore_consensus is passed to add_ravex_filters.
+    """
     noncoding_list = [
         "intron_variant",
         "intergenic_variant",
@@ -309,28 +767,183 @@ def main():
         "INTRON",
         "RNA",
     ]
-    args = argparser()
-    maf = read_maf(args.input)
-    whitelist = False
-    blacklist = False
-    if args.whitelist:
-        whitelist = read_whitelist_bed(args.whitelist)
-    if args.blacklist:
-        blacklist = read_blacklist_bed(args.blacklist)
-    else:
-        blacklist = pd.DataFrame()
-    maf = filtering(maf=maf, gnomad_thr=args.gnomad_thr, whitelist=whitelist, blacklist=blacklist, filters=args.filters)
+    maf = METRICS(
+        "filtering",
+        filtering,
+        maf=maf,
+        gnomad_thr=gnomad_thr,
+        whitelist=whitelist,
+        blacklist=blacklist,
+        filters=filters,
+        cached=cached,
+    )
     # tag noncoding
-    maf = noncoding(maf=maf, noncoding=noncoding_list)
+    maf = METRICS("noncoding", noncoding, maf=maf, noncoding=noncoding_list)
     # tag IG and pseudo
-    maf = remove_ig_and_pseudo(maf=maf)
+    maf = METRICS("remove_ig_and_pseudo", remove_ig_and_pseudo, maf=maf)
     # tag homopolymers
-    maf = remove_homopolymers(maf=maf, ref=args.ref)
+    if ref and cached is not None:
+        maf = use_cached(maf, cached, ["CONTEXT", "homopolymer"])
+    elif ref:
+        maf = METRICS("remove_homopolymers", remove_homopolymers, maf=maf, ref=ref, hp_length=hp_length)
+    else:
+        maf["homopolymer"] = False
     # tag consensus
-    maf = add_ravex_filters(maf=maf, filters=args.filters, blacklist=blacklist, whitelist=whitelist)
-    if not args.output:
-        args.output = args.input.replace(".maf", "filtered.maf")
-    write_maf(maf_df=maf, mafin_file=args.input, mafout_file=args.output)
+    maf = METRICS(
+        "add_ravex_filters",
+        add_ravex_filters,
+        maf=maf,
+        filters=filters,
+        blacklist=blacklist,
+        whitelist=whitelist,
+        ignore_consensus=ignore_consensus,
+    )
+    return maf
+
+
+def filter_maf(
+    maf_files,
+    mafout_file,
+    annotation_args,
+    chunksize=None,
+    sidecar=False,
+    tabix=False,
+    vc_priority=VC_PRIORITY,
+    cache_dir=None,
+    cache_out=None,
+    resources=None,
+):
+    """
+    Filters the MAF(s) of one sample into mafout_file. With cache_dir the annotations that do not depend on the
+    thresholds are read from the cache, with cache_out they are written to it after annotating, see cache_resources.
+    """
+    # comment lines (#version...) of the input MAF(s) are kept in the output
+    preamble = []
+    for maf_file in maf_files:
+        preamble += [line for line in maf_io.read_preamble(maf_file) if line not in preamble]
+    if chunksize:
+        # the columns and whether the consensus is ignored are decided once from the headers, not per chunk
+        columns = read_columns(maf_files)
+        maf_chunks = read_maf_chunks(maf_files, chunksize=chunksize, columns=columns, sidecar=sidecar)
+        maf_chunks = METRICS.iterate("read_maf", maf_chunks)
+        ignore_consensus = "isconsensus" not in columns
+        maf_chunks = (annotate_maf(maf=maf, ignore_consensus=ignore_consensus, **annotation_args) for maf in maf_chunks)
+        # reading and annotating the chunks are measured as their own stages
+        with METRICS.stage("write_output") as record:
+            record["rows"] = write_maf_chunks(
+                maf_chunks=maf_chunks,
+                preamble=preamble,
+                mafout_file=mafout_file,
+                vc_priority=vc_priority,
+                chunksize=chunksize,
+                tabix=tabix,
+            )
+    else:
+        maf = METRICS("read_maf", read_maf, maf_files, sidecar=sidecar)
+        cached = None
+        if cache_dir or cache_out:
+            annotations_file = cache_file(maf_files, resources)
+        if cache_dir:
+            cached = METRICS("read_cache", read_cache, os.path.join(cache_dir, annotations_file), maf)
+        maf = annotate_maf(maf=maf, cached=cached, **annotation_args)
+        if cache_out and cached is None:
+            METRICS("write_cache", write_cache, maf, os.path.join(cache_out, annotations_file))
+        with METRICS.stage("write_output") as record:
+            record["rows"] = write_maf(
+                maf_df=maf, preamble=preamble, mafout_file=mafout_file, vc_priority=vc_priority, tabix=tabix
+            )
+
+
+def read_manifest(manifest_file):
+    """
+    Pairs of (input MAFs, output MAF) from a TSV with input and output columns
+    """
+    manifest = pd.read_csv(manifest_file, sep="\t", dtype=str, comment="#")
+    missing = {"input", "output"} - set(manifest.columns)
+    if missing:
+        raise ValueError(f"Manifest {manifest_file} should have input and output columns (missing: {missing})")
+    if manifest["output"].duplicated().any():
+        raise ValueError(f"Manifest {manifest_file} has duplicated outputs")
+    return [(inputs.split(","), output) for inputs, output in zip(manifest["input"], manifest["output"])]
+
+
+def filter_batch_maf(maf_files, mafout_file):
+    """
+    Filters one MAF of a --manifest run with the shared state, messages go to <output>.log. Returns the output and
+    the metrics of its stages.
+    """
+    METRICS.stages = {}
+    with open(f"{mafout_file}.log", "w") as log, contextlib.redirect_stdout(log):
+        filter_maf(maf_files, mafout_file, **BATCH)
+    return mafout_file, METRICS.stages
+
+
+def filter_manifest(samples, run_args, workers=1):
+    """
+    Filters the MAFs of a manifest. Workers are forked after the annotation state (blacklist and whitelist indexes)
+    is loaded so they share it read-only instead of loading it for every MAF. Returns the metrics of each MAF.
+    """
+    BATCH.update(run_args)
+    if workers <= 1:
+        done = [filter_batch_maf(maf_files, mafout_file) for maf_files, mafout_file in samples]
+    else:
+        with multiprocessing.get_context("fork").Pool(workers) as pool:
+            done = pool.starmap(filter_batch_maf, samples, chunksize=1)
+    print(f"Done! Filtered {len(done)} MAFs from the manifest.")
+    return {stage_metrics.sample_name(mafout_file): stages for mafout_file, stages in done}
+
+
+def main():
+    args = argparser()
+    timer = startup_profile.Timer()
+    whitelist = False
+    with METRICS.stage("load_resources"):
+        if args.whitelist:
+            # index with the whitelisted variants (see whitelist_index.py)
+            whitelist = timer("whitelist", whitelist_index.load_index, args.whitelist)
+        if args.blacklist:
+            blacklist = timer("blacklist", lambda: index_blacklist(read_blacklist_bed(args.blacklist)))
+        else:
+            blacklist = {}
+        if args.ref:
+            timer("reference", open_fasta, args.ref)
+    if not args.ref and not args.profile_startup:
+        print("[WGN] No --ref given, variants will not be tagged for homopolymers")
+    if args.profile_startup:
+        startup_profile.report(__file__, timer)
+        return
+    annotation_args = dict(
+        gnomad_thr=args.gnomad_thr,
+        whitelist=whitelist,
+        blacklist=blacklist,
+        filters=args.filters,
+        ref=args.ref,
+        hp_length=args.hp_length,
+    )
+    run_args = dict(
+        annotation_args=annotation_args,
+        chunksize=args.chunksize,
+        sidecar=args.sidecar,
+        tabix=args.tabix,
+        vc_priority=args.vc_priority,
+    )
+    cache_out = args.cache_out or args.cache_dir
+    if cache_out and args.chunksize:
+        print("[WGN] Annotations are not cached when streaming in chunks")
+    elif cache_out:
+        run_args["cache_dir"] = args.cache_dir
+        run_args["cache_out"] = cache_out
+        run_args["resources"] = cache_resources(args.ref, args.blacklist, args.hp_length, args.cache_dir, cache_out)
+    if args.manifest:
+        # resources are loaded once for the whole manifest
+        metrics = {"manifest": METRICS.stages}
+        metrics.update(filter_manifest(read_manifest(args.manifest), run_args, workers=args.workers))
+    else:
+        filter_maf(args.input, args.output, **run_args)
+        metrics = {stage_metrics.sample_name(args.output): METRICS.stages}
+    if args.metrics_json:
+        stage_metrics.write_json(metrics, args.metrics_json, "maf_filtering_metrics", "MAF filtering stages")
+        print(f"Metrics of the stages in '{args.metrics_json}'.")
 
 
 if __name__ == "__main__":
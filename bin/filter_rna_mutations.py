@@ -4,11 +4,17 @@ Author: Raquel Manzano - @RaqManzano
 Script: Filters MAF file with realignment (could it run with the consensus?), noncoding(?), homopolymers and RNA editing database
 """
 import argparse
+import gzip
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import pandas as pd
-from liftover import ChainFile
-from capy import mut
+import maf_io
+import rnaediting_index
+import stage_metrics
+import startup_profile
 
 pd.options.mode.chained_assignment = None  # default='warn'
+METRICS = stage_metrics.Metrics()
 
 
 def argparser():
@@ -24,9 +30,27 @@ def argparser():
     parser.add_argument("--refname", help="e.g. hg38", default="hg38")
     parser.add_argument("--ref2", help="FASTA - e.g. hg19 (hs37d5)")
     parser.add_argument("--refname2", help="e.g. HG19", default="hg19")
-    parser.add_argument("--rnaedits", help="BED file(s) with known RNA editing events separated by space", nargs="+")
-    parser.add_argument("--thr", default=-2.8)
+    parser.add_argument(
+        "--rnaedits",
+        help="BED file(s) with known RNA editing events or index(es) built with rnaediting_index.py separated by space",
+        nargs="+",
+    )
+    parser.add_argument("--thr", help="PoN score threshold", type=float, default=-2.8)
     parser.add_argument("--chain", help="Chain file")
+    parser.add_argument(
+        "--threads", help="Processes to score the PoN (variants are sharded by chromosome)", type=int, default=1
+    )
+    parser.add_argument(
+        "--sidecar", help="Read/write a Parquet copy next to each input MAF to skip parsing", action="store_true"
+    )
+    parser.add_argument(
+        "--profile-startup", help="Report import and initialisation times and exit", action="store_true"
+    )
+    parser.add_argument(
+        "--metrics-json",
+        help="Write the wall time, CPU time, peak RSS increase and rows of each stage to this file (MultiQC custom "
+        "content, name it *_mqc.json)",
+    )
 
     return parser.parse_args()
 
@@ -37,23 +61,25 @@ def realignment(maf1, maf2):
     """
     # Create the 'DNAchange' column
     for maf in [maf1, maf2]:
-        maf["DNAchange"] = (
-            maf["Chromosome"]
-            + ":g."
-            + maf["Start_Position"].astype(str)
-            + maf["Reference_Allele"]
-            + ">"
-            + maf["Tumor_Seq_Allele2"]
-        )
-    # Filter out consensus 'DNAchange' values from both mafs (consensus is unrelated to realignment)
-    maf1_non_consensus = maf1[~maf1["Caller"].str.contains("consensus", case=False)]
-    maf2_non_consensus = maf2[~maf2["Caller"].str.contains("consensus", case=False)]
-    # Find intersection of non-consensus 'DNAchange' values
-    is_intersect = maf1_non_consensus["DNAchange"].isin(maf2_non_consensus["DNAchange"])
-    intersect_changes = maf1_non_consensus["DNAchange"][is_intersect]
+        if "DNAchange" not in maf.columns:
+            maf["DNAchange"] = (
+                maf["Chromosome"].astype(object)
+                + ":g."
+                + maf["Start_Position"].astype(str)
+                + maf["Reference_Allele"]
+                + ">"
+                + maf["Tumor_Seq_Allele2"]
+            )
+    # variants are matched with packed integer keys confirmed on the alleles instead of the DNAchange strings
+    # Filter out consensus variants from both mafs (consensus is unrelated to realignment)
+    non_consensus1 = ~maf1["Caller"].str.contains("consensus", case=False).to_numpy()
+    non_consensus2 = ~maf2["Caller"].str.contains("consensus", case=False).to_numpy()
+    # Find intersection of non-consensus variants
+    in_both = non_consensus1 & maf_io.in_maf_index(maf1, maf_io.build_maf_index(maf2[non_consensus2]))
+    intersection = maf_io.build_maf_index(maf1[in_both])
     # Update 'realignment' columns based on the intersection
-    maf1["realignment"] = maf1["DNAchange"].isin(intersect_changes)
-    maf2["realignment"] = maf2["DNAchange"].isin(intersect_changes)
+    maf1["realignment"] = maf_io.in_maf_index(maf1, intersection)
+    maf2["realignment"] = maf_io.in_maf_index(maf2, intersection)
     # Subset to intersected variants excluding any consensus variants
     maf1_intersect = maf1[maf1["realignment"]]
     maf2_intersect = maf2[maf2["realignment"]]
@@ -66,8 +92,8 @@ def add_rnaediting_sites(maf, rnaeditingsites, realignment):
     """
     Check for RNA editing sites in the MAF table
     """
-    # bed format expected
-    maf["rnaediting"] = maf["DNAchange"].isin(rnaeditingsites["DNAchange"])
+    # index with known RNA editing sites (see rnaediting_index.py)
+    maf["rnaediting"] = rnaediting_index.is_in_index(maf, rnaeditingsites)
     # change filter accordingly
     pon_cols = [x for x in maf.columns if "pon_thr" in x]
     for idx, row in maf.iterrows():
@@ -97,7 +123,45 @@ def extract_coords(df):
     return coords
 
 
-def run_capy(M, pon, ref, thr, chroms, suffix="_hg38", refname2="hg19"):
+PON_KEY = ["chr", "pos", "n_alt", "n_ref"]
+
+
+def score_pon_shard(M, pon, ref):
+    """
+    Scores a set of variants against the token PoN (runs in a worker process with --threads)
+    """
+    from capy import mut
+
+    return mut.filter_mutations_against_token_PoN(M=M, ponfile=pon, ref=ref)
+
+
+def score_pon(M, pon, ref, threads=1, cache=None):
+    """
+    Scores the variants of M (with chr, pos, n_alt and n_ref columns) against the token PoN.
+    Each (chr, pos, counts) is only scored once: duplicated variants and those already in cache (keyed by
+    (pon, chr, pos, n_alt, n_ref)) are not rescored. With threads > 1 the variants are sharded by chromosome and the
+    shards are scored in a process pool.
+    Returns the scores in the order of M.
+    """
+    cache = {} if cache is None else cache
+    keys = list(zip([pon] * M.shape[0], *(M[column].tolist() for column in PON_KEY)))
+    new = [key not in cache for key in keys]
+    todo = M[new].drop_duplicates(subset=PON_KEY)
+    if not todo.empty:
+        shards = [shard for _, shard in todo.groupby("chr", sort=False)] if threads > 1 else [todo]
+        if len(shards) > 1:
+            with ProcessPoolExecutor(max_workers=threads) as pool:
+                scores = list(pool.map(score_pon_shard, shards, [pon] * len(shards), [ref] * len(shards)))
+        else:
+            scores = [score_pon_shard(todo, pon, ref)]
+        for shard, shard_scores in zip(shards, scores):
+            assert len(shard_scores) == shard.shape[0], "PoN scores are not same length as nrow"
+            for key, score in zip(zip(*(shard[column].tolist() for column in PON_KEY)), shard_scores):
+                cache[(pon, *key)] = score
+    return [cache[key] for key in keys]
+
+
+def run_capy(M, pon, ref, thr, chroms, suffix="_hg38", refname2="hg19", threads=1, cache=None):
     """
     Runs CApy with RNA PoN generated with tokenizer (https://github.com/getzlab/aggregate_tokens_files_TOOL)
     """
@@ -114,35 +178,104 @@ def run_capy(M, pon, ref, thr, chroms, suffix="_hg38", refname2="hg19"):
     M["n_alt"] = M["t_alt_count"]
     M["n_ref"] = M["t_ref_count"]
     M = M.astype({"chr": "int32", "pos": "int32"})
-    pon_scores = mut.filter_mutations_against_token_PoN(M=M, ponfile=pon, ref=ref)
-    assert len(pon_scores) == M.shape[0], "PoN scores are not same length as nrow"
-    M["pon_score" + suffix] = pon_scores
+    M["pon_score" + suffix] = score_pon(M, pon=pon, ref=ref, threads=threads, cache=cache)
     M["pon_thr" + suffix] = M["pon_score" + suffix] >= thr
     return M
 
 
-def add_coords2_with_liftover(M, chain_file,ref1="hg38",ref2="hg19"):
+def read_chain(chain_file):
+    """
+    Reads the alignment blocks of a UCSC chain file. Returns {source chromosome: blocks} where blocks is a DataFrame
+    sorted by start with the block start/end in the source genome, its target chromosome, start, strand and size
+    (to map the negative strand) and the order of its chain in the file.
+    """
+    opener = gzip.open if chain_file.endswith(".gz") else open
+    blocks = []
+    with opener(chain_file, "rt") as chain:
+        for line in chain:
+            fields = line.split()
+            if not fields:
+                continue
+            if fields[0] == "chain":
+                # chain score tName tSize tStrand tStart tEnd qName qSize qStrand qStart qEnd id
+                source_chrom, source = fields[2], int(fields[5])
+                target_chrom, target_size, target_strand, target = fields[7], int(fields[8]), fields[9], int(fields[10])
+                order = len(blocks)
+                continue
+            size = int(fields[0])
+            blocks += [(source_chrom, source, source + size, target_chrom, target, target_strand, target_size, order)]
+            if len(fields) == 3:
+                source += size + int(fields[1])
+                target += size + int(fields[2])
+    columns = ["chrom", "start", "end", "target_chrom", "target_start", "target_strand", "target_size", "order"]
+    blocks = pd.DataFrame(blocks, columns=columns).sort_values(["chrom", "start"], kind="stable")
+    return {chrom: chrom_blocks.reset_index(drop=True) for chrom, chrom_blocks in blocks.groupby("chrom", sort=False)}
+
+
+def liftover_positions(chain, chromosomes, positions):
+    """
+    Lifts 1-based positions with the blocks of read_chain. Positions are sorted per chromosome and resolved against
+    the blocks sorted by start, stepping back only over blocks that overlap (if several blocks contain a position the
+    one from the first chain in the file is used).
+    Returns arrays with the new chromosome, position and strand (None/NaN when the position cannot be lifted).
+    """
+    chromosomes = np.asarray(chromosomes, dtype=object)
+    positions = np.asarray(positions, dtype=np.float64)
+    new_chrom = np.full(len(positions), None, dtype=object)
+    new_pos = np.full(len(positions), np.nan)
+    new_strand = np.full(len(positions), None, dtype=object)
+    for chrom in pd.unique(chromosomes):
+        # chromosome names are also matched with/without the chr prefix
+        alias = chrom[3:] if str(chrom).startswith("chr") else f"chr{chrom}"
+        blocks = chain.get(chrom, chain.get(alias))
+        rows = np.flatnonzero((chromosomes == chrom) & ~np.isnan(positions))
+        if blocks is None or not len(rows):
+            continue
+        rows = rows[np.argsort(positions[rows], kind="stable")]
+        query = positions[rows].astype(np.int64) - 1  # chain coordinates are 0-based
+        starts, ends, order = blocks["start"].to_numpy(), blocks["end"].to_numpy(), blocks["order"].to_numpy()
+        reach = np.maximum.accumulate(ends)  # furthest end of the blocks up to each one
+        block = np.searchsorted(starts, query, side="right") - 1
+        best = np.full(len(rows), -1)
+        candidates = np.flatnonzero(block >= 0)
+        while len(candidates):
+            current = block[candidates]
+            contains = query[candidates] < ends[current]
+            previous = best[candidates]
+            better = contains & ((previous < 0) | (order[current] < order[np.maximum(previous, 0)]))
+            best[candidates[better]] = current[better]
+            # keep stepping back while an earlier block could still contain the position
+            block[candidates] -= 1
+            previous = block[candidates]
+            candidates = candidates[(previous >= 0) & (reach[np.maximum(previous, 0)] > query[candidates])]
+        mapped = best >= 0
+        hit = best[mapped]
+        offset = query[mapped] - starts[hit]
+        target = blocks["target_start"].to_numpy()[hit] + offset
+        forward = blocks["target_strand"].to_numpy()[hit] == "+"
+        target = np.where(forward, target, blocks["target_size"].to_numpy()[hit] - target - 1)
+        new_chrom[rows[mapped]] = blocks["target_chrom"].to_numpy()[hit]
+        new_pos[rows[mapped]] = target + 1
+        new_strand[rows[mapped]] = np.where(forward, "+", "-")
+    return new_chrom, new_pos, new_strand
+
+
+def add_coords2_with_liftover(M, chain_file, ref1="hg38", ref2="hg19"):
     """
     Liftover ref1 coordinates from maf to ref2
     """
-    converter = ChainFile(chain_file, ref1, ref2)
+    print(f"- Lifting over {ref1} coordinates to {ref2}")
+    chain = read_chain(chain_file)
     na_nr = M[M["Chromosome"].isnull()].shape[0]
     if na_nr > 0:
         print(f"[WGN] Removing {na_nr} variants where Chromosome is NA")
         M = M[
             ~M["Chromosome"].isna()
         ].reindex()  # remove positions where coordinates are not present (maybe liftover went wrong)
-
-    starting_size = M.shape[0]
-    M["coordinates_"+ref2] = M.apply(lambda x: converter[x["Chromosome"]][x["Start_Position"]], axis=1)
-    # Replace with tuple of None's when position has been deleted in new reference genome
-    tmp = pd.DataFrame(M["coordinates19"].tolist(), index=M.index).apply(
-        lambda ds: ds.map(lambda x: x if x != None else (None, None, None))
-    )
-    tmp[["Chromosome_"+ref2, "Start_Position_"+ref2, "STRAND_"+ref2]] = pd.DataFrame(tmp[0].tolist(), index=M.index)
-    liftover_size = tmp.shape[0]
-    assert starting_size == liftover_size, "Liftovered positions are not the same number as in original MAF"
-    M = pd.concat([M, tmp], axis=1).drop(0, axis=1)
+    chrom, pos, strand = liftover_positions(chain, M["Chromosome"], M["Start_Position"])
+    M["Chromosome" + ref2] = chrom
+    M["Start_Position" + ref2] = pos
+    M["STRAND" + ref2] = strand
     return M
 
 
@@ -171,44 +304,97 @@ def main():
             args.rnaedits = args.rnaedits[0].strip().split(",")
     # chromosomes
     chroms = [f"chr{x}" for x in list(range(1, 23)) + ["X", "Y"]]
+    # Known RNA editing sites are loaded once for all the MAFs
+    timer = startup_profile.Timer()
+    if args.rnaedits:
+        with METRICS.stage("load_resources"):
+            rnadbs = timer("rnaedits", rnaediting_index.load_index, args.rnaedits)
+    if args.profile_startup:
+        startup_profile.report(__file__, timer)
+        return
 
     # realignment
-    calls_1pass = pd.read_csv(args.maf, sep="\t", comment="#")
+    calls_1pass = METRICS("read_maf", maf_io.read_maf, args.maf, sidecar=args.sidecar)
     # If REALIGNMENT provide intersect
     if args.maf_realign and args.maf != args.maf_realign:
         didrealignment = True
-        calls_2pass = pd.read_csv(args.maf_realign, sep="\t", comment="#")
-        calls1, calls2, calls12 = realignment(calls_1pass, calls_2pass)
-        calls = [calls1, calls2, calls12]
+        calls_2pass = METRICS("read_maf", maf_io.read_maf, args.maf_realign, sidecar=args.sidecar)
+        with METRICS.stage("realignment", rows=len(calls_1pass) + len(calls_2pass)):
+            calls1, calls2, calls12 = realignment(calls_1pass, calls_2pass)
+        mafs = [calls1, calls2, calls12]
     else:
         didrealignment = False
-        calls = [calls_1pass]
-    # Annotate known RNA editing
-    results = {}
-    for idx, calls in enumerate(calls):
-        if calls.empty:
-            results[idx] = calls
-            continue
-        if "Chromosome"+args.refname2 in calls.columns:
-            calls.drop(["Chromosome"+args.refname2, "Start_Position"+args.refname2], axis=1, inplace=True)
+        mafs = [calls_1pass]
+    # The MAFs are annotated in one batch so the liftover and PoN scoring are run once for all of them
+    results = {idx: maf for idx, maf in enumerate(mafs) if maf.empty}
+    batch = [maf.assign(maf_set=idx) for idx, maf in enumerate(mafs) if not maf.empty]
+    if batch:
+        calls = pd.concat(batch, ignore_index=True)
+        if "Chromosome" + args.refname2 in calls.columns:
+            calls.drop(
+                ["Chromosome" + args.refname2, "Start_Position" + args.refname2, "STRAND" + args.refname2],
+                axis=1,
+                inplace=True,
+                errors="ignore",
+            )
+        # PoN scores are cached by (pon, chr, pos, counts) so variants shared between MAFs are scored once
+        pon_cache = {}
         # RNA panel of normals
         if args.pon2 and args.chain and args.ref2:
-            calls = add_coords2_with_liftover(calls, chain_file=args.chain,ref1=args.refname,ref2=args.refname2)
-            calls = run_capy(M=calls, pon=args.pon2, ref=args.ref2, thr=args.thr, suffix='_'+args.refname2, chroms=chroms)
+            calls = METRICS(
+                "liftover",
+                add_coords2_with_liftover,
+                calls,
+                chain_file=args.chain,
+                ref1=args.refname,
+                ref2=args.refname2,
+            )
+            calls = METRICS(
+                "run_capy_" + args.refname2,
+                run_capy,
+                M=calls,
+                pon=args.pon2,
+                ref=args.ref2,
+                thr=args.thr,
+                suffix="_" + args.refname2,
+                chroms=chroms,
+                refname2=args.refname2,
+                threads=args.threads,
+                cache=pon_cache,
+            )
         if args.pon:
-            calls = run_capy(M=calls, pon=args.pon, ref=args.ref, thr=args.thr, suffix='_'+args.refname, chroms=chroms)
+            calls = METRICS(
+                "run_capy_" + args.refname,
+                run_capy,
+                M=calls,
+                pon=args.pon,
+                ref=args.ref,
+                thr=args.thr,
+                suffix="_" + args.refname,
+                chroms=chroms,
+                refname2=None,
+                threads=args.threads,
+                cache=pon_cache,
+            )
         # Annotate known RNA editing
         if args.rnaedits:
-            rnadbs = []
-            for rnadb_file in args.rnaedits:
-                rnadb = pd.read_csv(rnadb_file, sep="\t", names=["chr", "start", "end", "ref", "alt"], header=None)
-                rnadb["DNAchange"] = rnadb["chr"] + ":g." + rnadb["start"].map(str) + rnadb["ref"] + ">" + rnadb["alt"]
-                rnadbs += [rnadb]
-            rnadbs = pd.concat(rnadbs)
-            calls = add_rnaediting_sites(maf=calls, rnaeditingsites=rnadbs, realignment=didrealignment)
-        results[idx] = calls
+            calls = METRICS(
+                "add_rnaediting_sites",
+                add_rnaediting_sites,
+                maf=calls,
+                rnaeditingsites=rnadbs,
+                realignment=didrealignment,
+            )
+        for idx in range(len(mafs)):
+            if idx not in results:
+                results[idx] = calls[calls["maf_set"] == idx].drop("maf_set", axis=1)
     # write maf files
-    write_output(args, results, args.output, args.out_suffix)
+    with METRICS.stage("write_output", rows=sum(len(maf) for maf in results.values())):
+        write_output(args, results, args.output, args.out_suffix)
+    if args.metrics_json:
+        metrics = {stage_metrics.sample_name(args.output): METRICS.stages}
+        stage_metrics.write_json(metrics, args.metrics_json, "rna_filtering_metrics", "RNA filtering stages")
+        print(f"Metrics of the stages in '{args.metrics_json}'.")
 
 
 if __name__ == "__main__":
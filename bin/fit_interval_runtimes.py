@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+"""
+Script: Fits a runtime per interval from previous runs (Nextflow trace + mosdepth) and writes it as the fifth column
+of the intervals BED, so CREATE_INTERVALS_BED groups the scatter chunks by predicted time instead of length.
+The runtime of each variant calling task is modelled as
+    task overhead + per interval overhead * intervals + a * bases + b * bases * mean depth
+with non-negative coefficients fitted per process (without --mosdepth the depth term is left out, it would be the
+same as the bases); the slowest process gives the estimate of each interval.
+The trace needs the workdir field (the interval BED of each task is read from its work directory).
+"""
+import argparse
+import glob
+import os
+import re
+import numpy as np
+import pandas as pd
+import plan_intervals
+
+DURATION_UNITS = {"d": 86400, "h": 3600, "m": 60, "s": 1, "ms": 0.001}
+
+
+def argparser():
+    parser = argparse.ArgumentParser(description="")
+    parser.add_argument("--intervals", help="Intervals BED to annotate", required=True)
+    parser.add_argument("--trace", help="Nextflow trace file(s) with the workdir field", nargs="+", required=True)
+    parser.add_argument("--mosdepth", help="mosdepth regions.bed.gz file(s) (mean depth per region)", nargs="*")
+    parser.add_argument("--process", help="Regex for the scattered processes to model", default="MUTECT2|STRELKA|SAGE")
+    parser.add_argument("--scatter_count", help="Parallel jobs for the makespan report", type=int, default=25)
+    parser.add_argument("-o", "--output", help="Intervals BED with runtime estimates", default="intervals.runtime.bed")
+    return parser.parse_args()
+
+
+def read_bed(bed_file):
+    """
+    First four columns of a BED file (name is . if missing)
+    """
+    bed = pd.read_csv(bed_file, sep="\t", header=None, comment="#", dtype={0: str})
+    bed = bed[~bed[0].str.startswith(("track", "browser"))]
+    bed = bed.iloc[:, :4].rename(columns={0: "chrom", 1: "start", 2: "end", 3: "name"})
+    if "name" not in bed.columns:
+        bed["name"] = "."
+    return bed.astype({"start": np.int64, "end": np.int64}).reset_index(drop=True)
+
+
+def parse_duration(duration):
+    """
+    Seconds of a Nextflow duration (e.g. 1h 2m 3s, 450ms, 2.5s)
+    """
+    if pd.isna(duration) or duration == "-":
+        return np.nan
+    parts = re.findall(r"([\d.]+)\s*(ms|d|h|m|s)", str(duration))
+    if not parts:
+        return float(duration) / 1000  # raw trace values are milliseconds
+    return sum(float(value) * DURATION_UNITS[unit] for value, unit in parts)
+
+
+def read_traces(trace_files, process):
+    """
+    Completed (or cached) tasks of the scattered processes with their realtime in seconds
+    """
+    trace = pd.concat([pd.read_csv(trace_file, sep="\t", dtype=str) for trace_file in trace_files])
+    if "workdir" not in trace.columns:
+        raise ValueError("The trace needs the workdir field (see trace.fields in nextflow.config)")
+    trace = trace[trace["status"].isin(["COMPLETED", "CACHED"])]
+    trace["process"] = trace["name"].str.split(" ").str[0].str.split(":").str[-1]
+    trace = trace[trace["process"].str.contains(process)]
+    trace["seconds"] = trace["realtime"].map(parse_duration)
+    return trace[trace["seconds"].notna()].drop_duplicates(subset="hash")
+
+
+def task_intervals(workdir):
+    """
+    Intervals of a task from the BED staged in its work directory (None if not found)
+    """
+    beds = sorted(glob.glob(os.path.join(workdir, "*.bed")) + glob.glob(os.path.join(workdir, "*.bed.gz")))
+    if not beds:
+        return None
+    return read_bed(beds[0])
+
+
+def index_depth(mosdepth_files):
+    """
+    Per chromosome cumulative depth of mosdepth regions (mean of the samples):
+    {chrom: (region starts, region ends, cumulative bases*depth at each region start)}
+    """
+    regions = []
+    for mosdepth_file in mosdepth_files:
+        region = pd.read_csv(mosdepth_file, sep="\t", header=None, dtype={0: str})
+        regions += [region.iloc[:, [0, 1, 2, -1]].set_axis(["chrom", "start", "end", "depth"], axis=1)]
+    regions = pd.concat(regions).groupby(["chrom", "start", "end"], sort=True)["depth"].mean().reset_index()
+    index = {}
+    for chrom, region in regions.groupby("chrom"):
+        starts, ends = region["start"].to_numpy(), region["end"].to_numpy()
+        covered = np.concatenate([[0], np.cumsum((ends - starts) * region["depth"].to_numpy())])
+        index[chrom] = (starts, ends, covered)
+    return index
+
+
+def cumulative_depth(index, chrom, positions):
+    """
+    Sum of depth over all bases before each position
+    """
+    starts, ends, covered = index[chrom]
+    region = np.maximum(np.searchsorted(starts, positions, side="right") - 1, 0)
+    length = ends[region] - starts[region]
+    inside = np.clip(positions - starts[region], 0, length)
+    depth = (covered[region + 1] - covered[region]) / np.maximum(length, 1)
+    return np.where(positions >= starts[0], covered[region] + inside * depth, 0)
+
+
+def interval_features(bed, depth_index):
+    """
+    Per interval bases and, with mosdepth, bases * mean depth
+    """
+    bases = (bed["end"] - bed["start"]).to_numpy().astype(float)
+    if not depth_index:
+        return np.column_stack([np.ones(len(bed)), bases])
+    weighted = np.zeros(len(bed))
+    starts, ends = bed["start"].to_numpy(), bed["end"].to_numpy()
+    for chrom, rows in bed.groupby("chrom").indices.items():
+        if chrom in depth_index:
+            weighted[rows] = cumulative_depth(depth_index, chrom, ends[rows]) - cumulative_depth(
+                depth_index, chrom, starts[rows]
+            )
+    return np.column_stack([np.ones(len(bed)), bases, weighted])
+
+
+def fit_nonnegative(X, y):
+    """
+    Least squares with non-negative coefficients (coefficients that come out negative are dropped and the rest refitted)
+    """
+    active = np.ones(X.shape[1], dtype=bool)
+    coefficients = np.zeros(X.shape[1])
+    while active.any():
+        fitted = np.linalg.lstsq(X[:, active], y, rcond=None)[0]
+        if (fitted >= 0).all():
+            coefficients[active] = fitted
+            break
+        active[np.flatnonzero(active)[fitted < 0]] = False
+    return coefficients
+
+
+def fit_runtimes(trace, depth_index):
+    """
+    Coefficients (task overhead, per interval, per base and, with mosdepth, per base*depth) for each process
+    """
+    models = {}
+    for process, tasks in trace.groupby("process"):
+        rows, seconds = [], []
+        for workdir, task_seconds in zip(tasks["workdir"], tasks["seconds"]):
+            bed = task_intervals(workdir)
+            if bed is None or bed.empty:
+                continue
+            rows += [np.concatenate([[1], interval_features(bed, depth_index).sum(axis=0)])]
+            seconds += [task_seconds]
+        if len(rows) < 4:
+            print(f"[WGN] Only {len(rows)} tasks with intervals found for {process}, not modelled")
+            continue
+        models[process] = fit_nonnegative(np.array(rows), np.array(seconds))
+        print(f"- {process}: {len(rows)} tasks, coefficients {np.round(models[process], 6).tolist()}")
+    return models
+
+
+def main():
+    args = argparser()
+    intervals = read_bed(args.intervals)
+    depth_index = index_depth(args.mosdepth) if args.mosdepth else {}
+    trace = read_traces(args.trace, args.process)
+    models = fit_runtimes(trace, depth_index)
+    if not models:
+        raise ValueError("No process could be modelled, check --trace and --process")
+    features = interval_features(intervals, depth_index)
+    # the slowest caller sets the runtime of each interval (task overheads are not per interval)
+    intervals["runtime"] = np.max([features @ coefficients[1:] for coefficients in models.values()], axis=0)
+    intervals.to_csv(args.output, sep="\t", index=False, header=False, float_format="%.3f")
+    total = intervals["runtime"].sum()
+    makespan = plan_intervals.makespan(intervals["runtime"], args.scatter_count)
+    print(f"- Predicted runtime of all intervals: {total:.1f}s")
+    print(
+        f"- Expected makespan with {args.scatter_count} jobs (gatk_interval_scatter_count): "
+        f"{makespan:.1f}s (lower bound {total / args.scatter_count:.1f}s)"
+    )
+    print(f"See: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,14 @@
 #!/usr/bin/env python
 """
 Author: Raquel Manzano - @RaqManzano
-Script: Convert MAF to BED format keeping ref and alt info
+Script: Convert MAF to BED format keeping ref and alt info.
+Regions are 0-based, padded, sorted in reference order (.fai, or by contig name without it) and merged when they
+overlap or are closer than --merge_distance, so each candidate region is only fetched once.
 """
 import argparse
+import numpy as np
 import pandas as pd
+import maf_io
 
 
 def argparser():
@@ -14,18 +18,79 @@ def argparser():
     parser.add_argument(
         "--extra", help="Extra columns to keep (space separated list)", nargs="+", required=False, default=[]
     )
+    parser.add_argument(
+        "--fai", help="FASTA index to sort by reference order and clip padded regions (default: sort by contig name)"
+    )
+    parser.add_argument(
+        "--padding", help="Bases added to each side of the variants (e.g. read length)", type=int, default=0
+    )
+    parser.add_argument("--merge_distance", help="Merge regions closer than this (bases)", type=int, default=0)
+    parser.add_argument(
+        "--sidecar", help="Read/write a Parquet copy next to the input MAF to skip parsing", action="store_true"
+    )
     return parser.parse_args()
 
 
-def maf2bed(maf_file, bed_file, extra):
-    maf = pd.read_csv(maf_file, sep="\t", comment="#")
-    bed = maf[["Chromosome", "Start_Position", "End_Position"] + extra]
-    bed.to_csv(bed_file, sep="\t", index=False, header=False)
+def read_fai(fai_file):
+    fai = pd.read_csv(fai_file, sep="\t", header=None, usecols=[0, 1], names=["chrom", "length"], dtype={0: str})
+    return dict(zip(fai["chrom"], fai["length"]))
+
+
+def merge_regions(bed, extra, merge_distance=0):
+    """
+    Merges sorted regions that overlap or are closer than merge_distance. Extra columns are aggregated as the unique
+    values of the merged regions separated by comma.
+    """
+    if bed.empty:
+        return bed
+    chrom_codes = bed["chrom"].cat.codes.to_numpy()
+    starts, ends = bed["start"].to_numpy(), bed["end"].to_numpy()
+    new_chrom = np.r_[True, chrom_codes[1:] != chrom_codes[:-1]]
+    # furthest end seen so far in the chromosome, a region starts when the next start is beyond it
+    reach = pd.Series(ends).groupby(np.cumsum(new_chrom)).cummax().to_numpy()
+    new_region = new_chrom | np.r_[True, starts[1:] > reach[:-1] + merge_distance]
+    region = np.cumsum(new_region)
+    aggregations = {"chrom": "first", "start": "min", "end": "max"}
+    aggregations.update({column: lambda values: ",".join(pd.unique(values.astype(str))) for column in extra})
+    return bed.groupby(region, sort=False).agg(aggregations)
+
+
+def maf2bed(maf_file, bed_file, extra, sidecar=False, fai_file=None, padding=0, merge_distance=0):
+    columns = ["Chromosome", "Start_Position", "End_Position"] + extra
+    maf = maf_io.read_maf(maf_file, columns=columns, sidecar=sidecar)
+    bed = maf[columns].rename(columns={"Chromosome": "chrom", "Start_Position": "start", "End_Position": "end"})
+    bed = bed.dropna(subset=["chrom", "start", "end"])
+    # MAF is 1-based and closed, BED 0-based and half-open
+    bed["start"] = np.maximum(bed["start"].astype(np.int64) - 1 - padding, 0)
+    bed["end"] = bed["end"].astype(np.int64) + padding
+    if fai_file:
+        lengths = read_fai(fai_file)
+        unknown = ~bed["chrom"].isin(list(lengths))
+        if unknown.any():
+            print(f"[WGN] Removing {unknown.sum()} regions in contigs not present in {fai_file}")
+            bed = bed[~unknown].copy()
+        bed["end"] = np.minimum(bed["end"], bed["chrom"].astype(object).map(lengths).astype(np.int64))
+        contigs = list(lengths)
+    else:
+        contigs = sorted(pd.unique(bed["chrom"].astype(str)))
+    bed["chrom"] = pd.Categorical(bed["chrom"].astype(str), categories=contigs, ordered=True)
+    bed = bed.sort_values(["chrom", "start", "end"], kind="stable")
+    merged = merge_regions(bed, extra, merge_distance)
+    print(f"- {len(bed)} variants in {len(merged)} regions")
+    merged.to_csv(bed_file, sep="\t", index=False, header=False)
 
 
 def main():
     args = argparser()
-    maf2bed(maf_file=args.mafin, bed_file=args.bedout, extra=args.extra)
+    maf2bed(
+        maf_file=args.mafin,
+        bed_file=args.bedout,
+        extra=args.extra,
+        sidecar=args.sidecar,
+        fai_file=args.fai,
+        padding=args.padding,
+        merge_distance=args.merge_distance,
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,458 @@
+"""
+Script: Shared MAF reading and writing for the bin/ scripts (explicit column types, column projection, an optional
+Parquet sidecar next to each MAF so that later steps do not need to parse the text again and bgzipped/indexed output)
+"""
+import gzip
+import os
+import numpy as np
+import pandas as pd
+
+# MAF schema: columns that are always parsed with the same type
+MAF_CATEGORIES = ["Chromosome"]
+MAF_POSITIONS = ["Start_Position", "End_Position"]
+MAF_COUNTS = ["t_depth", "t_ref_count", "t_alt_count", "n_depth", "n_ref_count", "n_alt_count"]
+MAF_DTYPES = {column: "category" for column in MAF_CATEGORIES}
+
+
+def sidecar_path(maf_file):
+    return f"{maf_file}.parquet"
+
+
+def maf_stamp(maf_file):
+    """
+    Size and modification time of a MAF file, stored in the Parquet metadata of its sidecar
+    """
+    stat = os.stat(maf_file)
+    return {b"maf_size": str(stat.st_size).encode(), b"maf_mtime_ns": str(stat.st_mtime_ns).encode()}
+
+
+def has_sidecar(maf_file):
+    """
+    A sidecar is only used if it was written from the MAF as it is now (same size and modification time)
+    """
+    sidecar = sidecar_path(maf_file)
+    if not os.path.exists(sidecar):
+        return False
+    try:
+        import pyarrow
+        import pyarrow.parquet as pq
+    except ImportError:
+        print("[WGN] pyarrow is not installed, Parquet sidecar will be ignored")
+        return False
+    try:
+        metadata = pq.read_schema(sidecar).metadata or {}
+    except pyarrow.lib.ArrowException as error:
+        print(f"[WGN] Parquet sidecar {sidecar} could not be read, it will be ignored: {error}")
+        return False
+    return all(metadata.get(key) == value for key, value in maf_stamp(maf_file).items())
+
+
+def apply_schema(maf):
+    """
+    Positions and read counts are stored as int32. Columns with missing values (e.g. failed liftover) are kept as
+    float so they are written back exactly as they were read.
+    """
+    int32 = np.iinfo(np.int32)
+    for column in MAF_POSITIONS + MAF_COUNTS:
+        if column in maf.columns and pd.api.types.is_integer_dtype(maf[column]):
+            if maf[column].empty or (maf[column].min() >= int32.min and maf[column].max() <= int32.max):
+                maf[column] = maf[column].astype(np.int32)
+    return maf
+
+
+def write_sidecar(maf, maf_file):
+    """
+    Writes the parsed MAF as Parquet next to the MAF file, with the size and modification time of the MAF (see
+    has_sidecar). Optional: nothing is written if pyarrow is not installed or the table cannot be converted.
+    """
+    try:
+        import pyarrow
+        import pyarrow.parquet as pq
+    except ImportError:
+        print("[WGN] pyarrow is not installed, no Parquet sidecar will be written")
+        return
+    sidecar = sidecar_path(maf_file)
+    try:
+        table = pyarrow.Table.from_pandas(maf, preserve_index=False)
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), **maf_stamp(maf_file)})
+        pq.write_table(table, sidecar + ".tmp")
+    except (TypeError, ValueError, pyarrow.lib.ArrowException) as error:
+        print(f"[WGN] Parquet sidecar could not be written for {maf_file}: {error}")
+        return
+    os.replace(sidecar + ".tmp", sidecar)
+
+
+def read_sidecar(maf_file, columns=None, chunksize=None):
+    """
+    Reads the Parquet sidecar of a MAF file, all at once or in chunks of chunksize rows
+    """
+    import pyarrow.parquet as pq
+
+    if not chunksize:
+        return pd.read_parquet(sidecar_path(maf_file), columns=columns)
+    parquet = pq.ParquetFile(sidecar_path(maf_file))
+    return (batch.to_pandas() for batch in parquet.iter_batches(batch_size=chunksize, columns=columns))
+
+
+def read_maf(maf_file, columns=None, sidecar=False, chunksize=None):
+    """
+    Reads a MAF file with the MAF schema. Only the given columns are parsed if columns is provided.
+    With sidecar, an up to date Parquet sidecar is read instead of the text and written after parsing if missing.
+    Returns a DataFrame or, if chunksize is given, an iterator of DataFrames of chunksize rows (see read_maf_chunks).
+    """
+    if chunksize:
+        return read_maf_chunks([maf_file], columns=columns, sidecar=sidecar, chunksize=chunksize)
+    if sidecar and has_sidecar(maf_file):
+        try:
+            maf = read_sidecar(maf_file, columns=columns)
+        except ImportError:
+            print("[WGN] pyarrow is not installed, Parquet sidecar will be ignored")
+        else:
+            return apply_schema(maf)
+    maf = apply_schema(pd.read_csv(maf_file, sep="\t", comment="#", usecols=columns, dtype=MAF_DTYPES))
+    if sidecar and columns is None:
+        write_sidecar(maf, maf_file)
+    return maf
+
+
+def column_kind(column):
+    """
+    i(nteger), f(loat), b(oolean) or t(ext) values, whatever the dtype (booleans with missing values are objects)
+    """
+    kind = pd.api.types.infer_dtype(column, skipna=True)
+    return {"integer": "i", "floating": "f", "empty": "f", "boolean": "b"}.get(kind, "t")
+
+
+def chunk_dtypes(chunks):
+    """
+    Types to read chunks with so they have the types of the whole table: integer columns with missing values in some
+    chunks are floats and text columns missing in some chunks are text (a column not in a chunk is missing). Other
+    mixes (e.g. booleans with missing values) keep the type pandas infers per chunk, they are filtered and written back
+    the same.
+    """
+    kinds, chunks_with_column, chunk_count = {}, {}, 0
+    for chunk in chunks:
+        chunk_count += 1
+        for column in chunk.columns:
+            if column not in MAF_DTYPES:
+                kinds.setdefault(column, set()).add(column_kind(chunk[column]))
+                chunks_with_column[column] = chunks_with_column.get(column, 0) + 1
+    dtypes = {}
+    for column, kind in kinds.items():
+        if chunks_with_column[column] < chunk_count:
+            kind.add("f")
+        if kind == {"i", "f"}:
+            dtypes[column] = np.float64
+        elif "t" in kind and kind <= {"t", "f"}:
+            dtypes[column] = object
+    return dtypes
+
+
+def maf_chunks(maf_file, columns=None, sidecar=False, chunksize=100000, dtypes=None):
+    """
+    Chunks of chunksize rows of a MAF file (of its sidecar if up to date) with the given column types
+    """
+    dtypes = dtypes or {}
+    if sidecar and has_sidecar(maf_file):
+        try:
+            chunks = read_sidecar(maf_file, columns=columns, chunksize=chunksize)
+        except ImportError:
+            print("[WGN] pyarrow is not installed, Parquet sidecar will be ignored")
+        else:
+            for chunk in chunks:
+                yield chunk.astype({column: dtypes[column] for column in chunk.columns if column in dtypes})
+            return
+    dtypes = {**dtypes, **MAF_DTYPES}
+    yield from pd.read_csv(maf_file, sep="\t", comment="#", usecols=columns, dtype=dtypes, chunksize=chunksize)
+
+
+def read_maf_chunks(maf_files, columns=None, sidecar=False, chunksize=100000):
+    """
+    Reads MAF file(s) one after the other in chunks of chunksize rows. Columns have the types they get when the files
+    are read whole and concatenated, so every chunk is filtered and written back as with read_maf. Finding the types
+    takes a first pass over the files (see chunk_dtypes).
+    """
+    dtypes = chunk_dtypes(
+        chunk for maf_file in maf_files for chunk in maf_chunks(maf_file, columns, sidecar=sidecar, chunksize=chunksize)
+    )
+    for maf_file in maf_files:
+        for chunk in maf_chunks(maf_file, columns, sidecar=sidecar, chunksize=chunksize, dtypes=dtypes):
+            yield apply_schema(chunk)
+
+
+def read_columns(maf_file):
+    """
+    Column names of a MAF file, without reading its rows
+    """
+    return list(pd.read_csv(maf_file, sep="\t", comment="#", nrows=0).columns)
+
+
+def read_preamble(maf_file):
+    """
+    Returns the comment lines (#version...) before the column header, without reading the rest of the file
+    """
+    opener = gzip.open if maf_file.endswith(".gz") else open
+    preamble = []
+    with opener(maf_file, "rt") as maf:
+        for line in maf:
+            if not line.startswith("#"):
+                break
+            preamble += [line.rstrip("\n")]
+    return preamble
+
+
+def open_maf_output(mafout_file, preamble=None):
+    """
+    Opens a MAF for writing (binary handle, write tables with to_csv(mode="wb")) and writes the preamble.
+    Output is bgzipped if the file name ends with .gz
+    """
+    if mafout_file.endswith(".gz"):
+        import pysam
+
+        mafout = pysam.BGZFile(mafout_file, "wb")
+    else:
+        mafout = open(mafout_file, "wb")
+    mafout.write("".join(f"{line}\n" for line in preamble or []).encode())
+    return mafout
+
+
+def index_maf(mafout_file, columns, preamble=None):
+    """
+    Tabix index of a bgzipped MAF (must be sorted by Chromosome and Start_Position)
+    """
+    if not mafout_file.endswith(".gz"):
+        print(f"[WGN] {mafout_file} is not bgzipped (.gz), it will not be indexed")
+        return
+    import pysam
+
+    try:
+        pysam.tabix_index(
+            mafout_file,
+            force=True,
+            seq_col=list(columns).index("Chromosome"),
+            start_col=list(columns).index("Start_Position"),
+            end_col=list(columns).index("End_Position"),
+            meta_char="#",
+            line_skip=len(preamble or []) + 1,  # column header
+        )
+    except (OSError, ValueError) as error:
+        print(f"[WGN] {mafout_file} could not be indexed: {error}")
+
+
+# variant keys: chromosome index | position | hash of REF>ALT packed in 64 bits. The chromosome index takes the bits
+# needed by the contig list and the allele hash the rest, the hash only narrows the matches (see in_variant_index)
+POS_BITS = 32
+MAX_CHROM_BITS = 24
+# layout of the keys of the saved indexes, bump it when variant_keys changes
+KEY_SCHEME = 2
+
+
+def chrom_bits(contigs):
+    """
+    Bits of the chromosome index of the keys of a contig list
+    """
+    bits = max(int(len(contigs) - 1).bit_length(), 1)
+    if bits > MAX_CHROM_BITS:
+        raise ValueError(f"Variant keys support up to {1 << MAX_CHROM_BITS} contigs, {len(contigs)} given")
+    return bits
+
+
+def allele_hash_version():
+    """
+    Fingerprint of the allele hash (pandas hash_pandas_object) stored with the indexes, so keys hashed by another
+    pandas version are detected
+    """
+    probe = pd.DataFrame({"ref": ["A", "-", "ACGT"], "alt": ["G", "TT", "-"]})
+    return np.bitwise_xor.reduce(pd.util.hash_pandas_object(probe, index=False).to_numpy())
+
+
+def variant_keys(chromosomes, positions, refs, alts, contigs):
+    """
+    Packs each variant (chromosome, position, REF, ALT) in a uint64 so variants can be matched as integers instead of
+    DNAchange strings. contigs gives the index of each chromosome and must be the same for the keys to be compared.
+    Returns the keys and whether the variant could be packed (known contig and position, in range).
+    """
+    allele_bits = 64 - POS_BITS - chrom_bits(contigs)
+    chrom_ids = pd.Categorical(np.asarray(chromosomes, dtype=object), categories=contigs).codes.astype(np.int64)
+    positions = np.asarray(positions, dtype=np.float64)
+    valid = (chrom_ids >= 0) & (positions >= 0) & (positions < 1 << POS_BITS)
+    alleles = pd.DataFrame({"ref": np.asarray(refs, dtype=object), "alt": np.asarray(alts, dtype=object)})
+    allele_hash = pd.util.hash_pandas_object(alleles, index=False).to_numpy() & np.uint64((1 << allele_bits) - 1)
+    keys = (
+        (np.where(valid, chrom_ids, 0).astype(np.uint64) << np.uint64(POS_BITS + allele_bits))
+        | (np.where(valid, positions, 0).astype(np.uint64) << np.uint64(allele_bits))
+        | allele_hash
+    )
+    return keys, valid
+
+
+def key_coordinates(keys, contigs):
+    """
+    Chromosome index and position packed in variant keys
+    """
+    allele_bits = 64 - POS_BITS - chrom_bits(contigs)
+    chrom_ids = (keys >> np.uint64(POS_BITS + allele_bits)).astype(np.int64)
+    positions = ((keys >> np.uint64(allele_bits)) & np.uint64((1 << POS_BITS) - 1)).astype(np.int64)
+    return chrom_ids, positions
+
+
+def build_variant_index(chromosomes, positions, refs, alts):
+    """
+    Index of variants to build once and look up many times (see in_variant_index): the contig names, the sorted
+    variant keys and the REF and ALT of each key, as keys of different alleles can share the allele hash
+    """
+    chromosomes = pd.Series(np.asarray(chromosomes, dtype=object)).map(str).to_numpy()
+    contigs = pd.unique(chromosomes).tolist()
+    keys, valid = variant_keys(chromosomes, positions, refs, alts, contigs)
+    variants = pd.DataFrame(
+        {
+            "key": keys[valid],
+            "ref": pd.Series(np.asarray(refs, dtype=object)[valid]).map(str).to_numpy(),
+            "alt": pd.Series(np.asarray(alts, dtype=object)[valid]).map(str).to_numpy(),
+        }
+    )
+    variants = variants.drop_duplicates().sort_values(["key", "ref", "alt"])
+    return {
+        "contigs": np.array(contigs, dtype=object),
+        "keys": variants["key"].to_numpy(),
+        "refs": variants["ref"].to_numpy(dtype=object),
+        "alts": variants["alt"].to_numpy(dtype=object),
+    }
+
+
+def merge_variant_indexes(indexes):
+    """
+    Variants of several indexes in one index (keys are rebuilt with a common contig list)
+    """
+    if len(indexes) == 1:
+        return indexes[0]
+    chromosomes, positions = [], []
+    for index in indexes:
+        chrom_ids, index_positions = key_coordinates(index["keys"], index["contigs"])
+        chromosomes += [index["contigs"][chrom_ids]]
+        positions += [index_positions]
+    return build_variant_index(
+        np.concatenate(chromosomes),
+        np.concatenate(positions),
+        np.concatenate([index["refs"] for index in indexes]),
+        np.concatenate([index["alts"] for index in indexes]),
+    )
+
+
+def save_variant_index(index, output):
+    with open(output, "wb") as out:
+        np.savez(
+            out,
+            contigs=index["contigs"].astype(str),
+            keys=index["keys"],
+            refs=index["refs"].astype(str),
+            alts=index["alts"].astype(str),
+            scheme=KEY_SCHEME,
+            allele_hash=allele_hash_version(),
+        )
+
+
+def read_variant_index(index_file):
+    """
+    Reads an index saved with save_variant_index. Its keys are rebuilt from the stored variants if their alleles were
+    hashed by another pandas version.
+    """
+    with np.load(index_file) as index:
+        if "scheme" not in index or index["scheme"] != KEY_SCHEME:
+            raise ValueError(f"{index_file} was built by an older version of the variant keys, please build it again")
+        variants = {
+            "contigs": index["contigs"].astype(object),
+            "keys": index["keys"],
+            "refs": index["refs"].astype(object),
+            "alts": index["alts"].astype(object),
+        }
+        allele_hash = index["allele_hash"]
+    if allele_hash != allele_hash_version():
+        print(f"[WGN] Alleles of {index_file} were hashed by another pandas version, its keys will be rebuilt")
+        chrom_ids, positions = key_coordinates(variants["keys"], variants["contigs"])
+        return build_variant_index(variants["contigs"][chrom_ids], positions, variants["refs"], variants["alts"])
+    return variants
+
+
+def load_variant_index(files, read_bed):
+    """
+    Loads variants from prebuilt indexes (.npz, see save_variant_index) and/or BED files, read with read_bed as
+    tables with chr, start, ref and alt columns. Returns them merged in one index.
+    """
+    indexes = []
+    beds = []
+    for index_file in files:
+        if index_file.endswith(".npz"):
+            indexes += [read_variant_index(index_file)]
+        else:
+            beds += [read_bed(index_file)]
+    if beds:
+        bed = pd.concat(beds)
+        indexes += [build_variant_index(bed["chr"], bed["start"], bed["ref"], bed["alt"])]
+    return merge_variant_indexes(indexes)
+
+
+def in_variant_index(index, chromosomes, positions, refs, alts):
+    """
+    True for the variants that are in the index: keys are matched with binary search and each match is confirmed
+    on the REF and ALT stored for the key
+    """
+    keys, valid = variant_keys(
+        pd.Series(np.asarray(chromosomes, dtype=object)).map(str), positions, refs, alts, index["contigs"]
+    )
+    found = np.zeros(len(keys), dtype=bool)
+    if not len(index["keys"]):
+        return found
+    first = np.minimum(np.searchsorted(index["keys"], keys), len(index["keys"]) - 1)
+    rows = np.flatnonzero(valid & (index["keys"][first] == keys))
+    candidates = pd.DataFrame(
+        {
+            "key": keys[rows],
+            "ref": pd.Series(np.asarray(refs, dtype=object)[rows]).map(str).to_numpy(),
+            "alt": pd.Series(np.asarray(alts, dtype=object)[rows]).map(str).to_numpy(),
+            "row": rows,
+        }
+    )
+    stored = pd.DataFrame({"key": index["keys"], "ref": index["refs"], "alt": index["alts"]})
+    found[candidates.merge(stored, on=["key", "ref", "alt"])["row"].to_numpy()] = True
+    return found
+
+
+def build_maf_index(maf):
+    return build_variant_index(
+        maf["Chromosome"], maf["Start_Position"], maf["Reference_Allele"], maf["Tumor_Seq_Allele2"]
+    )
+
+
+def in_maf_index(maf, index):
+    return in_variant_index(
+        index, maf["Chromosome"], maf["Start_Position"], maf["Reference_Allele"], maf["Tumor_Seq_Allele2"]
+    )
+
+
+def canonical_alleles(positions, refs, alts):
+    """
+    MAF style alleles of variants given either MAF style (- for the missing allele) or VCF style (anchor base):
+    bases shared at the end and then at the start of REF and ALT are trimmed, an insertion keeps the position of the
+    base before it (REF -) and a deletion starts at its first deleted base (ALT -).
+    Returns positions, REF and ALT arrays (SNVs and MAF style alleles are returned unchanged).
+    """
+    positions = np.asarray(positions, dtype=np.float64).copy()
+    refs, alts = np.array(refs, dtype=object), np.array(alts, dtype=object)
+    single = ["A", "C", "G", "T", "N", "-"]
+    for row in np.flatnonzero(~(pd.Series(refs).isin(single).to_numpy() & pd.Series(alts).isin(single).to_numpy())):
+        if not isinstance(refs[row], str) or not isinstance(alts[row], str):
+            continue
+        ref, alt = refs[row].strip("-."), alts[row].strip("-.")
+        suffix = 0
+        while suffix < min(len(ref), len(alt)) and ref[-1 - suffix] == alt[-1 - suffix]:
+            suffix += 1
+        ref, alt = ref[: len(ref) - suffix], alt[: len(alt) - suffix]
+        prefix = 0
+        while prefix < min(len(ref), len(alt)) and ref[prefix] == alt[prefix]:
+            prefix += 1
+        ref, alt = ref[prefix:], alt[prefix:]
+        trimmed_insertion = not ref and refs[row].strip("-.")
+        positions[row] += prefix - 1 if trimmed_insertion else prefix
+        refs[row], alts[row] = ref or "-", alt or "-"
+    return positions, refs, alts
@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+"""
+Script: Decomposes and normalises VCF files in one pass (as vt decompose followed by vt normalize -n).
+Multiallelic records are split in one record per ALT (INFO/FORMAT fields with Number=A/R/G subset, GT recoded and
+OLD_MULTIALLELIC added), then each variant is right trimmed and left aligned against the reference and left trimmed
+(OLD_VARIANT added if it changed). The reference is read in windows cached across nearby variants. Records are sorted
+per contig (left alignment can move them back) and written bgzipped and tabix indexed.
+Several VCFs (e.g. all callers of a sample) can be normalised in the same run.
+"""
+import argparse
+import gzip
+import os
+import re
+from collections import Counter, OrderedDict
+import pysam
+
+OLD_MULTIALLELIC = '##INFO=<ID=OLD_MULTIALLELIC,Number=1,Type=String,Description="Original chr:pos:ref:alt encoding">'
+OLD_VARIANT = '##INFO=<ID=OLD_VARIANT,Number=1,Type=String,Description="Original chr:pos:ref:alt encoding">'
+BASES = set("ACGTNacgtn")
+
+
+def argparser():
+    parser = argparse.ArgumentParser(description="")
+    parser.add_argument("-i", "--input", help="VCF file(s) (plain or gzipped)", nargs="+", required=True)
+    parser.add_argument("-r", "--ref", help="Reference FASTA (indexed)", required=True)
+    parser.add_argument("-p", "--prefix", help="Output prefix for each input (default: input name + suffix)", nargs="+")
+    parser.add_argument("--suffix", help="Suffix added to the input names without --prefix", default=".norm")
+    parser.add_argument("-o", "--outdir", help="Output directory", default=".")
+    parser.add_argument("--window", help="Size of the cached reference windows", type=int, default=65536)
+    return parser.parse_args()
+
+
+class ReferenceWindows:
+    """
+    Reference sequence read in fixed windows, the last max_windows are kept so nearby variants share them
+    """
+
+    def __init__(self, fasta, window=65536, max_windows=16):
+        self.fasta = pysam.FastaFile(fasta)
+        self.lengths = dict(zip(self.fasta.references, self.fasta.lengths))
+        self.window = window
+        self.max_windows = max_windows
+        self.windows = OrderedDict()
+
+    def get_window(self, chrom, index):
+        key = (chrom, index)
+        if key in self.windows:
+            self.windows.move_to_end(key)
+        else:
+            start = index * self.window
+            self.windows[key] = self.fasta.fetch(chrom, start, start + self.window).upper()
+            if len(self.windows) > self.max_windows:
+                self.windows.popitem(last=False)
+        return self.windows[key]
+
+    def fetch(self, chrom, start, end):
+        """
+        Sequence of the 0-based half-open interval
+        """
+        first, last = start // self.window, (end - 1) // self.window
+        sequence = "".join(self.get_window(chrom, index) for index in range(first, last + 1))
+        offset = start - first * self.window
+        return sequence[offset : offset + end - start]
+
+
+def header_numbers(header):
+    """
+    Number of each INFO and FORMAT field: {"INFO": {id: number}, "FORMAT": {id: number}}
+    """
+    numbers = {"INFO": {}, "FORMAT": {}}
+    for line in header:
+        for field in numbers:
+            if line.startswith(f"##{field}=<"):
+                items = dict(item.split("=", 1) for item in line[len(field) + 4 : -1].split(",") if "=" in item)
+                numbers[field][items.get("ID")] = items.get("Number")
+    return numbers
+
+
+def subset_values(values, number, allele, ploidy=2):
+    """
+    Values of a Number=A/R/G field for the biallelic record of ALT allele (1-based)
+    """
+    if values == "." or number not in ("A", "R", "G"):
+        return values
+    values = values.split(",")
+    if number == "A":
+        indexes = [allele - 1]
+    elif number == "R":
+        indexes = [0, allele]
+    elif ploidy == 1:
+        indexes = [0, allele]
+    else:
+        indexes = [0, allele * (allele + 1) // 2, allele * (allele + 1) // 2 + allele]
+    if max(indexes) >= len(values):
+        return ",".join(values)
+    return ",".join(values[index] for index in indexes)
+
+
+def subset_genotype(genotype, allele):
+    """
+    GT of the biallelic record: the ALT allele becomes 1, other ALT alleles missing
+    """
+    recoded = []
+    for part in re.split(r"([/|])", genotype):
+        if part in ("/", "|", "."):
+            recoded += [part]
+        else:
+            recoded += ["0" if part == "0" else "1" if part == str(allele) else "."]
+    return "".join(recoded)
+
+
+def decompose(fields, numbers):
+    """
+    One record (list of fields) per ALT allele
+    """
+    alts = fields[4].split(",")
+    if len(alts) == 1:
+        return [fields]
+    records = []
+    old = f"OLD_MULTIALLELIC={fields[0]}:{fields[1]}:{fields[3]}/{'/'.join(alts)}"
+    format_keys = fields[8].split(":") if len(fields) > 8 else []
+    for allele, alt in enumerate(alts, start=1):
+        info = []
+        if fields[7] != ".":
+            for item in fields[7].split(";"):
+                key, _, values = item.partition("=")
+                info += [f"{key}={subset_values(values, numbers['INFO'].get(key), allele)}" if _ else item]
+        record = fields[:4] + [alt] + fields[5:7] + [";".join(info + [old])] + fields[8:9]
+        for sample in fields[9:]:
+            values = sample.split(":")
+            ploidy = len(re.split(r"[/|]", values[0])) if format_keys[:1] == ["GT"] else 2
+            values = [
+                subset_genotype(value, allele)
+                if key == "GT"
+                else subset_values(value, numbers["FORMAT"].get(key), allele, ploidy)
+                for key, value in zip(format_keys, values)
+            ]
+            record += [":".join(values)]
+        records += [record]
+    return records
+
+
+def normalise(chrom, pos, ref, alt, reference):
+    """
+    Right trims and left aligns (extending to the left with the reference when an allele is empty) and then left trims
+    a variant. Returns the new position, REF, ALT and a status (unchanged, normalised or ref_mismatch).
+    """
+    if len(ref) == len(alt) == 1 or ref.upper() == alt.upper() or not ref or not alt:
+        return pos, ref, alt, "unchanged"
+    if not set(ref) <= BASES or not set(alt) <= BASES or chrom not in reference.lengths:
+        return pos, ref, alt, "unchanged"
+    if reference.fetch(chrom, pos - 1, pos - 1 + len(ref)) != ref.upper():
+        return pos, ref, alt, "ref_mismatch"
+    new_pos, new_ref, new_alt = pos, ref, alt
+    while new_ref[-1].upper() == new_alt[-1].upper():
+        if len(new_ref) > 1 and len(new_alt) > 1:
+            new_ref, new_alt = new_ref[:-1], new_alt[:-1]
+        elif new_pos > 1:
+            # an allele would be empty: shift one base to the left
+            new_pos -= 1
+            base = reference.fetch(chrom, new_pos - 1, new_pos)
+            new_ref, new_alt = base + new_ref[:-1], base + new_alt[:-1]
+        else:
+            break
+    while len(new_ref) > 1 and len(new_alt) > 1 and new_ref[0].upper() == new_alt[0].upper():
+        new_ref, new_alt = new_ref[1:], new_alt[1:]
+        new_pos += 1
+    if (new_pos, new_ref, new_alt) == (pos, ref, alt):
+        return pos, ref, alt, "unchanged"
+    return new_pos, new_ref, new_alt, "normalised"
+
+
+def normalise_record(fields, reference, stats):
+    pos, ref, alt = int(fields[1]), fields[3], fields[4]
+    new_pos, new_ref, new_alt, status = normalise(fields[0], pos, ref, alt, reference)
+    stats[status] += 1
+    if status == "normalised":
+        old = f"OLD_VARIANT={fields[0]}:{pos}:{ref}/{alt}"
+        info = old if fields[7] == "." else f"{fields[7]};{old}"
+        fields = [fields[0], str(new_pos), fields[2], new_ref, new_alt] + fields[5:7] + [info] + fields[8:]
+    return new_pos, fields
+
+
+def read_vcf(vcf_file):
+    opener = gzip.open if vcf_file.endswith((".gz", ".bgz")) else open
+    with opener(vcf_file, "rt") as vcf:
+        yield from vcf
+
+
+def output_prefix(vcf_file, suffix):
+    name = os.path.basename(vcf_file)
+    for extension in (".gz", ".bgz", ".vcf"):
+        if name.endswith(extension):
+            name = name[: -len(extension)]
+    return name + suffix
+
+
+def normalise_vcf(vcf_file, vcfout_file, reference):
+    """
+    Streams a VCF once writing the decomposed and normalised records, returns the stats
+    """
+    stats = Counter()
+    header = []
+    contig_records = []
+    contig = None
+    with pysam.BGZFile(vcfout_file, "wb") as vcfout:
+
+        def flush():
+            # stable sort: records at the same position keep their order
+            contig_records.sort(key=lambda record: record[0])
+            vcfout.write("".join("\t".join(fields) + "\n" for _, fields in contig_records).encode())
+            contig_records.clear()
+
+        for line in read_vcf(vcf_file):
+            if line.startswith("##"):
+                header += [line.rstrip("\n")]
+                continue
+            if line.startswith("#"):
+                numbers = header_numbers(header)
+                for extra in [OLD_MULTIALLELIC, OLD_VARIANT]:
+                    if extra not in header:
+                        header += [extra]
+                vcfout.write("".join(f"{header_line}\n" for header_line in header + [line.rstrip("\n")]).encode())
+                continue
+            fields = line.rstrip("\n").split("\t")
+            if fields[0] != contig:
+                flush()
+                contig = fields[0]
+            stats["variants"] += 1
+            records = decompose(fields, numbers)
+            stats["multiallelic" if len(records) > 1 else "biallelic"] += 1
+            stats["records"] += len(records)
+            for record in records:
+                contig_records += [normalise_record(record, reference, stats)]
+        flush()
+    pysam.tabix_index(vcfout_file, preset="vcf", force=True)
+    return stats
+
+
+def write_stats(stats, stats_file):
+    with open(stats_file, "w") as out:
+        out.write(
+            f"stats: no. variants                 : {stats['variants']}\n"
+            f"       no. biallelic                : {stats['biallelic']}\n"
+            f"       no. multiallelic             : {stats['multiallelic']}\n"
+            f"       total no. of biallelics      : {stats['records']}\n"
+            f"       no. normalised               : {stats['normalised']}\n"
+            f"       no. unchanged                : {stats['unchanged']}\n"
+            f"       no. REF inconsistent         : {stats['ref_mismatch']}\n"
+        )
+
+
+def main():
+    args = argparser()
+    prefixes = args.prefix or [output_prefix(vcf_file, args.suffix) for vcf_file in args.input]
+    if len(prefixes) != len(args.input):
+        raise ValueError("--prefix needs one prefix per input VCF")
+    reference = ReferenceWindows(args.ref, window=args.window)
+    for vcf_file, prefix in zip(args.input, prefixes):
+        vcfout_file = os.path.join(args.outdir, f"{prefix}.vcf.gz")
+        stats = normalise_vcf(vcf_file, vcfout_file, reference)
+        write_stats(stats, os.path.join(args.outdir, f"{prefix}.stats"))
+        if stats["ref_mismatch"]:
+            print(f"[WGN] {stats['ref_mismatch']} variants in {vcf_file} have a REF inconsistent with the reference")
+        print(f"- {vcf_file}: {stats['variants']} variants, {stats['normalised']} normalised. See '{vcfout_file}'.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+"""
+Script: Splits an intervals BED into scatter chunks for a number of parallel jobs.
+Intervals are packed longest-processing-time first (each interval, longest first, goes to the least loaded chunk)
+across chromosomes. The runtime of an interval is the fifth BED column if present, otherwise its length divided by
+--nucleotides_per_second. Writes one BED per chunk (intervals in input order) and a JSON plan.
+"""
+import argparse
+import heapq
+import json
+import os
+from collections import Counter
+
+
+def argparser():
+    parser = argparse.ArgumentParser(description="")
+    parser.add_argument("-i", "--intervals", help="Intervals BED (fifth column: runtime estimate)", required=True)
+    parser.add_argument("-j", "--jobs", help="Number of parallel jobs (chunks)", type=int, default=25)
+    parser.add_argument(
+        "--nucleotides_per_second", help="Runtime of intervals without estimate", type=float, default=200000
+    )
+    parser.add_argument("-o", "--outdir", help="Directory for the chunk BEDs", default=".")
+    parser.add_argument("--plan", help="JSON plan output", default="intervals_plan.json")
+    parser.add_argument("--compare", help="Also report the makespan of the previous awk chunker", action="store_true")
+    return parser.parse_args()
+
+
+def read_intervals(bed_file, nucleotides_per_second):
+    """
+    Returns the BED lines and the runtime of each interval
+    """
+    lines, runtimes = [], []
+    with open(bed_file) as bed:
+        for line in bed:
+            if not line.strip() or line.startswith(("#", "track", "browser")):
+                continue
+            fields = line.rstrip("\n").split("\t")
+            try:
+                runtime = float(fields[4])
+            except (IndexError, ValueError):
+                runtime = (int(fields[2]) - int(fields[1])) / nucleotides_per_second
+            lines += [fields]
+            runtimes += [runtime]
+    return lines, runtimes
+
+
+def lpt_chunks(runtimes, jobs):
+    """
+    Chunk of each interval: intervals are taken longest first and added to the chunk with the least runtime
+    """
+    loads = [(0.0, chunk) for chunk in range(min(jobs, len(runtimes)))]
+    chunks = [0] * len(runtimes)
+    for idx in sorted(range(len(runtimes)), key=lambda idx: -runtimes[idx]):
+        load, chunk = heapq.heappop(loads)
+        chunks[idx] = chunk
+        heapq.heappush(loads, (load + runtimes[idx], chunk))
+    return chunks
+
+
+def awk_chunks(runtimes):
+    """
+    Chunks of the previous CREATE_INTERVALS_BED awk script (consecutive intervals, a new chunk when the current one
+    is over 600s and adding the interval makes it 5% longer than its longest interval)
+    """
+    chunks, chunk, total, longest = [], -1, 0, 0
+    for runtime in runtimes:
+        if chunk < 0 or (total > 600 and total + runtime > longest * 1.05):
+            chunk, total, longest = chunk + 1, 0, 0
+        longest = max(longest, runtime)
+        total += runtime
+        chunks += [chunk]
+    return chunks
+
+
+def chunk_runtimes(chunks, runtimes):
+    totals = [0.0] * (max(chunks) + 1 if chunks else 0)
+    for chunk, runtime in zip(chunks, runtimes):
+        totals[chunk] += runtime
+    return totals
+
+
+def makespan(runtimes, jobs):
+    """
+    Wall-clock time of running chunks (or intervals) on a number of parallel jobs, started longest first as in
+    PREPARE_INTERVALS
+    """
+    loads = [0.0] * max(jobs, 1)
+    for runtime in sorted(runtimes, reverse=True):
+        heapq.heappush(loads, heapq.heappop(loads) + runtime)
+    return max(loads)
+
+
+def write_chunks(lines, chunks, outdir):
+    """
+    One BED per chunk named after its first interval (chrom_start-end, 1-based as before)
+    """
+    os.makedirs(outdir, exist_ok=True)
+    names = {}
+    for fields, chunk in zip(lines, chunks):
+        if chunk not in names:
+            names[chunk] = f"{fields[0]}_{int(fields[1]) + 1}-{fields[2]}.bed"
+    handles = {chunk: open(os.path.join(outdir, name), "w") for chunk, name in names.items()}
+    for fields, chunk in zip(lines, chunks):
+        handles[chunk].write("\t".join(fields) + "\n")
+    for handle in handles.values():
+        handle.close()
+    return names
+
+
+def main():
+    args = argparser()
+    lines, runtimes = read_intervals(args.intervals, args.nucleotides_per_second)
+    chunks = lpt_chunks(runtimes, args.jobs)
+    names = write_chunks(lines, chunks, args.outdir)
+    totals = chunk_runtimes(chunks, runtimes)
+    sizes = Counter(chunks)
+    plan = {
+        "jobs": args.jobs,
+        "intervals": len(lines),
+        "runtime": sum(runtimes),
+        "makespan": makespan(totals, args.jobs),
+        "chunks": [
+            {"bed": names[chunk], "runtime": totals[chunk], "intervals": sizes[chunk]} for chunk in sorted(names)
+        ],
+    }
+    print(f"- {len(lines)} intervals in {len(names)} chunks, expected makespan {plan['makespan']:.1f}s")
+    if args.compare:
+        awk_totals = chunk_runtimes(awk_chunks(runtimes), runtimes)
+        plan["awk_chunks"] = len(awk_totals)
+        plan["awk_makespan"] = makespan(awk_totals, args.jobs)
+        print(f"- awk chunker: {len(awk_totals)} chunks, expected makespan {plan['awk_makespan']:.1f}s")
+    with open(args.plan, "w") as plan_file:
+        json.dump(plan, plan_file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
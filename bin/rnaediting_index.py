@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Script: Index of known RNA editing sites (e.g. REDIportal) to build once per reference and reuse for every sample.
+Sites are stored in a variant index (see maf_io.build_variant_index): sorted packed variant keys looked up with binary
+search and confirmed on the REF and ALT.
+"""
+import argparse
+import pandas as pd
+import maf_io
+
+
+def argparser():
+    parser = argparse.ArgumentParser(description="")
+    parser.add_argument("--rnaedits", help="BED file(s) with known RNA editing events", nargs="+", required=True)
+    parser.add_argument("-o", "--output", help="Index output (.npz)", default="rnaedits.npz")
+    return parser.parse_args()
+
+
+def read_rnaedits_bed(bed_file):
+    """
+    Columns should be chrom, start, end, ref and alt (start is used as the variant position)
+    """
+    return pd.read_csv(bed_file, sep="\t", names=["chr", "start", "end", "ref", "alt"], header=None, comment="#")
+
+
+def load_index(files):
+    """
+    Loads RNA editing sites from prebuilt indexes (.npz) and/or BED files
+    """
+    return maf_io.load_variant_index(files, read_rnaedits_bed)
+
+
+def is_in_index(maf, index):
+    """
+    True for the MAF variants that are in the index
+    """
+    return maf_io.in_maf_index(maf, index)
+
+
+def main():
+    args = argparser()
+    index = load_index(args.rnaedits)
+    maf_io.save_variant_index(index, args.output)
+    print(f"Indexed {len(index['keys'])} RNA editing sites. See '{args.output}'.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+#!/usr/bin/env python
+"""
+Author: Raquel Manzano - @RaqManzano
+Script: Find overlaps between the calls of several variant callers (VCF/MAF) and annotate the consensus.
+Same rules and outputs as run_consensus.R: SNVs are consensus when the exact change is found at least --thr times,
+indels when they overlap (or are adjacent to) a call from another caller. All calls are sorted once by
+(chromosome, start, end) and the overlaps are found with a sweep over the sorted calls instead of comparing every
+pair of callers.
+"""
+import argparse
+import gzip
+import numpy as np
+import pandas as pd
+
+SNV = r"[0-9][ACGT]>[ACGT]$"
+META_CONSENSUS = [
+    '##INFO=<ID=callers,Number=1,Type=String,Description="Variant callers that called this mutation, separated by |">',
+    '##INFO=<ID=filters,Number=1,Type=String,Description="Filters provided by each variant caller, separated by |">',
+    '##INFO=<ID=consensus_filter,Number=1,Type=String,Description="PASS if 50% or more of the callers give the '
+    'mutation, otherwise FAIL.">',
+]
+EXTRA_COLUMNS = ["Caller", "callers", "filters", "FILTER_consensus", "isconsensus"]
+
+
+def argparser():
+    parser = argparse.ArgumentParser(description="")
+    parser.add_argument("--input", help="VCF/MAF file, once per caller", action="append", required=True)
+    parser.add_argument("--caller", help="Caller of each input (same order as --input)", action="append", required=True)
+    parser.add_argument("--out_prefix", help="Prefix for outputs", default="consensus")
+    parser.add_argument("--thr", help="Number of callers that support a SNV to be consensus", type=int, default=2)
+    parser.add_argument("--id", help="Sample id")
+    return parser.parse_args()
+
+
+def read_calls(input_file, is_vcf):
+    """
+    Reads the calls of a VCF/MAF keeping the values as text. Returns the meta lines (## or #version), the column
+    names and the table (with #CHROM, POS, REF and ALT for MAFs too).
+    """
+    opener = gzip.open if input_file.endswith(".gz") else open
+    meta = []
+    with opener(input_file, "rt") as calls:
+        for line in calls:
+            if not line.startswith("##") and not line.startswith("#version"):
+                break
+            meta += [line.rstrip("\n")]
+    calls = pd.read_csv(
+        input_file, sep="\t", skiprows=len(meta), dtype=str, keep_default_na=False, na_values=["NA"], comment=None
+    )
+    header = list(calls.columns)
+    if not is_vcf:
+        calls["#CHROM"] = calls["Chromosome"]
+        calls["POS"] = calls["Start_Position"]
+        calls["REF"] = calls["Reference_Allele"]
+        calls["ALT"] = calls["Tumor_Seq_Allele2"]
+    return meta, header, calls
+
+
+def add_ranges(calls, caller):
+    """
+    Adds the caller, DNAchange and range (start, end) of each call. Calls without REF/ALT are removed.
+    """
+    calls["Caller"] = caller
+    calls["mut"] = calls["REF"] + ">" + calls["ALT"]
+    calls["DNAchange"] = calls["#CHROM"] + ":g." + calls["POS"] + calls["REF"] + ">" + calls["ALT"]
+    ref_len, alt_len = calls["REF"].str.len(), calls["ALT"].str.len()
+    pos = pd.to_numeric(calls["POS"], errors="coerce")
+    calls["start"] = pos
+    calls["end"] = np.select(
+        [ref_len > alt_len, ref_len < alt_len, (ref_len == alt_len) & (alt_len > 1)],
+        [pos + ref_len - 1, pos + alt_len - 1, pos + ref_len],
+        pos,
+    )
+    calls.loc[ref_len.isna() | alt_len.isna(), "end"] = np.nan
+    print(f"   - Removing {calls['end'].isna().sum()} spurious calls with no alt")
+    return calls[calls["end"].notna()].reset_index(drop=True)
+
+
+def find_overlaps(chroms, starts, ends, callers):
+    """
+    For every call, whether it overlaps or is adjacent (gap of 0) to a call from another caller.
+    Calls are sorted once by (chromosome, start); for each caller the calls from the other callers are then searched
+    with the maximum end seen so far, so each caller is swept once over the merged calls.
+    """
+    chrom_codes = pd.factorize(np.asarray(chroms, dtype=object))[0].astype(np.int64)
+    shift = np.int64(1 << 32)  # calls of different chromosomes never overlap
+    starts = chrom_codes * shift + np.asarray(starts, dtype=np.int64)
+    ends = chrom_codes * shift + np.asarray(ends, dtype=np.int64)
+    callers = np.asarray(callers)
+    order = np.lexsort((ends, starts))
+    hit = np.zeros(len(starts), dtype=bool)
+    for caller in np.unique(callers):
+        others = order[callers[order] != caller]
+        if not len(others):
+            continue
+        reach = np.maximum.accumulate(ends[others])
+        query = np.flatnonzero(callers == caller)
+        last = np.searchsorted(starts[others], ends[query] + 1, side="right") - 1
+        hit[query] = (last >= 0) & (reach[np.maximum(last, 0)] >= starts[query] - 1)
+    return hit
+
+
+def overlapping_variants(muts):
+    """
+    Variants that overlap a call from another caller with the callers and filters that called them (separated by |,
+    one entry per caller and filter in caller order)
+    """
+    all_muts = pd.concat(muts.values(), ignore_index=True)
+    hit = find_overlaps(all_muts["#CHROM"], all_muts["start"], all_muts["end"], all_muts["caller_idx"])
+    overlapping = all_muts.loc[hit, ["DNAchange", "Caller", "FILTER"]].drop_duplicates()
+    overlapping["FILTER"] = overlapping["FILTER"].fillna("NA")
+    overlapping = overlapping.groupby("DNAchange", sort=False).agg(
+        callers=("Caller", "|".join), filters=("FILTER", "|".join), count=("Caller", "size")
+    )
+    return overlapping
+
+
+def consensus_variants(overlapping, thr):
+    """
+    Only SNVs with an exact match from at least thr callers are consensus, all overlapping indels are
+    """
+    is_snv = overlapping.index.str.contains(SNV)
+    snvs = overlapping.index[is_snv & (overlapping["count"] >= thr)]
+    indels = overlapping.index[~is_snv]
+    print(f"- There are {len(snvs):,} SNVs that are consensus")
+    print(f"- There are {len(indels):,} indels that are consensus")
+    return overlapping.loc[snvs.append(indels)]
+
+
+def consensus_filter(filters):
+    """
+    FAIL if more than half of the filters (separated by |) are not PASS
+    """
+    split = filters.replace("", np.nan).fillna("PASS").str.split("|", regex=False).explode()
+    fail = (split != "PASS").groupby(level=0).mean()
+    return np.where(fail > 0.5, "FAIL", "PASS")
+
+
+def annotate_calls(calls, consensus):
+    """
+    Adds the callers and filters of the consensus to the calls (their own caller and filter if not in consensus)
+    """
+    in_consensus = calls["DNAchange"].isin(consensus.index)
+    matched = consensus.reindex(calls["DNAchange"])
+    calls["callers"] = np.where(in_consensus, matched["callers"], calls["Caller"])
+    # as in run_consensus.R only the first ; of the filters is replaced
+    calls["filters"] = np.where(
+        in_consensus, matched["filters"].str.replace(";", ",", n=1, regex=False), calls["FILTER"]
+    )
+    return calls
+
+
+def upset_counts(all_muts, callers):
+    """
+    Number of variants (DNAchange) for each combination of callers, for all variants and the PASS ones (same
+    combinations as ComplexHeatmap::make_comb_mat in distinct mode)
+    """
+    counts = []
+    for variants, calls in [("all", all_muts), ("PASS", all_muts[all_muts["FILTER_consensus"] == "PASS"])]:
+        membership = pd.crosstab(calls["DNAchange"], calls["Caller"]).reindex(columns=callers, fill_value=0) > 0
+        combinations = membership.astype(int).value_counts(sort=False).rename("count").reset_index()
+        counts += [combinations.assign(variants=variants)]
+    return pd.concat(counts)[["variants"] + list(callers) + ["count"]]
+
+
+def write_summary(all_muts, callers, out_prefix):
+    """
+    Compact summary for plot_consensus.R: counts per UpSet combination and calls per caller, consensus filter and
+    whether they are consensus
+    """
+    upset_counts(all_muts, callers).to_csv(f"{out_prefix}.upset.tsv", sep="\t", index=False)
+    caller_counts = all_muts.groupby(["Caller", "FILTER_consensus", "isconsensus"]).size().rename("count")
+    caller_counts.reset_index().to_csv(f"{out_prefix}.callers.tsv", sep="\t", index=False)
+    print(f"- Summary in: {out_prefix}.upset.tsv and {out_prefix}.callers.tsv")
+
+
+def write_table(table, output, meta):
+    with open(output, "w") as out:
+        out.write("".join(f"{line}\n" for line in meta))
+    table.to_csv(output, sep="\t", index=False, na_rep="", mode="a")
+
+
+def main():
+    args = argparser()
+    inputs = dict(zip(args.caller, args.input))
+    is_vcf = args.input[0].endswith((".vcf", ".vcf.gz"))
+    out_ext = "vcf" if is_vcf else "maf"
+
+    print("- Reading calls")
+    callers_meta = {}
+    muts = {}
+    for idx, (caller, input_file) in enumerate(inputs.items()):
+        print(f"  - {input_file}")
+        meta, header, calls = read_calls(input_file, is_vcf)
+        callers_meta[caller] = {"meta": meta, "header": header}
+        if not calls.empty:
+            calls["FILTER"] = calls["FILTER"] if "FILTER" in calls.columns else np.nan
+            muts[caller] = add_ranges(calls, caller).assign(caller_idx=idx)
+
+    print("- Finding overlaps")
+    overlapping = overlapping_variants(muts) if muts else pd.DataFrame(columns=["callers", "filters", "count"])
+    consensus = consensus_variants(overlapping, args.thr)
+
+    for caller in muts:
+        print(f"- Annotating calls from {caller}")
+        muts[caller] = annotate_calls(muts[caller], consensus)
+    if muts:
+        all_muts = pd.concat(muts.values(), ignore_index=True)
+    else:
+        all_muts = pd.DataFrame(columns=["Caller", "DNAchange", "callers", "filters"], dtype=object)
+    all_muts = all_muts.drop(columns="caller_idx", errors="ignore")
+    # Remove duplication if consensus input came annotated with more than one caller
+    is_consensus_input = all_muts["Caller"].str.contains("consensus", case=False)
+    all_muts = pd.concat(
+        [all_muts[~is_consensus_input], all_muts[is_consensus_input].drop_duplicates(subset="DNAchange")]
+    ).reset_index(drop=True)
+
+    print("- Preparing output")
+    all_muts["FILTER_consensus"] = consensus_filter(all_muts["filters"])
+    all_muts["INFO_consensus"] = (
+        "callers="
+        + all_muts["callers"]
+        + ";filters="
+        + all_muts["filters"].fillna("NA")
+        + ";consensus_filter="
+        + all_muts["FILTER_consensus"]
+    )
+    all_muts["isconsensus"] = np.where(all_muts["callers"].str.contains("|", regex=False), "TRUE", "FALSE")
+
+    for caller in inputs:
+        header = callers_meta[caller]["header"]
+        caller_muts = all_muts[all_muts["Caller"] == caller]
+        if is_vcf:
+            meta = callers_meta[caller]["meta"] + META_CONSENSUS
+            to_write = caller_muts.reindex(columns=header)
+            to_write["INFO"] = to_write["INFO"] + ";" + caller_muts["INFO_consensus"]
+        else:
+            if "Caller" not in header:
+                header += EXTRA_COLUMNS
+            meta = ["#version 2.4"]
+            to_write = caller_muts.reindex(columns=header)
+        output = f"{args.out_prefix}_{caller}.{out_ext}"
+        write_table(to_write, output, meta)
+        print(f" - Output in: {output}")
+
+    # Final consensus
+    consensus_muts = all_muts[all_muts["isconsensus"] == "TRUE"].drop_duplicates()
+    if is_vcf:
+        contigs_meta = [line for line in callers_meta[args.caller[0]]["meta"] if line.startswith("##contig")]
+        meta = (
+            [
+                "##fileformat=VCFv4.2",
+                f"##source=Consensus{len(inputs)}Callers ({','.join(inputs)})",
+            ]
+            + contigs_meta
+            + [
+                '##FILTER=<ID=PASS,Description="All filters passed">',
+                '##FILTER=<ID=FAIL,Description="More than half the callers did not give a PASS">',
+            ]
+            + META_CONSENSUS
+        )
+        consensus_muts = consensus_muts.assign(
+            ID=consensus_muts["DNAchange"],
+            QUAL=".",
+            INFO=consensus_muts["INFO_consensus"],
+            FORMAT=".",
+            FILTER=consensus_muts["FILTER_consensus"],
+        )
+        columns = ["#CHROM", "POS", "ID", "REF", "ALT", "QUAL", "FILTER", "INFO", "FORMAT"]
+    else:
+        meta = ["#version 2.4"]
+        columns = header  # any caller header is fine
+    consensus_muts = consensus_muts.reindex(columns=columns)
+    print(f"- Total variants {consensus_muts.shape[0]:,}")
+    print(f"- Variants in consensus {all_muts[all_muts['isconsensus'] == 'TRUE']['DNAchange'].nunique():,}")
+    output = f"{args.out_prefix}.{out_ext}"
+    write_table(consensus_muts, output, meta)
+    print(f"- Output in: {output}")
+    write_summary(all_muts, list(inputs), args.out_prefix)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Script: Per stage metrics of the bin/ scripts (--metrics-json): wall time, CPU time (children included), peak RSS
+increase and rows of each stage, written as a MultiQC custom content table (name the file *_mqc.json so MultiQC picks
+it up). The peak RSS of a process only grows, so a stage reports how much it raised it: a stage that stays below the
+peak of an earlier stage reports 0, and a stage run inside another one also counts for the outer stage.
+"""
+import contextlib
+import json
+import os
+import resource
+import time
+
+
+def cpu_seconds():
+    usage = [resource.getrusage(who) for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)]
+    return sum(rusage.ru_utime + rusage.ru_stime for rusage in usage)
+
+
+def peak_rss_mb():
+    usage = [resource.getrusage(who) for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)]
+    return max(rusage.ru_maxrss for rusage in usage) / 1024  # KB on Linux
+
+
+class Metrics:
+    """
+    Collects the metrics of the stages of a script. A stage run several times (e.g. once per chunk) adds up, and the
+    time of a stage run inside another one only counts for the inner stage.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.running = []
+
+    @contextlib.contextmanager
+    def stage(self, name, rows=None):
+        """
+        Measures the block as stage name, rows can be set in the yielded record
+        """
+        record = {"rows": rows, "calls": 1, "nested_wall": 0.0, "nested_cpu": 0.0}
+        self.running += [record]
+        wall, cpu, peak = time.perf_counter(), cpu_seconds(), peak_rss_mb()
+        try:
+            yield record
+        finally:
+            wall, cpu = time.perf_counter() - wall, cpu_seconds() - cpu
+            self.running.pop()
+            if self.running:
+                self.running[-1]["nested_wall"] += wall
+                self.running[-1]["nested_cpu"] += cpu
+            stage = self.stages.setdefault(
+                name, {"calls": 0, "rows": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0, "peak_rss_increase_mb": 0.0}
+            )
+            stage["calls"] += record["calls"]
+            stage["rows"] += record["rows"] or 0
+            stage["wall_seconds"] += wall - record["nested_wall"]
+            stage["cpu_seconds"] += cpu - record["nested_cpu"]
+            stage["peak_rss_increase_mb"] = max(stage["peak_rss_increase_mb"], peak_rss_mb() - peak)
+
+    def __call__(self, name, function, *args, **kwargs):
+        """
+        Runs function as stage name, the rows are those of the table it returns
+        """
+        with self.stage(name) as record:
+            result = function(*args, **kwargs)
+            record["rows"] = len(result) if hasattr(result, "__len__") else None
+        return result
+
+    def iterate(self, name, chunks):
+        """
+        Yields the chunks of an iterator measuring the time to get each one as stage name
+        """
+        chunks = iter(chunks)
+        while True:
+            with self.stage(name) as record:
+                chunk = next(chunks, None)
+                record["rows"], record["calls"] = (0, 0) if chunk is None else (len(chunk), 1)
+            if chunk is None:
+                return
+            yield chunk
+
+
+def sample_name(output):
+    """
+    Name of an output file without directory and extensions (.maf, .gz...) to label its metrics
+    """
+    name = os.path.basename(output)
+    for extension in (".gz", ".maf", ".vcf"):
+        name = name[: -len(extension)] if name.endswith(extension) else name
+    return name
+
+
+def write_json(samples, output, section_id, section_name):
+    """
+    Writes the stages of each sample ({sample: Metrics.stages}) as a MultiQC custom content table with one row per
+    sample and stage
+    """
+    data = {}
+    for sample, stages in samples.items():
+        for name, stage in stages.items():
+            data[f"{sample} {name}"] = {
+                "sample": sample,
+                "stage": name,
+                "calls": stage["calls"],
+                "rows": stage["rows"],
+                "wall_seconds": round(stage["wall_seconds"], 4),
+                "cpu_seconds": round(stage["cpu_seconds"], 4),
+                "peak_rss_increase_mb": round(stage["peak_rss_increase_mb"], 1),
+                "rows_per_second": round(stage["rows"] / stage["wall_seconds"]) if stage["wall_seconds"] > 0 else 0,
+            }
+    table = {
+        "id": section_id,
+        "section_name": section_name,
+        "description": "Wall time, CPU time, increase in peak RSS and rows processed by each stage of the script.",
+        "plot_type": "table",
+        "pconfig": {"id": f"{section_id}_table", "title": section_name, "sortRows": False},
+        "headers": {
+            "sample": {"title": "Sample"},
+            "stage": {"title": "Stage"},
+            "calls": {"title": "Calls", "description": "Times the stage ran (e.g. chunks)", "format": "{:,.0f}"},
+            "rows": {"title": "Rows", "description": "Rows processed", "format": "{:,.0f}"},
+            "wall_seconds": {"title": "Wall (s)", "description": "Wall time", "format": "{:,.2f}"},
+            "cpu_seconds": {"title": "CPU (s)", "description": "CPU time, children included", "format": "{:,.2f}"},
+            "peak_rss_increase_mb": {
+                "title": "Peak RSS increase (MB)",
+                "description": "Increase in the peak RSS of the process during the stage (largest of its calls)",
+            },
+            "rows_per_second": {"title": "Rows/s", "format": "{:,.0f}"},
+        },
+        "data": data,
+    }
+    with open(output, "w") as out:
+        json.dump(table, out, indent=2)
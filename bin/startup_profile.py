@@ -0,0 +1,62 @@
+"""
+Script: Startup profile of the bin/ scripts (--profile-startup): import time of each module a script imports, taken
+from python -X importtime in a fresh interpreter, and the time of its initialisation steps (reference, indexes...).
+Heavy dependencies (pysam, capy) should be imported inside the functions that use them so they are not listed here.
+"""
+import os
+import subprocess
+import sys
+import time
+
+
+def import_times(script):
+    """
+    Seconds to import a script and each module it imports directly: [(module, seconds)], script last
+    """
+    module = os.path.splitext(os.path.basename(script))[0]
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(script)))
+    importtime = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"], env=env, capture_output=True, text=True
+    )
+    if importtime.returncode:
+        errors = "\n".join(line for line in importtime.stderr.splitlines() if not line.startswith("import time:"))
+        sys.exit(f"[ERROR] {module} could not be imported to profile its startup:\n{errors}")
+    # lines are "import time: self | cumulative | name" with the name indented by two spaces per nesting level,
+    # direct imports of the script come before it at level 1
+    lines = [line.split("|") for line in importtime.stderr.splitlines() if line.startswith("import time:")][1:]
+    script_lines = [index for index, line in enumerate(lines) if line[2].strip() == module]
+    if not script_lines:
+        sys.exit(f"[ERROR] python -X importtime did not report the import of {module}, it may be imported at startup")
+    script_line = max(script_lines)
+    start = max([index for index, line in enumerate(lines[:script_line]) if not line[2].startswith("  ")] + [-1]) + 1
+    times = []
+    for _self_time, cumulative, name in lines[start : script_line + 1]:
+        if len(name) - len(name.lstrip(" ")) <= 3:
+            times += [(name.strip(), int(cumulative) / 1e6)]
+    return times
+
+
+class Timer:
+    """
+    Collects the time of the initialisation steps of a script
+    """
+
+    def __init__(self):
+        self.steps = []
+
+    def __call__(self, step, function, *args, **kwargs):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        self.steps += [(step, time.perf_counter() - start)]
+        return result
+
+
+def report(script, timer=None):
+    print(f"Startup profile of {os.path.basename(script)}")
+    print("import\tseconds")
+    for module, seconds in import_times(script):
+        print(f"{module}\t{seconds:.4f}")
+    if timer and timer.steps:
+        print("initialisation\tseconds")
+        for step, seconds in timer.steps:
+            print(f"{step}\t{seconds:.4f}")
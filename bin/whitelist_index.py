@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Script: Index of whitelisted variants (e.g. hotspots) to build once per reference and reuse for every sample.
+Variants are normalised to MAF style alleles (see maf_io.canonical_alleles) so VCF style (anchored) and MAF style (-)
+indels match, and stored in a variant index (see maf_io.build_variant_index): sorted packed variant keys looked up with
+binary search and confirmed on the canonical REF and ALT.
+"""
+import argparse
+import pandas as pd
+import maf_io
+
+
+def argparser():
+    parser = argparse.ArgumentParser(description="")
+    parser.add_argument(
+        "--whitelist",
+        help="BED file(s) with variants (CHROM POS REF ALT or CHROM START END REF ALT)",
+        nargs="+",
+        required=True,
+    )
+    parser.add_argument("-o", "--output", help="Index output (.npz)", default="whitelist.npz")
+    return parser.parse_args()
+
+
+def read_whitelist_bed(bed_file):
+    """
+    Columns should be chrom, start, end, ref and alt or chrom, pos, ref and alt (start is used as the variant position)
+    """
+    bed = pd.read_csv(bed_file, sep="\t", comment="#", header=None, dtype={0: str})
+    if len(bed.columns) == 5:
+        bed.columns = ["chr", "start", "end", "ref", "alt"]
+    elif len(bed.columns) == 4:
+        bed.columns = ["chr", "start", "ref", "alt"]
+    else:
+        raise ValueError(
+            f"BED file for whitelist should contain CHROM, START, END, REF and ALT (or CHROM, POS, REF, ALT) columns "
+            f"with no headers. Please check your file: {bed_file}"
+        )
+    if not pd.api.types.is_integer_dtype(bed["start"]):
+        raise ValueError(f"Positions of the whitelist should be integers. Please check your file: {bed_file}")
+    return bed[["chr", "start", "ref", "alt"]]
+
+
+def read_canonical_bed(bed_file):
+    """
+    Whitelisted variants of a BED file with MAF style alleles
+    """
+    bed = read_whitelist_bed(bed_file)
+    positions, refs, alts = maf_io.canonical_alleles(bed["start"], bed["ref"], bed["alt"])
+    return pd.DataFrame({"chr": bed["chr"].to_numpy(), "start": positions, "ref": refs, "alt": alts})
+
+
+def load_index(files):
+    """
+    Loads whitelisted variants from prebuilt indexes (.npz) and/or BED files
+    """
+    return maf_io.load_variant_index(files, read_canonical_bed)
+
+
+def is_whitelisted(maf, index):
+    """
+    True for the MAF variants that are in the index
+    """
+    positions, refs, alts = maf_io.canonical_alleles(
+        maf["Start_Position"], maf["Reference_Allele"], maf["Tumor_Seq_Allele2"]
+    )
+    return maf_io.in_variant_index(index, maf["Chromosome"], positions, refs, alts)
+
+
+def main():
+    args = argparser()
+    index = load_index(args.whitelist)
+    maf_io.save_variant_index(index, args.output)
+    print(f"Indexed {len(index['keys'])} whitelisted variants. See '{args.output}'.")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,8 +2,10 @@ process RUN_CONSENSUS {
     tag "$meta.id"
     label 'process_low'
 
-    conda "bioconda::bioconductor-rtracklayer bioconda::bioconductor-complexheatmap conda-forge::r-ggrepel conda-forge::r-data.table conda-forge::r-dplyr conda-forge::ggpubr "
-    container 'ghcr.io/raqmanzano/renv:latest'
+    conda "anaconda::pandas=1.4.3"
+    container "${ workflow.containerEngine == 'singularity' && !task.ext.singularity_pull_docker_container ?
+        'https://depot.galaxyproject.org/singularity/mulled-v2-629aec3ba267b06a1efc3ec454c0f09e134f6ee2:3b083bb5eae6e491b8579589b070fa29afbea2a1-0' :
+        'biocontainers/mulled-v2-629aec3ba267b06a1efc3ec454c0f09e134f6ee2:3b083bb5eae6e491b8579589b070fa29afbea2a1-0' }"
 
     input:
         tuple val(meta), path(vcf), val(caller)
@@ -13,7 +15,7 @@ process RUN_CONSENSUS {
         tuple val(meta), path('*.consensus_*.vcf'), val(caller) , optional:true , emit: vcf_separate
         tuple val(meta), path('*.consensus.maf')                , optional:true , emit: maf
         tuple val(meta), path('*.consensus_*.maf'), val(caller) , optional:true , emit: maf_separate
-        path("*.pdf")                                           , optional:true , emit: pdf
+        tuple val(meta), path('*.upset.tsv'), path('*.callers.tsv'), optional:true , emit: summary
         path "versions.yml"                                                     , emit: versions
 
     when:
@@ -26,10 +28,10 @@ process RUN_CONSENSUS {
         def caller_list = caller.collect{ "--caller=$it"}.join(' ')
 
         """
-        run_consensus.R ${input_list} ${caller_list} --out_prefix=${prefix}.consensus --cpu=$task.cpus $args
+        run_consensus.py ${input_list} ${caller_list} --out_prefix=${prefix}.consensus $args
         cat <<-END_VERSIONS > versions.yml
         "${task.process}":
-            R: \$(echo \$(R --version 2>&1) | head -n 1)
+            python: \$(echo \$(python --version 2>&1) | sed 's/^.*Python (//;s/).*//')
         END_VERSIONS
         """
 }
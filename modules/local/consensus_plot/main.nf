@@ -0,0 +1,28 @@
+process CONSENSUS_PLOT {
+    tag "$meta.id"
+    label 'process_single'
+
+    conda "bioconda::bioconductor-complexheatmap conda-forge::r-ggrepel conda-forge::r-data.table conda-forge::ggpubr "
+    container 'ghcr.io/raqmanzano/renv:latest'
+
+    input:
+        tuple val(meta), path(upset), path(callers)
+
+    output:
+        path("*.pdf")      , optional:true , emit: pdf
+        path "versions.yml"                , emit: versions
+
+    when:
+        task.ext.when == null || task.ext.when
+
+    script: // This script is bundled with the pipeline, in nf-core/rnadnavar/bin/
+        def args = task.ext.args ?: ''
+        def prefix = task.ext.prefix ?: "${meta.id}"
+        """
+        plot_consensus.R --upset=$upset --callers=$callers --id=${meta.id} --out=${prefix}.consensus.pdf $args
+        cat <<-END_VERSIONS > versions.yml
+        "${task.process}":
+            R: \$(echo \$(R --version 2>&1) | head -n 1)
+        END_VERSIONS
+        """
+}
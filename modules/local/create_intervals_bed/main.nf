@@ -1,17 +1,18 @@
 process CREATE_INTERVALS_BED {
     tag "$intervals"
 
-    conda "anaconda::gawk=5.1.0"
+    conda "anaconda::gawk=5.1.0 conda-forge::python=3.9"
     container "${ workflow.containerEngine == 'singularity' && !task.ext.singularity_pull_docker_container ?
-        'https://depot.galaxyproject.org/singularity/gawk:5.1.0' :
-        'biocontainers/gawk:5.1.0' }"
+        'https://depot.galaxyproject.org/singularity/python:3.9--1' :
+        'biocontainers/python:3.9--1' }"
 
     input:
     path(intervals)
 
     output:
-    path("*.bed")       , emit: bed
-    path "versions.yml" , emit: versions
+    path("*.bed")                                 , emit: bed
+    path("intervals_plan.json") , optional: true  , emit: plan
+    path "versions.yml"                           , emit: versions
 
     when:
     task.ext.when == null || task.ext.when
@@ -19,30 +20,18 @@ process CREATE_INTERVALS_BED {
     script:
     // If intervals file is in BED format,
     // Fifth column is interpreted to contain runtime estimates
-    // Which is then used to combine short-running jobs
+    // Intervals are packed longest first into gatk_interval_scatter_count chunks of similar runtime
     if (intervals.toString().toLowerCase().endsWith("bed")) {
         """
-        awk -vFS="\t" '{
-            t = \$5  # runtime estimate
-            if (t == "") {
-                # no runtime estimate in this row, assume default value
-                t = (\$3 - \$2) / ${params.nucleotides_per_second}
-            }
-            if (name == "" || (chunk > 600 && (chunk + t) > longest * 1.05)) {
-                # start a new chunk
-                name = sprintf("%s_%d-%d.bed", \$1, \$2+1, \$3)
-                chunk = 0
-                longest = 0
-            }
-            if (t > longest)
-                longest = t
-            chunk += t
-            print \$0 > name
-        }' ${intervals}
+        plan_intervals.py \\
+            --intervals ${intervals} \\
+            --jobs ${params.gatk_interval_scatter_count} \\
+            --nucleotides_per_second ${params.nucleotides_per_second} \\
+            --plan intervals_plan.json
 
         cat <<-END_VERSIONS > versions.yml
         "${task.process}":
-            gawk: \$(awk -Wversion | sed '1!d; s/.*Awk //; s/,.*//')
+            python: \$(echo \$(python --version 2>&1) | sed 's/^.*Python (//;s/).*//')
         END_VERSIONS
         """
     } else if (intervals.toString().toLowerCase().endsWith("interval_list")) {
@@ -0,0 +1,43 @@
+process EXTRACT_READS {
+    tag "$meta.id"
+    label 'process_low'
+
+    conda "bioconda::pysam=0.19.1"
+    container "${ workflow.containerEngine == 'singularity' && !task.ext.singularity_pull_docker_container ?
+        'https://depot.galaxyproject.org/singularity/mulled-v2-629aec3ba267b06a1efc3ec454c0f09e134f6ee2:3b083bb5eae6e491b8579589b070fa29afbea2a1-0' :
+        'biocontainers/mulled-v2-629aec3ba267b06a1efc3ec454c0f09e134f6ee2:3b083bb5eae6e491b8579589b070fa29afbea2a1-0' }"
+
+    input:
+    tuple val(meta), path(input), path(index), path(bed)
+    path fasta
+    path fasta_fai
+
+    output:
+    tuple val(meta), path("*_{1,2}.fastq.gz"), emit: reads
+    tuple val(meta), path("*_IDs_all.txt")   , emit: read_ids
+    path "versions.yml"                      , emit: versions
+
+    when:
+    task.ext.when == null || task.ext.when
+
+    script: // This script is bundled with the pipeline, in nf-core/rnadnavar/bin/
+    def args = task.ext.args ?: ''
+    def prefix = task.ext.prefix ?: "${meta.id}"
+    """
+    extract_reads.py \\
+        --input $input \\
+        --index $index \\
+        --bed $bed \\
+        --reference $fasta \\
+        --prefix $prefix \\
+        --threads $task.cpus \\
+        --read_ids ${prefix}_IDs_all.txt \\
+        $args
+
+    cat <<-END_VERSIONS > versions.yml
+    "${task.process}":
+        python: \$(echo \$(python --version 2>&1) | sed 's/^.*Python (//;s/).*//')
+        pysam: \$(python -c "import pysam; print(pysam.__version__)")
+    END_VERSIONS
+    """
+}
@@ -9,6 +9,7 @@ process MAF2BED {
 
     input:
     tuple val(meta), path(maf)
+    path fasta_fai
 
     output:
     tuple val(meta), path('*.bed') , emit: bed
@@ -22,12 +23,15 @@ process MAF2BED {
     def prefix = task.ext.prefix ?: "${meta.id}"
 
     """
-#!/usr/bin/env python
-import subprocess
-import pandas as pd
-maf = pd.read_csv("${maf}", sep="\\t", comment="#")
-bed = maf[["Chromosome", "Start_Position", "End_Position"]]
-bed.to_csv("${prefix}.bed", sep="\\t", index=False, header=False)
-subprocess.check_call('cat <<-END_VERSIONS > versions.yml\\n\\"${task.process}\\":\\n\tpython: \$(echo \$(python --version 2>&1) | sed \\"s/^.*Python (//;s/).*//\\")\\nEND_VERSIONS', shell=True)
+    maf2bed.py \\
+        --mafin $maf \\
+        --bedout ${prefix}.bed \\
+        --fai $fasta_fai \\
+        $args
+
+    cat <<-END_VERSIONS > versions.yml
+    "${task.process}":
+        python: \$(echo \$(python --version 2>&1) | sed 's/^.*Python (//;s/).*//')
+    END_VERSIONS
     """
 }
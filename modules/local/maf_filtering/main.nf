@@ -10,10 +10,13 @@ process MAF_FILTERING {
     input:
     tuple val(meta), path(maf)
     path fasta
+    path annotation_cache
 
     output:
-    tuple val(meta), path('*.maf'), emit: maf
-    path "versions.yml"           , emit: versions
+    tuple val(meta), path('*.maf')       , emit: maf
+    path "*.{annotations.parquet,reference.digest}", emit: cache, optional: true
+    path "*_mqc.json"                    , emit: metrics
+    path "versions.yml"                  , emit: versions
 
     when:
     task.ext.when == null || task.ext.when
@@ -21,9 +24,10 @@ process MAF_FILTERING {
     script: // This script is bundled with the pipeline, in nf-core/rnadnavar/bin/
     def args = task.ext.args ?: ''
     def prefix = task.ext.prefix ?: "${meta.id}"
+    def cache = annotation_cache ? "--cache_dir ${annotation_cache}" : ""
 
     """
-    filter_mutations.py -i $maf --output ${prefix}.maf --ref $fasta $args
+    filter_mutations.py -i $maf --output ${prefix}.maf --ref $fasta --metrics-json ${prefix}.metrics_mqc.json $cache $args
     cat <<-END_VERSIONS > versions.yml
     "${task.process}":
         python: \$(echo \$(python --version 2>&1) | sed 's/^.*Python (//;s/).*//')
@@ -12,6 +12,7 @@ process RNA_FILTERING {
 
     output:
         tuple val(meta), path('*.maf'), emit: maf
+        path "*_mqc.json"             , emit: metrics
         path "versions.yml"           , emit: versions
 
     when:
@@ -26,6 +27,8 @@ process RNA_FILTERING {
             --maf $maf \\
             --ref $fasta \\
             --output ${prefix}.maf \\
+            --threads $task.cpus \\
+            --metrics-json ${prefix}.metrics_mqc.json \\
             $maf_realign_opt \\
             $args
         cat <<-END_VERSIONS > versions.yml
@@ -0,0 +1,40 @@
+process NORMALISE_VCF {
+    tag "$meta.id"
+    label 'process_single'
+
+    conda "bioconda::pysam=0.19.1"
+    container "${ workflow.containerEngine == 'singularity' && !task.ext.singularity_pull_docker_container ?
+        'https://depot.galaxyproject.org/singularity/mulled-v2-629aec3ba267b06a1efc3ec454c0f09e134f6ee2:3b083bb5eae6e491b8579589b070fa29afbea2a1-0' :
+        'biocontainers/mulled-v2-629aec3ba267b06a1efc3ec454c0f09e134f6ee2:3b083bb5eae6e491b8579589b070fa29afbea2a1-0' }"
+
+    input:
+    tuple val(meta), path(vcf)
+    tuple val(meta1), path(fasta)
+    path fasta_fai
+
+    output:
+    tuple val(meta), path("*.vcf.gz")    , emit: vcf
+    tuple val(meta), path("*.vcf.gz.tbi"), emit: tbi
+    path "*.stats"                       , emit: stats
+    path "versions.yml"                  , emit: versions
+
+    when:
+    task.ext.when == null || task.ext.when
+
+    script: // This script is bundled with the pipeline, in nf-core/rnadnavar/bin/
+    def args = task.ext.args ?: ''
+    def prefix = task.ext.prefix ?: "${meta.id}"
+    """
+    normalise_vcf.py \\
+        --input $vcf \\
+        --ref $fasta \\
+        --prefix $prefix \\
+        $args
+
+    cat <<-END_VERSIONS > versions.yml
+    "${task.process}":
+        python: \$(echo \$(python --version 2>&1) | sed 's/^.*Python (//;s/).*//')
+        pysam: \$(python -c "import pysam; print(pysam.__version__)")
+    END_VERSIONS
+    """
+}
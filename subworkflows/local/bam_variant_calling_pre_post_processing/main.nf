@@ -103,6 +103,7 @@ workflow BAM_VARIANT_CALLING_PRE_POST_PROCESSING {
                     vcf_to_normalise,
                     // Remap channel to match module/subworkflow
                     fasta.map{ it -> [ [ id:'fasta' ], it ] },
+                    fasta_fai,
                     input_sample,
                     realignment
                     )
@@ -146,6 +147,7 @@ workflow BAM_VARIANT_CALLING_PRE_POST_PROCESSING {
     // STEP 7: FILTERING
     MAF_FILTERING(maf_to_filter, fasta, input_sample, realignment)
     filtered_maf = MAF_FILTERING.out.maf
+    reports      = reports.mix(MAF_FILTERING.out.reports)
     versions     = versions.mix(MAF_FILTERING.out.versions)
 
 
@@ -16,6 +16,7 @@ workflow MAF_FILTERING {
     main:
     versions  = Channel.empty()
     maf       = Channel.empty()
+    reports   = Channel.empty()
     if ((params.step in ['mapping', 'markduplicates', 'splitncigar',
                 'prepare_recalibration', 'recalibrate', 'variant_calling', 'annotate',
                 'normalise', 'consensus', 'filtering'] &&
@@ -23,13 +24,20 @@ workflow MAF_FILTERING {
                 realignment) {
 
         if (params.step == 'filtering') maf_to_filter = input_sample
+        // annotations cached by previous runs (only the thresholds changed): the cache directory is staged as one
+        // path and each task only reads the files of its own MAF from it
+        annotation_cache = params.filtering_cache && file(params.filtering_cache).exists() ?
+            Channel.value(file(params.filtering_cache)) :
+            Channel.value([])
         // BASIC FILTERING
-        FILTERING(maf_to_filter, fasta)
+        FILTERING(maf_to_filter, fasta, annotation_cache)
         maf      = FILTERING.out.maf
+        reports  = reports.mix(FILTERING.out.metrics)
         versions = versions.mix(FILTERING.out.versions)
     }
 
     emit:
     maf        = maf
+    reports    = reports                                                          // channel: [ *_mqc.json ]
     versions   = versions                                                         // channel: [ versions.yml ]
 }
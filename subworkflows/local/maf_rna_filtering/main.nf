@@ -13,6 +13,7 @@ workflow MAF_FILTERING_RNA {
 
     main:
     versions = Channel.empty()
+    reports  = Channel.empty()
     maf_to_filter.dump(tag:"maf_to_filter")
     maf_to_filter_realigned.dump(tag:"maf_to_filter_realigned")
     if (params.step in ['mapping', 'markduplicates', 'splitncigar',
@@ -64,11 +65,13 @@ workflow MAF_FILTERING_RNA {
         RNA_FILTERING(maf_crossed,
                     fasta,
                     fasta_fai)
+        reports  = reports.mix(RNA_FILTERING.out.metrics)
         versions = versions.mix(RNA_FILTERING.out.versions)
     }
 
 
     emit:
+        reports             = reports  // channel: [ *_mqc.json ]
         versions            = versions // channel: [ versions.yml ]
 
 
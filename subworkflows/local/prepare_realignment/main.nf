@@ -2,14 +2,8 @@
 // PREPARE SECOND RUN: extract reads from candidate regions for re-alignment (RNA and DNA normal only)
 //
 include { MAF2BED                                      } from '../../../modules/local/maf2bed/main'
-// Extract read ids for selected regions
-include { SAMTOOLS_EXTRACT_READ_IDS                    } from '../../../modules/local/extract_reads_id/main'
-// Filter bam for selected regions
-include { PICARD_FILTERSAMREADS                        } from '../../../modules/nf-core/picard/filtersamreads/main'
-// Convert BAM files to FASTQ files
-include { BAM_CONVERT_SAMTOOLS as CONVERT_FASTQ_INPUT  } from '../bam_convert_samtools/main'
-// Conver CRAM to BAM (picard/filtersamreads can't work with cram)
-include { SAMTOOLS_CONVERT as CONVERT_CRAM2BAM         } from '../../../modules/nf-core/samtools/convert/main'
+// Extract read pairs of the selected regions to FASTQ
+include { EXTRACT_READS                                } from '../../../modules/local/extract_reads/main'
 // Realignment with HISAT2
 include { FASTQ_ALIGN_HISAT2                            } from '../../nf-core/fastq_align_hisat2/main'
 
@@ -102,28 +96,13 @@ workflow BAM_EXTRACT_READS_HISAT2_ALIGN {
             // Get candidate regions
             // Add files to meta to keep them for next processes
             maf_to_bed = cram_to_realign.map{meta, cram, crai, maf -> [meta + [cram_file:cram, crai_file:crai, maf_file:maf], maf]}
-            MAF2BED(maf_to_bed)
-            // Extract read names with regions from bed
+            MAF2BED(maf_to_bed, fasta_fai)
+            // Extract read pairs with regions from bed (index fetches, no full pass over the CRAM/BAM)
             cram_to_extract = MAF2BED.out.bed.map{meta, bed -> [meta, meta.cram_file, meta.crai_file, bed]}
-            SAMTOOLS_EXTRACT_READ_IDS(cram_to_extract)
-            // Extract reads
-            cram_to_convert = SAMTOOLS_EXTRACT_READ_IDS.out.read_ids.map{meta, readsid -> [meta + [readsid_file:readsid], meta.cram_file, meta.crai_file]}
-            // 1) Convert cram 2 bam
-            CONVERT_CRAM2BAM(cram_to_convert, fasta, fasta_fai)
-            bam_to_filter = CONVERT_CRAM2BAM.out.alignment_index.map{meta, bam, bai -> [meta, bam, meta.readsid_file]}
-            // 2) Apply picard filtersamreads
-            PICARD_FILTERSAMREADS(bam_to_filter, fasta,'includeReadList') // bam -> filtered_bam
-            // Conver to FQ
-            bam_to_fq = PICARD_FILTERSAMREADS.out.bam.join(PICARD_FILTERSAMREADS.out.bai)
-            interleave_input = false // Currently don't allow interleaved input
-            CONVERT_FASTQ_INPUT(
-                                bam_to_fq,
-                                fasta.map{it -> [ [ id:"fasta" ], it ]}, // fasta
-                                fasta_fai.map{it -> [ [ id:"fasta_fai" ], it ]},  // fasta_fai
-                                interleave_input
-                                )
+            EXTRACT_READS(cram_to_extract, fasta, fasta_fai)
+            versions = versions.mix(MAF2BED.out.versions, EXTRACT_READS.out.versions)
             // Align with HISAT2
-            reads_for_realignment = CONVERT_FASTQ_INPUT.out.reads
+            reads_for_realignment = EXTRACT_READS.out.reads
             reads_for_realignment.map{meta, reads -> [meta + [single_end:se], reads]}.dump(tag:"reads_for_realignmentHISAT2")
             hisat2_index.dump(tag:"HISAT2index")
             splicesites.dump(tag:"HISAT2splicesites")
@@ -6,6 +6,8 @@
 include { VCF2MAF                                  } from '../../../modules/local/vcf2maf/vcf2maf/main'
 include { RUN_CONSENSUS                            } from '../../../modules/local/consensus/main'
 include { RUN_CONSENSUS as RUN_CONSENSUS_RESCUE    } from '../../../modules/local/consensus/main'
+include { CONSENSUS_PLOT                           } from '../../../modules/local/consensus_plot/main'
+include { CONSENSUS_PLOT as CONSENSUS_PLOT_RESCUE  } from '../../../modules/local/consensus_plot/main'
 // Create samplesheets to restart from consensus
 include { CHANNEL_CONSENSUS_CREATE_CSV                 } from '../channel_consensus_create_csv/main'
 include { CHANNEL_CONSENSUS_CREATE_CSV as CHANNEL_RESCUE_CREATE_CSV                 } from '../channel_consensus_create_csv/main'
@@ -62,6 +64,9 @@ workflow VCF_CONSENSUS {
         maf_to_consensus.dump(tag:"maf_to_consensus1")
         // Run consensus on VCF with same id
         RUN_CONSENSUS ( maf_to_consensus )
+        // Optional report from the consensus summary
+        CONSENSUS_PLOT ( RUN_CONSENSUS.out.summary )
+        versions = versions.mix(CONSENSUS_PLOT.out.versions)
 
         consensus_maf = RUN_CONSENSUS.out.maf  // 1 consensus_maf from all callers
         // Separate DNA from RNA
@@ -146,6 +151,8 @@ workflow VCF_CONSENSUS {
 
             mafs_dna_crossed_with_rna_rescue.mix(mafs_rna_crossed_with_dna_rescue).dump(tag:"mafs_to_rescue")
             RUN_CONSENSUS_RESCUE ( mafs_dna_crossed_with_rna_rescue.mix(mafs_rna_crossed_with_dna_rescue) )
+            CONSENSUS_PLOT_RESCUE ( RUN_CONSENSUS_RESCUE.out.summary )
+            versions = versions.mix(CONSENSUS_PLOT_RESCUE.out.versions)
 
             maf_from_rescue = RUN_CONSENSUS_RESCUE.out.maf.branch{
                                 dna: it[0].status <= 1
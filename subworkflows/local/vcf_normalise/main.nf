@@ -1,11 +1,10 @@
 //
-// Normalise VCFs with VT
+// Normalise VCFs (decompose and normalise in one pass)
 //
 // For all modules here:
 // A when clause condition is defined in the conf/modules.config to determine if the module should be run
-// VT steps
-include { VT_DECOMPOSE                        } from '../../../modules/local/vt/decompose/main'
-include { VT_NORMALISE                        } from '../../../modules/local/vt/normalise/main'
+// Decompose multiallelics and normalise
+include { NORMALISE_VCF                       } from '../../../modules/local/normalise_vcf/main'
 // Create samplesheet to restart from different steps
 include { CHANNEL_VARIANT_CALLING_CREATE_CSV  } from '../channel_variant_calling_create_csv/main'
 
@@ -14,6 +13,7 @@ workflow VCF_NORMALISE {
     take:
     vcf_to_normalise
     fasta
+    fasta_fai
     input_sample
     realignment
 
@@ -28,19 +28,13 @@ workflow VCF_NORMALISE {
                         ((params.tools && params.tools.split(",").contains("consensus")))) ||
                         realignment) {
 
-        vcf_decomposed  = Channel.empty()
-        // Separate variants
-        VT_DECOMPOSE(vcf_to_normalise)
+        // Separate and normalise variants
+        NORMALISE_VCF(vcf_to_normalise,
+                    fasta,
+                    fasta_fai)
 
-        vcf_decomposed = vcf_decomposed.mix(VT_DECOMPOSE.out.vcf)
-        version = version.mix(VT_DECOMPOSE.out.versions.first())
-
-        // Normalise variants
-        VT_NORMALISE(vcf_decomposed,
-                    fasta)
-
-        vcf_to_consensus = VT_NORMALISE.out.vcf
-        version = version.mix(VT_NORMALISE.out.versions.first())
+        vcf_to_consensus = NORMALISE_VCF.out.vcf
+        version = version.mix(NORMALISE_VCF.out.versions.first())
 
         CHANNEL_VARIANT_CALLING_CREATE_CSV(vcf_to_consensus, "normalised")
 
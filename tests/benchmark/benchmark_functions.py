@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+"""
+Script: Benchmarks of single functions of the bin/ scripts over a data set of simulate_data.py. Each benchmark is run
+by run_benchmark.py in its own process (so its peak RSS is its own) and writes the metrics of its stages with
+--metrics-json, as the filtering scripts do.
+"""
+import argparse
+import json
+import os
+import sys
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(REPO_DIR, "bin"))
+import stage_metrics  # noqa: E402
+
+METRICS = stage_metrics.Metrics()
+
+
+def argparser():
+    parser = argparse.ArgumentParser(description="")
+    parser.add_argument("benchmark", help="Benchmark to run", choices=["blacklist", "liftover"])
+    parser.add_argument("-d", "--data", help="Directory written by simulate_data.py", required=True)
+    parser.add_argument("--regions", help="Blacklist regions (blacklist)", type=int, default=10000)
+    parser.add_argument("--seed", help="Random seed", type=int, default=1)
+    parser.add_argument("--metrics-json", help="Metrics of the stages (MultiQC custom content)", required=True)
+    return parser.parse_args()
+
+
+def read_fai(fai_file):
+    with open(fai_file) as fai:
+        return {line.split("\t")[0]: int(line.split("\t")[1]) for line in fai}
+
+
+def benchmark_blacklist(files, regions, seed):
+    """
+    Index of a blacklist of random regions (up to 500bp, with a reason) and annotation of the MAF with it
+    """
+    import pandas as pd
+    import filter_mutations
+
+    rng = np.random.default_rng(seed)
+    contigs = read_fai(f"{files['ref']}.fai")
+    names = np.array(list(contigs), dtype=object)
+    chroms = names[rng.integers(0, len(names), regions)]
+    lengths = np.array([contigs[chrom] for chrom in chroms])
+    starts = (rng.random(regions) * (lengths - 500)).astype(np.int64)
+    bed = pd.DataFrame(
+        {
+            "chrom": chroms,
+            "start": starts,
+            "end": starts + rng.integers(1, 500, regions),
+            "reason": np.array(["low_mappability", "segdup", "centromere"], dtype=object)[rng.integers(0, 3, regions)],
+        }
+    )
+    bed_file = os.path.join(os.path.dirname(files["maf"]), f"blacklist_{regions}.bed")
+    bed.to_csv(bed_file, sep="\t", index=False, header=False)
+    maf = METRICS("read_maf", filter_mutations.read_maf, files["maf"])
+    bed = METRICS("read_blacklist_bed", filter_mutations.read_blacklist_bed, bed_file)
+    with METRICS.stage("index_blacklist", rows=len(bed)):
+        index = filter_mutations.index_blacklist(bed)
+    maf = METRICS("remove_muts_in_range", filter_mutations.remove_muts_in_range, maf, index)
+    print(f"- {regions} regions: {maf['blacklist'].sum()} of {len(maf)} variants blacklisted")
+
+
+def benchmark_liftover(files):
+    """
+    Reading of the simulated chain and liftover of the positions of the MAF with it, then the same positions lifted
+    with the per-row ChainFile lookup that liftover_positions replaced (skipped without the liftover package)
+    """
+    import filter_rna_mutations
+    import maf_io
+
+    maf = METRICS("read_maf", maf_io.read_maf, files["maf"], columns=["Chromosome", "Start_Position"])
+    chain = METRICS("read_chain", filter_rna_mutations.read_chain, files["chain"])
+    with METRICS.stage("liftover_positions", rows=len(maf)):
+        chromosomes, _, _ = filter_rna_mutations.liftover_positions(chain, maf["Chromosome"], maf["Start_Position"])
+    print(f"- {np.count_nonzero(chromosomes != None)} of {len(maf)} positions lifted")  # noqa: E711
+    try:
+        from liftover import ChainFile
+    except ImportError:
+        print("[WGN] The liftover package is not installed, skipping the per-row ChainFile liftover")
+        return
+    converter = METRICS("read_chainfile", ChainFile, files["chain"])
+    with METRICS.stage("chainfile_per_row", rows=len(maf)):
+        # as the old add_coords2_with_liftover
+        hits = maf.apply(lambda row: converter[row["Chromosome"]][row["Start_Position"]], axis=1)
+    print(f"- {np.count_nonzero(hits.map(len))} of {len(maf)} positions lifted by ChainFile")
+
+
+def main():
+    args = argparser()
+    with open(os.path.join(args.data, "files.json")) as files:
+        # all the files are in the data directory, paths are relative to where it was simulated
+        files = json.load(files)
+    files = {name: os.path.join(args.data, os.path.basename(path)) for name, path in files.items() if name != "calls"}
+    if args.benchmark == "blacklist":
+        benchmark_blacklist(files, args.regions, args.seed)
+    elif args.benchmark == "liftover":
+        benchmark_liftover(files)
+    name = f"{args.benchmark}_{args.regions}" if args.benchmark == "blacklist" else args.benchmark
+    stage_metrics.write_json({name: METRICS.stages}, args.metrics_json, "benchmark_functions", "Benchmark")
+
+
+if __name__ == "__main__":
+    main()
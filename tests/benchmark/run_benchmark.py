@@ -0,0 +1,306 @@
+#!/usr/bin/env python
+"""
+Script: Benchmark of the bin/ filtering scripts over synthetic data sets (see simulate_data.py) of increasing size.
+Each stage runs as its own process and its wall time, CPU time and peak RSS (from the rusage of the process) are
+written to a JSON file. With --baseline (the JSON of a previous run, e.g. the last release) stages slower than the
+baseline by more than --tolerance are reported as regressions and the script exits with an error. The stage metrics
+of the filtering scripts (--metrics-json) are added to their results. Single functions are benchmarked in the same way
+with benchmark_functions.py, once per value of their parameter (e.g. number of blacklist regions), and
+plan_intervals.py plans the scatter chunks of GRCh38-shaped interval sets (see simulate_intervals.py) with --compare,
+its plan (makespan of the chunks and of the previous awk chunker) is added to its results. The stages of the tools
+replaced by a script (run_consensus.R, vt decompose and normalize) are skipped when the tool is not installed.
+The data is simulated in another process and pandas is not imported here: the peak RSS of a process includes the one
+of its parent when it was forked.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(os.path.dirname(BENCHMARK_DIR))
+STAGES = [
+    "maf2bed",
+    "filter_mutations",
+    "filter_mutations_chunked",
+    "filter_mutations_sidecar",
+    "filter_rna_mutations",
+    "run_consensus_py",
+    "run_consensus_R",
+    "blacklist",
+    "liftover",
+    "plan_intervals",
+    "normalise_vcf",
+    "normalise_vt",
+]
+# stages run once per value of a parameter: {stage: parameter}
+STAGE_PARAMETERS = {"blacklist": "regions", "filter_mutations_sidecar": "input", "plan_intervals": "intervals"}
+# values of a parameter that are run once before being measured: {stage: [values]}
+STAGE_WARMUP = {"filter_mutations_sidecar": ["parquet"]}  # writes the Parquet sidecar that the measured runs read
+# stages of the tools replaced by the bin/ scripts, skipped when the tool is not installed: {stage: tool}
+STAGE_TOOLS = {"run_consensus_R": "Rscript", "normalise_vt": "vt"}
+
+
+def argparser():
+    parser = argparse.ArgumentParser(description="")
+    parser.add_argument(
+        "--sizes", help="Rows of the simulated MAFs", nargs="+", type=int, default=[1000, 10000, 100000, 1000000]
+    )
+    parser.add_argument("--stages", help="Stages to run", nargs="+", choices=STAGES, default=STAGES)
+    parser.add_argument("--repeats", help="Runs of each stage (the fastest is kept)", type=int, default=1)
+    parser.add_argument("-o", "--output", help="JSON output", default="benchmark.json")
+    parser.add_argument("--workdir", help="Directory for the data and outputs of each size", default="benchmark_work")
+    parser.add_argument("--bin", help="Directory with the scripts to benchmark", default=os.path.join(REPO_DIR, "bin"))
+    parser.add_argument("--chunksize", help="--chunksize of filter_mutations_chunked", type=int, default=100000)
+    parser.add_argument(
+        "--regions",
+        help="Regions of the blacklists of the blacklist stage",
+        nargs="+",
+        type=int,
+        default=[10000, 100000, 1000000],
+    )
+    parser.add_argument("--jobs", help="--jobs of plan_intervals (gatk_interval_scatter_count)", type=int, default=25)
+    parser.add_argument("--seed", help="Random seed of the data", type=int, default=1)
+    parser.add_argument("--baseline", help="JSON of a previous run to compare with")
+    parser.add_argument("--tolerance", help="Slowdown allowed over the baseline (0.2 is 20%%)", type=float, default=0.2)
+    parser.add_argument("--keep", help="Keep the simulated data and outputs", action="store_true")
+    return parser.parse_args()
+
+
+def stage_commands(args, files, outdir):
+    """
+    Command of each stage: {stage: [arguments]}, or {stage: {value: [arguments]}} for the stages in STAGE_PARAMETERS
+    """
+    python = [sys.executable]
+
+    def script(name):
+        return os.path.join(args.bin, name)
+
+    def function(benchmark, label, *options):
+        benchmark_script = os.path.join(BENCHMARK_DIR, "benchmark_functions.py")
+        metrics = ["--metrics-json", metrics_file(outdir, label)]
+        return python + [benchmark_script, benchmark, "-d", outdir, *options] + metrics
+
+    filtered = os.path.join(outdir, "filtered.maf")
+    consensus_inputs = [f"--input={path}" for path in files["calls"].values()]
+    consensus_inputs += [f"--caller={caller}" for caller in files["calls"]]
+    filter_args = ["--ref", files["ref"], "--blacklist", files["blacklist"], "--whitelist", files["whitelist"]]
+    decomposed = os.path.join(outdir, "vt.dec.vcf")
+    vt_normalize = f"vt normalize -n -r {files['ref']} {decomposed} -o {os.path.join(outdir, 'vt.norm.vcf')}"
+    return {
+        "maf2bed": python
+        + [script("maf2bed.py"), "--mafin", files["maf"], "--bedout", os.path.join(outdir, "candidates.bed")]
+        + ["--fai", f"{files['ref']}.fai", "--padding", "150", "--merge_distance", "150"],
+        "filter_mutations": python
+        + [script("filter_mutations.py"), "-i", files["maf"], "-o", filtered]
+        + filter_args
+        + ["--metrics-json", metrics_file(outdir, "filter_mutations")],
+        "filter_mutations_chunked": python
+        + [script("filter_mutations.py"), "-i", files["maf"], "-o", os.path.join(outdir, "filtered_chunked.maf")]
+        + filter_args
+        + ["--chunksize", str(args.chunksize), "--metrics-json", metrics_file(outdir, "filter_mutations_chunked")],
+        "filter_mutations_sidecar": {
+            source: python
+            + [script("filter_mutations.py"), "-i", files["maf"], "-o", os.path.join(outdir, f"filtered_{source}.maf")]
+            + filter_args
+            + (["--sidecar"] if source == "parquet" else [])
+            + ["--metrics-json", metrics_file(outdir, f"filter_mutations_sidecar_{source}")]
+            for source in ["text", "parquet"]
+        },
+        "filter_rna_mutations": python
+        + [script("filter_rna_mutations.py"), "--maf", filtered, "--rnaedits", files["rnaedits"]]
+        + ["--output", os.path.join(outdir, "filtered_rna.maf")]
+        + ["--metrics-json", metrics_file(outdir, "filter_rna_mutations")],
+        "run_consensus_py": python
+        + [script("run_consensus.py")]
+        + consensus_inputs
+        + [f"--out_prefix={os.path.join(outdir, 'consensus_py')}"],
+        "run_consensus_R": ["Rscript", script("run_consensus.R")]
+        + consensus_inputs
+        + [f"--out_prefix={os.path.join(outdir, 'consensus_R')}", "--no-plot"],
+        "blacklist": {
+            regions: function("blacklist", f"blacklist_{regions}", "--regions", str(regions), "--seed", str(args.seed))
+            for regions in args.regions
+        },
+        "liftover": function("liftover", "liftover"),
+        "plan_intervals": {
+            intervals: python
+            + [script("plan_intervals.py"), "-i", path, "-j", str(args.jobs), "--compare"]
+            + ["-o", os.path.join(outdir, f"chunks_{intervals}"), "--plan", plan_file(outdir, intervals)]
+            for intervals, path in files.get("intervals", {}).items()
+        },
+        "normalise_vcf": python
+        + [script("normalise_vcf.py"), "-i", files["vcf"], "-r", files["ref"], "-p", "normalised", "-o", outdir],
+        # VT_DECOMPOSE and VT_NORMALISE, replaced by normalise_vcf.py
+        "normalise_vt": ["bash", "-c", f"vt decompose -s {files['vcf']} -o {decomposed} && {vt_normalize}"],
+    }
+
+
+def metrics_file(outdir, stage):
+    return os.path.join(outdir, f"{stage}_mqc.json")
+
+
+def plan_file(outdir, intervals):
+    return os.path.join(outdir, f"intervals_plan_{intervals}.json")
+
+
+def read_plan(plan_json):
+    """
+    Summary of a plan written by plan_intervals.py: jobs, intervals, runtime, chunks and makespan of both chunkers
+    """
+    with open(plan_json) as plan:
+        plan = json.load(plan)
+    return {key: value for key, value in plan.items() if key != "chunks"} | {"chunks": len(plan["chunks"])}
+
+
+def read_metrics(metrics_json):
+    """
+    Stage metrics written by a script with --metrics-json: {stage: metrics}
+    """
+    with open(metrics_json) as metrics:
+        rows = json.load(metrics)["data"].values()
+    return {row["stage"]: {key: value for key, value in row.items() if key not in ("sample", "stage")} for row in rows}
+
+
+def run_stage(command, log_file, cwd):
+    """
+    Runs a command and returns its exit code, wall time, CPU time (user + system) and peak RSS (MB) from the rusage of
+    the process (child processes it waited for included)
+    """
+    with open(log_file, "w") as log:
+        start = time.perf_counter()
+        process = subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT, cwd=cwd)
+        _, status, usage = os.wait4(process.pid, 0)
+        wall = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    return {
+        "exit_code": process.returncode,
+        "wall_seconds": round(wall, 4),
+        "cpu_seconds": round(usage.ru_utime + usage.ru_stime, 4),
+        "max_rss_mb": round(usage.ru_maxrss / 1024, 1),  # KB on Linux
+    }
+
+
+def benchmark_size(args, rows):
+    """
+    Simulates a data set of rows and runs the stages over it: [result of each stage]
+    """
+    outdir = os.path.join(args.workdir, f"rows_{rows}")
+    print(f"- Simulating {rows} rows")
+    simulate = [os.path.join(BENCHMARK_DIR, "simulate_data.py"), "-n", str(rows), "-o", outdir, "--per_caller"]
+    subprocess.run([sys.executable] + simulate + ["--seed", str(args.seed)], check=True, stdout=subprocess.DEVNULL)
+    with open(os.path.join(outdir, "files.json")) as files:
+        files = json.load(files)
+    outdir = os.path.abspath(outdir)
+    files["calls"] = {caller: os.path.abspath(path) for caller, path in files["calls"].items()}
+    files.update({name: os.path.abspath(path) for name, path in files.items() if name != "calls"})
+    if "plan_intervals" in args.stages:
+        simulate = [os.path.join(BENCHMARK_DIR, "simulate_intervals.py"), "-o", os.path.join(outdir, "intervals")]
+        subprocess.run([sys.executable] + simulate + ["--seed", str(args.seed)], check=True, stdout=subprocess.DEVNULL)
+        with open(os.path.join(outdir, "intervals", "intervals.json")) as intervals:
+            files["intervals"] = json.load(intervals)
+    commands = stage_commands(args, files, outdir)
+    results = []
+    for stage in [stage for stage in STAGES if stage in args.stages]:
+        if stage in STAGE_TOOLS and not shutil.which(STAGE_TOOLS[stage]):
+            print(f"[WGN] {STAGE_TOOLS[stage]} not found, skipping {stage}")
+            continue
+        if stage == "filter_rna_mutations" and "filter_mutations" not in args.stages:
+            print(f"[WGN] {stage} filters the output of filter_mutations, skipping it")
+            continue
+        if stage in STAGE_PARAMETERS:
+            variants = {(STAGE_PARAMETERS[stage], value): command for value, command in commands[stage].items()}
+        else:
+            variants = {None: commands[stage]}
+        for variant, command in variants.items():
+            label = f"{stage}_{variant[1]}" if variant else stage
+            if variant and variant[1] in STAGE_WARMUP.get(stage, []):
+                run_stage(command, os.path.join(outdir, f"{label}.warmup.log"), outdir)
+            runs = [
+                run_stage(command, os.path.join(outdir, f"{label}.{repeat}.log"), outdir)
+                for repeat in range(args.repeats)
+            ]
+            result = min(runs, key=lambda run: (run["exit_code"] != 0, run["wall_seconds"]))
+            result = {"stage": stage, "rows": rows, **dict([variant] if variant else []), **result}
+            result["command"] = " ".join(command)
+            if not result["exit_code"] and os.path.exists(metrics_file(outdir, label)):
+                result["stages"] = read_metrics(metrics_file(outdir, label))
+            if stage == "plan_intervals" and not result["exit_code"]:
+                result["plan"] = read_plan(plan_file(outdir, variant[1]))
+            if result["exit_code"]:
+                print(f"[WGN] {label} failed with exit code {result['exit_code']}, see the logs in {outdir}")
+            print(f"  - {label}: {result['wall_seconds']:.2f}s, {result['max_rss_mb']:.0f}MB")
+            results += [result]
+    if not args.keep:
+        shutil.rmtree(outdir)
+    return results
+
+
+def result_key(result):
+    """
+    Stage, rows and parameter (e.g. regions) of a result
+    """
+    parameter = STAGE_PARAMETERS.get(result["stage"])
+    return result["stage"], result["rows"], result.get(parameter)
+
+
+def compare(results, baseline_file, tolerance):
+    """
+    Adds the baseline wall time and the ratio to each result and flags the regressions, returns the number of them
+    """
+    with open(baseline_file) as baseline:
+        previous = {result_key(result): result for result in json.load(baseline)["results"]}
+    regressions = 0
+    for result in results:
+        before = previous.get(result_key(result))
+        if not before or before["exit_code"] or result["exit_code"]:
+            continue
+        result["baseline_wall_seconds"] = before["wall_seconds"]
+        result["ratio"] = round(result["wall_seconds"] / max(before["wall_seconds"], 1e-6), 3)
+        result["regression"] = result["ratio"] > 1 + tolerance
+        if result["regression"]:
+            regressions += 1
+            print(
+                f"[WGN] {result['stage']} ({result['rows']} rows) took {result['wall_seconds']:.2f}s, "
+                f"{result['ratio']:.2f}x the baseline ({before['wall_seconds']:.2f}s)"
+            )
+    return regressions
+
+
+def git_commit():
+    commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True)
+    return commit.stdout.strip() or None
+
+
+def main():
+    args = argparser()
+    os.makedirs(args.workdir, exist_ok=True)
+    results = []
+    for rows in args.sizes:
+        results += benchmark_size(args, rows)
+    with open(os.path.join(REPO_DIR, "version")) as version:
+        report = {
+            "version": version.read().strip(),
+            "commit": git_commit(),
+            "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "results": results,
+        }
+    regressions = compare(results, args.baseline, args.tolerance) if args.baseline else 0
+    with open(args.output, "w") as out:
+        json.dump(report, out, indent=2)
+    print(f"Done! See '{args.output}'.")
+    failed = [result["stage"] for result in results if result["exit_code"]]
+    if failed or regressions:
+        sys.exit(f"[ERROR] {len(failed)} failed stages and {regressions} regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,382 @@
+#!/usr/bin/env python
+"""
+Script: Synthetic inputs to benchmark the bin/ filtering scripts. Writes a small random reference (with homopolymer
+runs) and its .fai, a consensus MAF with VEP-like columns (variants called by one to three callers, consensus flags
+and multiallelic sites) of the requested number of rows, the blacklist, whitelist and RNA editing BEDs matching it,
+a chain file, a VCF with as many variants (input of normalise_vcf) and optionally the MAF of each caller (inputs of
+run_consensus).
+The MAF is generated in chunks so 1e7 rows do not need to fit in memory. Same seed, same data.
+The paths of the files are listed in files.json in the output directory.
+"""
+import argparse
+import json
+import os
+import numpy as np
+import pandas as pd
+
+BASES = np.array(list("ACGT"))
+BASE_INDEX = {"A": 0, "C": 1, "G": 2, "T": 3}
+CALLERS = ["mutect2", "sage", "strelka"]
+CONSEQUENCES = [
+    ("missense_variant", 0.25),
+    ("synonymous_variant", 0.1),
+    ("stop_gained", 0.02),
+    ("frameshift_variant", 0.02),
+    ("splice_region_variant&intron_variant", 0.03),
+    ("3_prime_UTR_variant", 0.08),
+    ("intron_variant", 0.3),
+    ("intergenic_variant", 0.1),
+    ("non_coding_transcript_exon_variant", 0.05),
+    ("regulatory_region_variant", 0.05),
+]
+BIOTYPES = [
+    ("protein_coding", 0.85),
+    ("lncRNA", 0.07),
+    ("processed_pseudogene", 0.04),
+    ("IG_V_gene", 0.02),
+    ("TR_V_gene", 0.02),
+]
+FILTERS = [("PASS", 0.7), ("weak_evidence", 0.1), ("LowQual", 0.08), ("clustered_events", 0.07), ("germline", 0.05)]
+CHUNKSIZE = 1000000
+
+
+def argparser():
+    parser = argparse.ArgumentParser(description="")
+    parser.add_argument("-n", "--rows", help="Number of rows of the MAF", type=int, default=10000)
+    parser.add_argument("-o", "--outdir", help="Output directory", default="benchmark_data")
+    parser.add_argument("--contigs", help="Number of contigs of the reference", type=int, default=4)
+    parser.add_argument("--contig_length", help="Length of each contig", type=int, default=1000000)
+    parser.add_argument("--per_caller", help="Also write the MAF of each caller", action="store_true")
+    parser.add_argument("--seed", help="Random seed", type=int, default=1)
+    return parser.parse_args()
+
+
+def choice(rng, weighted, size):
+    values, weights = zip(*weighted)
+    return np.array(values, dtype=object)[rng.choice(len(values), size=size, p=np.array(weights) / sum(weights))]
+
+
+def write_reference(rng, outdir, contigs, contig_length, width=60):
+    """
+    Random contigs with homopolymer runs (6-12 bases every ~2kb), returns {contig: sequence}
+    """
+    reference = {}
+    offset = 0
+    with open(os.path.join(outdir, "ref.fa"), "w") as fasta, open(os.path.join(outdir, "ref.fa.fai"), "w") as fai:
+        for contig in [f"chr{number}" for number in range(1, contigs + 1)]:
+            sequence = BASES[rng.integers(0, 4, contig_length)]
+            for start in rng.integers(0, contig_length - 12, contig_length // 2000):
+                sequence[start : start + rng.integers(6, 13)] = sequence[start]
+            sequence = "".join(sequence)
+            reference[contig] = sequence
+            header = f">{contig}\n"
+            fasta.write(header)
+            fasta.writelines(f"{sequence[start : start + width]}\n" for start in range(0, contig_length, width))
+            fai.write(f"{contig}\t{contig_length}\t{offset + len(header)}\t{width}\t{width + 1}\n")
+            offset += len(header) + contig_length + (contig_length + width - 1) // width
+    return reference
+
+
+def simulate_sites(rng, reference, size):
+    """
+    Variant sites in MAF style (SNVs, deletions and insertions) with the reference alleles of the reference
+    """
+    contigs = np.array(list(reference), dtype=object)
+    chrom = contigs[rng.integers(0, len(contigs), size)]
+    length = len(next(iter(reference.values())))
+    start = rng.integers(1, length - 10, size)
+    kind = rng.choice(3, size=size, p=[0.85, 0.08, 0.07])  # SNV, DEL, INS
+    indel_length = rng.integers(1, 4, size)
+    ref_length = np.where(kind == 0, 1, np.where(kind == 1, indel_length, 0))
+    ref = np.array(
+        [reference[contig][pos - 1 : pos - 1 + n] or "-" for contig, pos, n in zip(chrom, start, ref_length)],
+        dtype=object,
+    )
+    ref_base = pd.Series(ref).map(BASE_INDEX).fillna(0).to_numpy(int)
+    snv_alt = BASES[(ref_base + rng.integers(1, 4, size)) % 4]
+    ins_alt = np.array(["".join(BASES[rng.integers(0, 4, n)]) for n in indel_length], dtype=object)
+    alt = np.where(kind == 0, snv_alt, np.where(kind == 1, "-", ins_alt))
+    end = np.where(kind == 1, start + ref_length - 1, np.where(kind == 2, start + 1, start))
+    sites = pd.DataFrame(
+        {
+            "Chromosome": chrom,
+            "Start_Position": start,
+            "End_Position": end,
+            "Variant_Type": np.array(["SNP", "DEL", "INS"], dtype=object)[kind],
+            "Reference_Allele": ref,
+            "Tumor_Seq_Allele2": alt,
+        }
+    )
+    return sites
+
+
+def simulate_chunk(rng, reference, rows):
+    """
+    Rows of the consensus MAF: each site is called by one to three callers (consensus when by two or more) and
+    2% of the sites have a second ALT called by strelka flagged as multiallelic
+    """
+    sites = simulate_sites(rng, reference, int(rows / 1.75) + 1)  # 12/7 callers per site
+    n_sites = len(sites)
+    sites["Hugo_Symbol"] = [f"GENE{gene}" for gene in rng.integers(0, 20000, n_sites)]
+    sites["Consequence"] = choice(rng, CONSEQUENCES, n_sites)
+    sites["BIOTYPE"] = choice(rng, BIOTYPES, n_sites)
+    sites["SYMBOL"] = sites["Hugo_Symbol"]
+    max_af = rng.beta(0.3, 30, n_sites)
+    sites["MAX_AF"] = np.where(rng.random(n_sites) < 0.6, np.nan, max_af)
+    sites["Existing_variation"] = np.where(
+        rng.random(n_sites) < 0.3, pd.Series(rng.integers(1, 10**8, n_sites)).map("rs{}".format), ""
+    )
+    sites["SOMATIC"] = np.where(rng.random(n_sites) < 0.05, "1", "")
+    sites["t_ref_count"] = rng.integers(5, 200, n_sites)
+    sites["t_alt_count"] = rng.integers(0, 60, n_sites)
+    # callers of each site: a random non-empty subset of CALLERS
+    membership = rng.integers(1, 2 ** len(CALLERS), n_sites)
+    callers = [[caller for bit, caller in enumerate(CALLERS) if code >> bit & 1] for code in range(2 ** len(CALLERS))]
+    sites["callers"] = np.array(["|".join(subset) for subset in callers], dtype=object)[membership]
+    sites["isconsensus"] = np.where(np.array([len(subset) for subset in callers])[membership] > 1, "TRUE", "FALSE")
+    sites["FILTER_consensus"] = np.where(rng.random(n_sites) < 0.8, "PASS", "FAIL")
+    multiallelic = sites[(rng.random(n_sites) < 0.02) & (sites["Variant_Type"] == "SNP")].copy()
+    maf = sites.assign(Caller=sites["callers"].str.split("|", regex=False)).explode("Caller", ignore_index=True)
+    maf["FILTER"] = choice(rng, FILTERS, len(maf))
+    multiallelic["Caller"] = "strelka"
+    multiallelic["FILTER"] = "multiallelic"
+    # second ALT: one of the two bases that are neither the REF nor the first ALT
+    ref_base = multiallelic["Reference_Allele"].map(BASE_INDEX).to_numpy(int)
+    shift = (multiallelic["Tumor_Seq_Allele2"].map(BASE_INDEX).to_numpy(int) - ref_base) % 4
+    multiallelic["Tumor_Seq_Allele2"] = BASES[(ref_base + shift % 3 + 1) % 4]
+    maf = pd.concat([maf, multiallelic], ignore_index=True).iloc[:rows]
+    maf = maf.sort_values(["Chromosome", "Start_Position"], kind="stable")
+    maf["filters"] = maf["FILTER"]
+    maf["Tumor_Seq_Allele1"] = maf["Reference_Allele"]
+    maf["t_depth"] = maf["t_ref_count"] + maf["t_alt_count"]
+    maf["Tumor_Sample_Barcode"] = "tumour"
+    maf["Matched_Norm_Sample_Barcode"] = "normal"
+    return maf[
+        [
+            "Hugo_Symbol",
+            "Chromosome",
+            "Start_Position",
+            "End_Position",
+            "Variant_Type",
+            "Reference_Allele",
+            "Tumor_Seq_Allele1",
+            "Tumor_Seq_Allele2",
+            "Tumor_Sample_Barcode",
+            "Matched_Norm_Sample_Barcode",
+            "t_depth",
+            "t_ref_count",
+            "t_alt_count",
+            "Consequence",
+            "BIOTYPE",
+            "SYMBOL",
+            "MAX_AF",
+            "Existing_variation",
+            "SOMATIC",
+            "FILTER",
+            "Caller",
+            "callers",
+            "filters",
+            "FILTER_consensus",
+            "isconsensus",
+        ]
+    ]
+
+
+VCF_HEADER = [
+    "##fileformat=VCFv4.2",
+    '##INFO=<ID=DP,Number=1,Type=Integer,Description="Depth">',
+    '##INFO=<ID=AF,Number=A,Type=Float,Description="Allele frequency">',
+    '##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">',
+    '##FORMAT=<ID=AD,Number=R,Type=Integer,Description="Allelic depths">',
+]
+
+
+def write_vcf(rng, outdir, reference, rows):
+    """
+    VCF of the sites of simulate_sites (input of normalise_vcf): indels with the base before them and placed at
+    random, so those in homopolymer runs or repeats are not left aligned, and 3% of the SNVs with a second ALT
+    (Number=A/R fields with one value per ALT)
+    """
+    length = len(next(iter(reference.values())))
+    with open(os.path.join(outdir, "calls.vcf"), "w") as out:
+        out.writelines(f"{line}\n" for line in VCF_HEADER)
+        out.writelines(f"##contig=<ID={contig},length={length}>\n" for contig in reference)
+        out.write("#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\ttumour\n")
+        for contig, sequence in reference.items():
+            sites = simulate_sites(rng, {contig: sequence}, rows // len(reference) + 1)
+            sites = sites[(sites["Variant_Type"] != "DEL") | (sites["Start_Position"] > 1)]
+            kind = sites["Variant_Type"].to_numpy()
+            pos = np.where(kind == "DEL", sites["Start_Position"] - 1, sites["Start_Position"])
+            anchor = np.array([sequence[position - 1] for position in pos], dtype=object)
+            ref = np.where(kind == "SNP", sites["Reference_Allele"], anchor)
+            ref = np.where(kind == "DEL", anchor + sites["Reference_Allele"], ref)
+            alt = np.where(kind == "INS", anchor + sites["Tumor_Seq_Allele2"], sites["Tumor_Seq_Allele2"])
+            alt = np.where(kind == "DEL", anchor, alt)
+            ref_count, alt_count = rng.integers(5, 200, len(sites)), rng.integers(1, 60, len(sites))
+            depth = ref_count + alt_count
+            record = pd.DataFrame({"pos": pos, "ref": ref, "alt": alt})
+            record["info"] = [f"DP={dp};AF={count / dp:.3f}" for dp, count in zip(depth, alt_count)]
+            record["sample"] = [f"0/1:{ref_depth},{count}" for ref_depth, count in zip(ref_count, alt_count)]
+            multiallelic = (kind == "SNP") & (rng.random(len(sites)) < 0.03)
+            # second ALT: one of the two bases that are neither the REF nor the first ALT
+            ref_base = pd.Series(ref[multiallelic]).map(BASE_INDEX).to_numpy(int)
+            shift = (pd.Series(alt[multiallelic]).map(BASE_INDEX).to_numpy(int) - ref_base) % 4
+            second = BASES[(ref_base + shift % 3 + 1) % 4]
+            second_count = rng.integers(1, 30, multiallelic.sum())
+            record.loc[multiallelic, "alt"] = record.loc[multiallelic, "alt"] + "," + second
+            record.loc[multiallelic, "info"] = [
+                f"DP={dp + count};AF={first / (dp + count):.3f},{count / (dp + count):.3f}"
+                for dp, first, count in zip(depth[multiallelic], alt_count[multiallelic], second_count)
+            ]
+            record.loc[multiallelic, "sample"] = [
+                f"1/2:{ref_depth},{first},{count}"
+                for ref_depth, first, count in zip(ref_count[multiallelic], alt_count[multiallelic], second_count)
+            ]
+            record = record.sort_values("pos", kind="stable")
+            out.writelines(
+                f"{contig}\t{position}\t.\t{ref_allele}\t{alt_allele}\t50\tPASS\t{info}\tGT:AD\t{sample}\n"
+                for position, ref_allele, alt_allele, info, sample in record.itertuples(index=False)
+            )
+
+
+def write_beds(rng, outdir, reference, whitelisted, rnaedits, regions=200):
+    """
+    Blacklist (random regions with a reason), whitelist (CHROM POS REF ALT) and RNA editing sites (CHROM START END
+    REF ALT), the last two with sites of the MAF plus random A>G sites
+    """
+    contigs = np.array(list(reference), dtype=object)
+    length = len(next(iter(reference.values())))
+    starts = rng.integers(0, length - 5000, regions)
+    blacklist = pd.DataFrame(
+        {
+            "chrom": contigs[rng.integers(0, len(contigs), regions)],
+            "start": starts,
+            "end": starts + rng.integers(50, 2000, regions),
+            "reason": choice(rng, [("low_mappability", 0.6), ("segdup", 0.3), ("centromere", 0.1)], regions),
+        }
+    )
+    blacklist.sort_values(["chrom", "start"]).to_csv(
+        os.path.join(outdir, "blacklist.bed"), sep="\t", index=False, header=False
+    )
+    whitelisted.to_csv(os.path.join(outdir, "whitelist.bed"), sep="\t", index=False, header=False)
+    random_sites = simulate_sites(rng, reference, len(rnaedits) + 100)
+    random_sites = random_sites[random_sites["Reference_Allele"] == "A"].assign(Tumor_Seq_Allele2="G")
+    rnaedits = pd.concat([rnaedits, random_sites[rnaedits.columns]])
+    rnaedits.insert(2, "End_Position", rnaedits["Start_Position"])
+    rnaedits.to_csv(os.path.join(outdir, "rnaedits.bed"), sep="\t", index=False, header=False)
+
+
+def chain_blocks(rng, start, end):
+    """
+    Alignment blocks of a chain over [start, end) of the source contig: [(size, source gap, target gap)], the last
+    one is just (size,). Returns the blocks and the span of the chain in the target contig.
+    """
+    blocks = []
+    position, span = start, 0
+    while position < end:
+        size = int(min(rng.integers(50, 5000), end - position))
+        position += size
+        span += size
+        if position == end:
+            blocks += [(size,)]
+            break
+        # gaps in either assembly (not both empty), leaving at least one base for the next block
+        source_gap = int(rng.integers(0, min(200, end - position)))
+        target_gap = int(rng.integers(0 if source_gap else 1, 200))
+        blocks += [(size, source_gap, target_gap)]
+        position += source_gap
+        span += target_gap
+    return blocks, span
+
+
+def write_chain(rng, outdir, reference, chains=4, overlapping=2):
+    """
+    UCSC chain file from the reference to a second assembly (contigs without the chr prefix, 10% longer). Each contig
+    is lifted by chains over consecutive segments, on either strand, with gaps in both assemblies, plus a few chains
+    over parts of the same segments to other contigs (_alt, the first chain in the file takes precedence).
+    """
+    chain_id = 0
+    with open(os.path.join(outdir, "chain.txt"), "w") as out:
+        for contig, sequence in reference.items():
+            length = len(sequence)
+            target_size = length + length // 10
+            edges = np.sort(rng.choice(np.arange(1000, length - 1000), chains - 1, replace=False))
+            segments = list(zip([0, *edges], [*edges, length]))
+            for index in rng.choice(len(segments), overlapping, replace=False):
+                start, end = segments[index]
+                segments += [(start + (end - start) // 4, end - (end - start) // 4)]
+            for number, (start, end) in enumerate(segments):
+                blocks, span = chain_blocks(rng, int(start), int(end))
+                target = contig[3:] if number < chains else f"{contig[3:]}_alt"
+                target_start = int(rng.integers(0, target_size - span))
+                strand = "+" if rng.random() < 0.5 else "-"
+                chain_id += 1
+                out.write(
+                    f"chain 1000 {contig} {length} + {start} {end} "
+                    f"{target} {target_size} {strand} {target_start} {target_start + span} {chain_id}\n"
+                )
+                out.writelines(" ".join(map(str, block)) + "\n" for block in blocks)
+                out.write("\n")
+
+
+def simulate(rows, outdir, contigs=4, contig_length=1000000, per_caller=False, seed=1):
+    """
+    Writes the synthetic data set to outdir, returns the paths of the files
+    """
+    os.makedirs(outdir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    reference = write_reference(rng, outdir, contigs, contig_length)
+    files = {
+        "ref": os.path.join(outdir, "ref.fa"),
+        "maf": os.path.join(outdir, "sample.maf"),
+        "blacklist": os.path.join(outdir, "blacklist.bed"),
+        "whitelist": os.path.join(outdir, "whitelist.bed"),
+        "rnaedits": os.path.join(outdir, "rnaedits.bed"),
+        "chain": os.path.join(outdir, "chain.txt"),
+        "vcf": os.path.join(outdir, "calls.vcf"),
+    }
+    if per_caller:
+        files["calls"] = {caller: os.path.join(outdir, f"calls_{caller}.maf") for caller in CALLERS}
+    site_columns = ["Chromosome", "Start_Position", "Reference_Allele", "Tumor_Seq_Allele2"]
+    whitelisted, rnaedits = [], []
+    written = 0
+    while written < rows:
+        maf = simulate_chunk(rng, reference, min(CHUNKSIZE, rows - written))
+        first = written == 0
+        tables = [(files["maf"], maf)]
+        if per_caller:
+            calls = maf.drop(columns=["callers", "filters", "FILTER_consensus", "isconsensus"])
+            tables += [(files["calls"][caller], calls[calls["Caller"] == caller]) for caller in CALLERS]
+        for output, table in tables:
+            with open(output, "w" if first else "a") as out:
+                if first:
+                    out.write("#version 2.4\n")
+                table.to_csv(out, sep="\t", index=False, header=first)
+        whitelisted += [maf.loc[rng.random(len(maf)) < 0.001, site_columns]]
+        snvs = maf[(maf["Variant_Type"] == "SNP") & (rng.random(len(maf)) < 0.01)]
+        rnaedits += [snvs[site_columns]]
+        written += len(maf)
+    write_beds(rng, outdir, reference, pd.concat(whitelisted), pd.concat(rnaedits))
+    # the chain has its own random numbers so the rest of the data set does not depend on it
+    write_chain(np.random.default_rng(seed + 1), outdir, reference)
+    write_vcf(np.random.default_rng(seed + 2), outdir, reference, rows)
+    with open(os.path.join(outdir, "files.json"), "w") as out:
+        json.dump(files, out, indent=2)
+    return files
+
+
+def main():
+    args = argparser()
+    files = simulate(
+        rows=args.rows,
+        outdir=args.outdir,
+        contigs=args.contigs,
+        contig_length=args.contig_length,
+        per_caller=args.per_caller,
+        seed=args.seed,
+    )
+    print(f"- {args.rows} rows simulated. See '{os.path.join(args.outdir, 'files.json')}'.")
+
+
+if __name__ == "__main__":
+    main()
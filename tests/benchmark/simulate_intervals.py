@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+"""
+Script: Synthetic interval sets to benchmark plan_intervals.py, shaped as the GRCh38 ones of igenomes (which need a
+download): the primary contigs of GRCh38 with their lengths, WGS calling regions (each contig split at random gaps
+into regions of heavy-tailed lengths) and exome targets (exons of 50-500bp in gene clusters). The fifth column is the
+runtime of the interval: --interval_overhead plus its length / --nucleotides_per_second times a lognormal depth
+factor. exome_length.bed has the exome without the fifth column. Same seed, same data. The paths of the files are
+listed in intervals.json.
+"""
+import argparse
+import json
+import os
+import numpy as np
+import pandas as pd
+
+# GRCh38 primary assembly
+CONTIGS = {
+    "chr1": 248956422,
+    "chr2": 242193529,
+    "chr3": 198295559,
+    "chr4": 190214555,
+    "chr5": 181538259,
+    "chr6": 170805979,
+    "chr7": 159345973,
+    "chr8": 145138636,
+    "chr9": 138394717,
+    "chr10": 133797422,
+    "chr11": 135086622,
+    "chr12": 133275309,
+    "chr13": 114364328,
+    "chr14": 107043718,
+    "chr15": 101991189,
+    "chr16": 90338345,
+    "chr17": 83257441,
+    "chr18": 80373285,
+    "chr19": 58617616,
+    "chr20": 64444167,
+    "chr21": 46709983,
+    "chr22": 50818468,
+    "chrX": 156040895,
+    "chrY": 57227415,
+}
+
+
+def argparser():
+    parser = argparse.ArgumentParser(description="")
+    parser.add_argument("-o", "--outdir", help="Output directory", default="intervals_data")
+    parser.add_argument("--wgs", help="Number of WGS calling regions", type=int, default=3600)
+    parser.add_argument("--exome", help="Number of exome targets", type=int, default=224000)
+    parser.add_argument(
+        "--nucleotides_per_second", help="Nucleotides per second at the mean depth", type=float, default=200000
+    )
+    parser.add_argument("--interval_overhead", help="Seconds per interval", type=float, default=0.05)
+    parser.add_argument("--seed", help="Random seed", type=int, default=1)
+    return parser.parse_args()
+
+
+def contig_counts(total):
+    """
+    Intervals of each contig, proportional to its length (at least one)
+    """
+    lengths = np.array(list(CONTIGS.values()), dtype=np.float64)
+    return dict(zip(CONTIGS, np.maximum(np.round(total * lengths / lengths.sum()).astype(int), 1)))
+
+
+def wgs_regions(rng, total):
+    """
+    Calling regions: each contig is cut at random points (Dirichlet shares with a small concentration, so a few
+    regions are much longer than the rest) and a gap of 100bp-50kb is left between consecutive regions
+    """
+    regions = []
+    for contig, count in contig_counts(total).items():
+        shares = rng.dirichlet(np.full(count, 0.3))
+        ends = np.cumsum(shares) * CONTIGS[contig]
+        starts = np.concatenate([[0], ends[:-1]])
+        gaps = np.minimum(rng.integers(100, 50000, count), (ends - starts) // 2)
+        regions += [pd.DataFrame({"chrom": contig, "start": starts + gaps, "end": ends})]
+    regions = pd.concat(regions, ignore_index=True)
+    regions[["start", "end"]] = regions[["start", "end"]].astype(np.int64)
+    return regions[regions["end"] > regions["start"]].reset_index(drop=True)
+
+
+def exome_targets(rng, total):
+    """
+    Exons: genes of 1-40 exons placed at random on each contig, exons of 50-500bp separated by introns of 100bp-20kb
+    """
+    targets = []
+    for contig, count in contig_counts(total).items():
+        exons = np.clip(rng.geometric(1 / 10, count), 1, 40)
+        genes = np.flatnonzero(np.cumsum(exons) <= count)
+        exons = exons[genes]
+        gene_starts = np.sort(rng.integers(0, CONTIGS[contig] - 2000000, len(exons)))
+        gene = np.repeat(np.arange(len(exons)), exons)
+        lengths = rng.integers(50, 500, len(gene))
+        introns = rng.integers(100, 20000, len(gene))
+        # offset of each exon in its gene: exons and introns before it
+        steps = np.cumsum(lengths + introns) - (lengths + introns)
+        offsets = steps - np.repeat(steps[np.cumsum(exons) - exons], exons)
+        starts = gene_starts[gene] + offsets
+        targets += [pd.DataFrame({"chrom": contig, "start": starts, "end": starts + lengths})]
+    targets = pd.concat(targets, ignore_index=True).sort_values("start", kind="stable")
+    targets = targets.sort_values("chrom", key=lambda chrom: chrom.map(list(CONTIGS).index), kind="stable")
+    # genes placed close together can overlap, keep the first interval of each overlap
+    reach = targets.groupby("chrom", sort=False)["end"].cummax().groupby(targets["chrom"], sort=False).shift()
+    overlap = targets["start"] < reach
+    return targets[~overlap].reset_index(drop=True)
+
+
+def add_runtime(rng, intervals, nucleotides_per_second, interval_overhead):
+    depth = rng.lognormal(0, 0.5, len(intervals))
+    bases = intervals["end"] - intervals["start"]
+    return intervals.assign(runtime=interval_overhead + bases / nucleotides_per_second * depth)
+
+
+def write_bed(intervals, path, runtime=True):
+    columns = ["chrom", "start", "end"] + (["name", "runtime"] if runtime else [])
+    intervals.assign(name=".").to_csv(path, sep="\t", index=False, header=False, columns=columns, float_format="%.3f")
+    return path
+
+
+def main():
+    args = argparser()
+    os.makedirs(args.outdir, exist_ok=True)
+    rng = np.random.default_rng(args.seed)
+    wgs = add_runtime(rng, wgs_regions(rng, args.wgs), args.nucleotides_per_second, args.interval_overhead)
+    exome = add_runtime(rng, exome_targets(rng, args.exome), args.nucleotides_per_second, args.interval_overhead)
+    files = {
+        "wgs": write_bed(wgs, os.path.join(args.outdir, "wgs.bed")),
+        "exome": write_bed(exome, os.path.join(args.outdir, "exome.bed")),
+        "exome_length": write_bed(exome, os.path.join(args.outdir, "exome_length.bed"), runtime=False),
+    }
+    with open(os.path.join(args.outdir, "intervals.json"), "w") as out:
+        json.dump(files, out, indent=4)
+    print(f"- {len(wgs)} WGS calling regions and {len(exome)} exome targets in {args.outdir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+"""
+Script: Regression test of run_consensus.py (RUN_CONSENSUS) against run_consensus.R. Both scripts find the consensus
+of the MAFs of tests/data/consensus: an SNV called by three callers, two different SNVs at the same position, a
+deletion overlapping another one, an insertion adjacent to another one, a DNP, FILTERs with several ";" values, SNVs
+called once and a caller with no calls. The consensus MAF and the MAF of each caller written by both scripts must
+hold the same meta lines, columns and values (callers, filters, FILTER_consensus and isconsensus included).
+The default --thr is used: run_consensus.R always appends --thr=2 to its arguments, so a --thr given to it is not
+read as a number.
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import pandas as pd
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+CALLERS = ["mutect2", "strelka", "sage", "freebayes"]
+CONSENSUS_COLUMNS = ["callers", "filters", "FILTER_consensus", "isconsensus"]
+
+
+def argparser():
+    parser = argparse.ArgumentParser(description="")
+    parser.add_argument(
+        "-d",
+        "--data",
+        help="Directory with the MAF of each caller",
+        default=os.path.join(REPO_DIR, "tests/data/consensus"),
+    )
+    parser.add_argument("-o", "--outdir", help="Directory for the outputs of both scripts", default=".")
+    parser.add_argument("--callers", help="Callers (MAF <caller>.maf in --data)", nargs="+", default=CALLERS)
+    return parser.parse_args()
+
+
+def run(command, out_prefix, data, callers):
+    command = command + [f"--input={os.path.join(data, caller + '.maf')}" for caller in callers]
+    command += [f"--caller={caller}" for caller in callers] + [f"--out_prefix={out_prefix}"]
+    return subprocess.run(command, capture_output=True, text=True)
+
+
+def read_output(path):
+    """
+    Meta lines (#...) and table of an output, all values as text ("" for missing values). The table is None if the
+    file has no column header.
+    """
+    with open(path) as output:
+        lines = output.read().splitlines()
+    meta = [line for line in lines if line.startswith("#")]
+    if len(lines) == len(meta):
+        return meta, None
+    table = pd.read_csv(path, sep="\t", skiprows=len(meta), dtype=str, keep_default_na=False)
+    return meta, table.replace("NA", "")
+
+
+def compare(r_file, py_file, header):
+    """
+    Differences between the R and Python outputs: meta lines, columns, rows and the values of each column.
+    A caller with no calls gets an empty table; run_consensus.R does not write its column names (it writes an empty
+    header or placeholder names), so only run_consensus.py must write the header of the caller.
+    """
+    errors = []
+    r_meta, r_table = read_output(r_file)
+    py_meta, py_table = read_output(py_file)
+    if r_meta != py_meta:
+        errors += [f"meta lines {r_meta} (R) and {py_meta} (Python)"]
+    if py_table is None:
+        return errors + ["no column header written by run_consensus.py"]
+    if r_table is None or r_table.empty:
+        if not py_table.empty or list(py_table.columns) != header:
+            errors += [f"{len(py_table)} rows and columns {list(py_table.columns)} instead of an empty {header}"]
+        return errors
+    if list(r_table.columns) != list(py_table.columns):
+        return errors + [f"columns {list(r_table.columns)} (R) and {list(py_table.columns)} (Python)"]
+    if len(r_table) != len(py_table):
+        return errors + [f"{len(r_table)} rows (R) and {len(py_table)} rows (Python)"]
+    for column in r_table.columns:
+        differ = r_table[column] != py_table[column]
+        for row in differ[differ].index[:5]:
+            errors += [
+                f"line {row + len(r_meta) + 2} {column}: {r_table.at[row, column]} (R), {py_table.at[row, column]}"
+            ]
+    return errors
+
+
+def main():
+    args = argparser()
+    if not shutil.which("Rscript"):
+        sys.exit("[ERROR] Rscript is needed to run run_consensus.R")
+    os.makedirs(args.outdir, exist_ok=True)
+    prefixes = {"R": os.path.join(args.outdir, "R.consensus"), "py": os.path.join(args.outdir, "py.consensus")}
+    commands = {
+        "R": ["Rscript", os.path.join(REPO_DIR, "bin", "run_consensus.R"), "--no-plot"],
+        "py": [sys.executable, os.path.join(REPO_DIR, "bin", "run_consensus.py")],
+    }
+    for name, command in commands.items():
+        result = run(command, prefixes[name], args.data, args.callers)
+        if result.returncode:
+            sys.exit(f"[ERROR] run_consensus {name} failed:\n{result.stderr}")
+    headers = {}
+    for caller in args.callers:
+        header = pd.read_csv(os.path.join(args.data, f"{caller}.maf"), sep="\t", comment="#", nrows=0).columns
+        headers[caller] = list(header) + [column for column in ["Caller"] + CONSENSUS_COLUMNS if column not in header]
+    # the consensus MAF has the columns of the last caller
+    outputs = {"": headers[args.callers[-1]]}
+    outputs.update({f"_{caller}": headers[caller] for caller in args.callers})
+    unexpected, rows = 0, 0
+    for suffix, header in outputs.items():
+        r_file, py_file = f"{prefixes['R']}{suffix}.maf", f"{prefixes['py']}{suffix}.maf"
+        errors = compare(r_file, py_file, header)
+        for error in errors[:10]:
+            print(f"[ERROR] {os.path.basename(py_file)}: {error}")
+        unexpected += len(errors)
+        table = read_output(py_file)[1]
+        rows += 0 if table is None else len(table)
+    print(f"{len(outputs)} outputs compared ({rows} rows): {unexpected} unexpected differences.")
+    if unexpected:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
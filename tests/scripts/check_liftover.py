@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+"""
+Script: Regression test of liftover_positions (filter_rna_mutations.py) against the per-row ChainFile lookup of the
+liftover package it replaced. Positions of the simulated MAF, random positions and the edges of every alignment block
+of the simulated chain (tests/benchmark/simulate_data.py: chains on both strands, gaps in both assemblies and
+overlapping chains) are lifted both ways:
+- with 1-based positions every position lifted by liftover_positions must be one of the hits of ChainFile, the first
+  chain in the file when several chains contain it, and unlifted positions must have no hit
+- against the old call (0-based, the MAF position taken as is) the only intended difference is on the negative
+  strand, where the old positions were off by two. Positions at the edge of a block are counted apart, the old call
+  looked up the next base.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import numpy as np
+import pandas as pd
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(REPO_DIR, "bin"))
+import filter_rna_mutations  # noqa: E402
+
+try:
+    from liftover import ChainFile
+except ImportError:
+    sys.exit("[ERROR] The liftover package is needed to run the per-row ChainFile liftover (pip install liftover)")
+
+
+def argparser():
+    parser = argparse.ArgumentParser(description="")
+    parser.add_argument(
+        "-d", "--data", help="Directory written by simulate_data.py (simulated if missing)", default="liftover_data"
+    )
+    parser.add_argument("-n", "--rows", help="Rows of the MAF if it is simulated", type=int, default=2000)
+    parser.add_argument("--random", help="Random positions lifted besides the MAF", type=int, default=20000)
+    parser.add_argument("--seed", help="Random seed", type=int, default=1)
+    return parser.parse_args()
+
+
+def simulate(data, rows, seed):
+    if not os.path.exists(os.path.join(data, "chain.txt")):
+        simulate_data = os.path.join(REPO_DIR, "tests", "benchmark", "simulate_data.py")
+        command = [sys.executable, simulate_data, "-n", str(rows), "-o", data, "--seed", str(seed)]
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+
+
+def positions_to_lift(data, chain, random, seed):
+    """
+    Chromosome and 1-based position of the MAF variants, of random positions and of both sides of each block edge
+    """
+    maf = pd.read_csv(os.path.join(data, "sample.maf"), sep="\t", comment="#", usecols=["Chromosome", "Start_Position"])
+    with open(os.path.join(data, "ref.fa.fai")) as fai:
+        contigs = dict(line.split("\t")[:2] for line in fai)
+    rng = np.random.default_rng(seed)
+    names = np.array(list(contigs), dtype=object)[rng.integers(0, len(contigs), random)]
+    lengths = np.array([int(contigs[name]) for name in names])
+    blocks = pd.concat(chain.values())
+    edges = np.stack([blocks["start"], blocks["start"] + 1, blocks["end"], blocks["end"] + 1], axis=1)
+    chromosomes = np.concatenate([maf["Chromosome"].to_numpy(dtype=object), names, np.repeat(blocks["chrom"], 4)])
+    positions = np.concatenate(
+        [maf["Start_Position"], (rng.random(random) * lengths).astype(np.int64) + 1, edges.ravel()]
+    )
+    return chromosomes, positions
+
+
+def per_row(converter, chromosomes, positions):
+    """
+    Hits of the ChainFile of each position, one lookup per row as the old add_coords2_with_liftover did
+    """
+    return [[tuple(hit) for hit in converter[chrom][int(position)]] for chrom, position in zip(chromosomes, positions)]
+
+
+def check_hits(lifted, hits):
+    """
+    Rows where the position lifted by liftover_positions is not a hit of ChainFile (one_based=True), is not the first
+    chain in the file among several (overlapping chains lift to _alt contigs and come later in the simulated chain) or
+    was not lifted although there are hits
+    """
+    unexpected = []
+    for row, (new, row_hits) in enumerate(zip(lifted, hits)):
+        if new is None:
+            wrong = bool(row_hits)
+        else:
+            first_chain = [hit for hit in row_hits if not hit[0].endswith("_alt")] or row_hits
+            wrong = new not in row_hits or new not in first_chain
+        if wrong:
+            unexpected += [row]
+    return unexpected
+
+
+def check_minus_strand(lifted, next_lifted, old_hits):
+    """
+    Compares with the old 0-based call, which looked up the base after each position. Returns the rows in the middle of
+    a block (the next base lifts next to it) that moved by two on the negative strand, the rows at block edges and the
+    unexpected rows (any other difference).
+    """
+    moved, edges, unexpected = [], [], []
+    for row, (new, after, old) in enumerate(zip(lifted, next_lifted, old_hits)):
+        inside = new is not None and after is not None and new[::2] == after[::2] and abs(new[1] - after[1]) == 1
+        if not inside:
+            edges += [row]
+            continue
+        old = [hit for hit in old if hit[0] == new[0] and hit[2] == new[2]]
+        shift = 2 if new[2] == "-" else 0
+        if len(old) == 1 and new[1] - old[0][1] == shift:
+            moved += [row] if shift else []
+        else:
+            unexpected += [row]
+    return moved, edges, unexpected
+
+
+def as_tuples(chromosomes, positions, strands):
+    return [
+        (chrom, int(position), strand) if chrom is not None else None
+        for chrom, position, strand in zip(chromosomes, positions, strands)
+    ]
+
+
+def main():
+    args = argparser()
+    simulate(args.data, args.rows, args.seed)
+    chain_file = os.path.join(args.data, "chain.txt")
+    chain = filter_rna_mutations.read_chain(chain_file)
+    chromosomes, positions = positions_to_lift(args.data, chain, args.random, args.seed)
+    lifted = as_tuples(*filter_rna_mutations.liftover_positions(chain, chromosomes, positions))
+    next_lifted = as_tuples(*filter_rna_mutations.liftover_positions(chain, chromosomes, positions + 1))
+    hits = per_row(ChainFile(chain_file, one_based=True), chromosomes, positions)
+    old_hits = per_row(ChainFile(chain_file), chromosomes, positions)
+    unexpected = check_hits(lifted, hits)
+    moved, edges, unexpected_old = check_minus_strand(lifted, next_lifted, old_hits)
+    for row in (unexpected + unexpected_old)[:10]:
+        print(
+            f"[ERROR] {chromosomes[row]}:{positions[row]} lifted to {lifted[row]}, ChainFile hits {hits[row]} "
+            f"(old call {old_hits[row]})"
+        )
+    print(
+        f"{len(positions)} positions lifted ({sum(new is not None for new in lifted)} mapped): "
+        f"{len(moved)} moved by two on the negative strand, {len(edges)} at block edges, "
+        f"{len(unexpected) + len(unexpected_old)} unexpected differences."
+    )
+    if unexpected or unexpected_old:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
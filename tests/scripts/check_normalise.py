@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+"""
+Script: Regression test of normalise_vcf.py (NORMALISE_VCF) against vt, the VT_DECOMPOSE and VT_NORMALISE modules it
+replaced: the VCF of tests/data/normalise (an SNV, a deletion in a homopolymer, an insertion in a repeat, a
+multiallelic record with Number=A/R/G fields, an MNP, a REF inconsistent with the reference and an insertion without
+INFO) is run through vt decompose -s and vt normalize -n and through normalise_vcf.py, the records (lines without ##)
+must be the same. The vt version is printed. With --update the vt records are written as the expected output of
+tests/test_bin_normalise.yml, with the vt version in its first line.
+"""
+import argparse
+import gzip
+import os
+import shutil
+import subprocess
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DATA_DIR = os.path.join(REPO_DIR, "tests", "data", "normalise")
+
+
+def argparser():
+    parser = argparse.ArgumentParser(description="")
+    parser.add_argument("-i", "--input", help="VCF to normalise", default=os.path.join(DATA_DIR, "input.vcf"))
+    parser.add_argument("-r", "--ref", help="Reference FASTA (indexed)", default=os.path.join(DATA_DIR, "ref.fa"))
+    parser.add_argument("-o", "--outdir", help="Directory for the outputs of vt and normalise_vcf.py", default=".")
+    parser.add_argument(
+        "--update", help="Write the vt records to this expected output (e.g. tests/data/normalise/expected.vcf)"
+    )
+    return parser.parse_args()
+
+
+def vt_version():
+    """
+    Version of vt as in the versions.yml of the vt modules, e.g. v0.57721
+    """
+    usage = subprocess.run(["vt", "normalize", "-?"], capture_output=True, text=True)
+    first_line = (usage.stdout + usage.stderr).strip().splitlines()[:1]
+    words = first_line[0].split() if first_line else []
+    return words[words.index("normalize") + 1] if "normalize" in words[:-1] else "unknown"
+
+
+def run(command):
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode:
+        sys.exit(f"[ERROR] {' '.join(command)} failed:\n{result.stderr}")
+    return result
+
+
+def records(lines):
+    return [line.rstrip("\n") for line in lines if not line.startswith("##")]
+
+
+def main():
+    args = argparser()
+    if not shutil.which("vt"):
+        sys.exit("[ERROR] vt is needed to decompose and normalise the VCF (e.g. conda install bioconda::vt=0.57721)")
+    os.makedirs(args.outdir, exist_ok=True)
+    version = vt_version()
+    decomposed, normalised = os.path.join(args.outdir, "vt.dec.vcf"), os.path.join(args.outdir, "vt.norm.vcf")
+    run(["vt", "decompose", "-s", args.input, "-o", decomposed])
+    run(["vt", "normalize", "-n", "-r", args.ref, decomposed, "-o", normalised])
+    normalise_vcf = os.path.join(REPO_DIR, "bin", "normalise_vcf.py")
+    run([sys.executable, normalise_vcf, "-i", args.input, "-r", args.ref, "-p", "py.norm", "-o", args.outdir])
+    with open(normalised) as vcf:
+        vt_records = records(vcf)
+    with gzip.open(os.path.join(args.outdir, "py.norm.vcf.gz"), "rt") as vcf:
+        py_records = records(vcf)
+    unexpected = 0
+    for line, (vt_record, py_record) in enumerate(zip(vt_records, py_records), start=1):
+        if vt_record != py_record:
+            print(f"[ERROR] line {line}:\n  vt     : {vt_record}\n  python : {py_record}")
+            unexpected += 1
+    if len(vt_records) != len(py_records):
+        print(f"[ERROR] {len(vt_records)} lines written by vt and {len(py_records)} by normalise_vcf.py")
+        unexpected += abs(len(vt_records) - len(py_records))
+    if args.update:
+        with open(args.update, "w") as expected:
+            expected.write(f"##source=vt decompose -s | vt normalize -n (vt {version})\n")
+            expected.writelines(f"{record}\n" for record in vt_records)
+        print(f"- vt records written to '{args.update}'")
+    print(f"{len(vt_records) - 1} records compared (vt {version}): {unexpected} unexpected differences.")
+    if unexpected:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+"""
+Script: Regression test of filter_mutations.py against the script it replaced. The filter_mutations.py of the baseline
+commit (--baseline_rev) is taken from git and both scripts filter the same synthetic MAF (tests/data/filters: simulated
+variants plus rows at blacklist region borders, overlapping regions, homopolymer borders, contig starts and ends,
+unknown contigs and missing values). The two output files must be byte-identical except for the intended behaviour
+changes, each one checked on its own:
+- the preamble (#version...) of the input is kept, the baseline lost it when shelling out to zgrep
+- a variant in overlapping blacklist regions gets the reasons of all of them, the baseline kept the last one
+- a variant past the end of its contig gets no context, the baseline failed with an IndexError
+"""
+import argparse
+import os
+import subprocess
+import sys
+import pandas as pd
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+BASELINE_REV = "94a114d"
+# the baseline was written for pandas 1.4, between(inclusive=True) was removed in pandas 2 ("both" is the same)
+BASELINE_COMPAT = [("inclusive=True", 'inclusive="both"')]
+
+
+def argparser():
+    parser = argparse.ArgumentParser(description="")
+    parser.add_argument(
+        "-d", "--data", help="Directory with the test data", default=os.path.join(REPO_DIR, "tests/data/filters")
+    )
+    parser.add_argument("-o", "--outdir", help="Directory for the outputs of both scripts", default=".")
+    parser.add_argument("--baseline_rev", help="Commit of the baseline filter_mutations.py", default=BASELINE_REV)
+    return parser.parse_args()
+
+
+def baseline_script(rev, outdir):
+    """
+    Writes the filter_mutations.py of the baseline commit to outdir, returns its path
+    """
+    source = subprocess.run(
+        ["git", "-C", REPO_DIR, "show", f"{rev}:bin/filter_mutations.py"], capture_output=True, text=True
+    )
+    if source.returncode:
+        sys.exit(f"[ERROR] The baseline filter_mutations.py could not be read from git: {source.stderr.strip()}")
+    script = source.stdout
+    for old, new in BASELINE_COMPAT:
+        script = script.replace(old, new)
+    path = os.path.join(outdir, "baseline_filter_mutations.py")
+    with open(path, "w") as out:
+        out.write(script)
+    return path
+
+
+def run(script, maf_file, output, data):
+    command = [sys.executable, script, "-i", maf_file, "-o", output, "--ref", os.path.join(data, "ref.fa")]
+    command += ["--blacklist", os.path.join(data, "blacklist.bed"), "--whitelist", os.path.join(data, "whitelist.bed")]
+    return subprocess.run(command, capture_output=True, text=True)
+
+
+def read_lines(path):
+    with open(path) as lines:
+        return lines.read().splitlines()
+
+
+def covering_reasons(bed, chrom, pos):
+    """
+    Reasons of the regions covering a position, in BED order (regions with no reason give "")
+    """
+    covering = bed[(bed[0] == chrom) & (bed[1] <= pos) & (bed[2] >= pos)]
+    return covering[3].fillna("").tolist()
+
+
+def joined_reasons(bed, chrom, pos):
+    """
+    Reasons of all the regions covering a position, each one once in order of first appearance in the BED
+    """
+    order = pd.unique(bed.loc[bed[0] == chrom, 3].dropna()).tolist()
+    return ",".join(sorted(set(covering_reasons(bed, chrom, pos)) - {""}, key=order.index))
+
+
+def check_preamble(lines, maf_file):
+    """
+    Intended difference: the preamble of the input is written before the column header. Returns the lines without it.
+    """
+    preamble = [line for line in read_lines(maf_file) if line.startswith("#")]
+    if lines[: len(preamble)] != preamble:
+        print(f"[ERROR] The output does not start with the preamble of the input: {preamble}")
+        return None
+    return lines[len(preamble) :]
+
+
+def check_blacklist_reasons(baseline, filtered, columns, bed):
+    """
+    Intended difference: a variant in overlapping regions gets all their reasons (the baseline got the reason of the
+    last region in the BED). Returns whether the difference between the two rows is this one.
+    """
+    baseline, filtered = dict(zip(columns, baseline)), dict(zip(columns, filtered))
+    if {column for column in columns if baseline[column] != filtered[column]} != {"blk_reason"}:
+        return False
+    chrom, pos = baseline["Chromosome"], int(baseline["Start_Position"])
+    reasons = covering_reasons(bed, chrom, pos)
+    return (
+        len(reasons) > 1
+        and baseline["blk_reason"] == reasons[-1]
+        and filtered["blk_reason"] == joined_reasons(bed, chrom, pos)
+    )
+
+
+def check_contig_end(baseline_script_file, script, maf_file, data, outdir):
+    """
+    Intended difference: a variant past the end of its contig gets no CONTEXT and a warning, the baseline failed with
+    an IndexError. Returns whether it holds.
+    """
+    with open(os.path.join(data, "ref.fa.fai")) as fai:
+        contig, length = fai.readline().split("\t")[:2]
+    maf = pd.read_csv(maf_file, sep="\t", comment="#")
+    row = maf[maf["Reference_Allele"] != "-"].head(1)
+    row = row.assign(Chromosome=contig, Start_Position=int(length) + 5, End_Position=int(length) + 5)
+    contig_end_file = os.path.join(outdir, "contig_end.maf")
+    pd.concat([maf.head(10), row]).to_csv(contig_end_file, sep="\t", index=False)
+    baseline = run(baseline_script_file, contig_end_file, os.path.join(outdir, "baseline_contig_end.maf"), data)
+    filtered = run(script, contig_end_file, os.path.join(outdir, "filtered_contig_end.maf"), data)
+    if not baseline.returncode or "IndexError" not in baseline.stderr:
+        print("[ERROR] The baseline was expected to fail with an IndexError past the end of the contig")
+        return False
+    if filtered.returncode:
+        print(f"[ERROR] filter_mutations.py failed past the end of the contig:\n{filtered.stderr}")
+        return False
+    output = pd.read_csv(os.path.join(outdir, "filtered_contig_end.maf"), sep="\t", comment="#")
+    missing = output["Start_Position"] == int(length) + 5
+    warning = f"These coordinates {contig}:{int(length) + 5} are not present in the genome"
+    return missing.sum() == 1 and output.loc[missing, "CONTEXT"].isna().all() and warning in filtered.stdout
+
+
+def main():
+    args = argparser()
+    os.makedirs(args.outdir, exist_ok=True)
+    script = os.path.join(REPO_DIR, "bin", "filter_mutations.py")
+    baseline_script_file = baseline_script(args.baseline_rev, args.outdir)
+    maf_file = os.path.join(args.data, "sample.maf")
+    outputs = {
+        "baseline": os.path.join(args.outdir, "baseline.maf"),
+        "filtered": os.path.join(args.outdir, "filtered.maf"),
+    }
+    for name, path in zip(outputs, [baseline_script_file, script]):
+        result = run(path, maf_file, outputs[name], args.data)
+        if result.returncode:
+            sys.exit(f"[ERROR] {name} run failed:\n{result.stderr}")
+    baseline, filtered = read_lines(outputs["baseline"]), read_lines(outputs["filtered"])
+    filtered = check_preamble(filtered, maf_file)
+    if filtered is None or len(filtered) != len(baseline) or filtered[0] != baseline[0]:
+        sys.exit("[ERROR] The outputs have different preambles, column headers or number of rows")
+    columns = baseline[0].split("\t")
+    bed = pd.read_csv(os.path.join(args.data, "blacklist.bed"), sep="\t", header=None)
+    unexpected, reasons = 0, 0
+    for line, (baseline_line, filtered_line) in enumerate(zip(baseline, filtered)):
+        if baseline_line == filtered_line:
+            continue
+        if check_blacklist_reasons(baseline_line.split("\t"), filtered_line.split("\t"), columns, bed):
+            reasons += 1
+            continue
+        unexpected += 1
+        if unexpected <= 10:
+            print(f"[ERROR] Line {line + 1} differs:\n- {baseline_line}\n+ {filtered_line}")
+    contig_end = check_contig_end(baseline_script_file, script, maf_file, args.data, args.outdir)
+    print(
+        f"{len(baseline) - 1} rows compared: {reasons} with the reasons of overlapping blacklist regions, "
+        f"contig end {'OK' if contig_end else 'FAILED'}, {unexpected} unexpected differences."
+    )
+    if unexpected or not contig_end:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -247,6 +247,7 @@ workflow RNADNAVAR {
                     fasta_fai,
                     input_sample
                     )
+    multiqc_files = multiqc_files.mix(MAF_FILTERING_RNA.out.reports)
     versions = versions.mix(MAF_FILTERING_RNA.out.versions)
 //
 // REPORTING
@@ -264,11 +265,9 @@ workflow RNADNAVAR {
         methods_description = methodsDescriptionText(ch_multiqc_custom_methods_description)
         methods_description = Channel.value(methods_description)
 
-        multiqc_files = Channel.empty()
         multiqc_files = multiqc_files.mix(version_yaml)
         multiqc_files = multiqc_files.mix(workflow_summary.collectFile(name: 'workflow_summary_mqc.yaml'))
         multiqc_files = multiqc_files.mix(methods_description.collectFile(name: 'methods_description_mqc.yaml'))
-        multiqc_files = multiqc_files.mix(multiqc_files.collect().ifEmpty([]))
 
     MULTIQC (
         multiqc_files.collect(),